@@ -0,0 +1,129 @@
+"""Compares the bounded-read capture-date parser with the exifread baseline.
+
+For every file it reports the bytes read, number of read() calls and wall
+time of both readers, then
+the total time of reading all files serially vs. on the metadata thread pool.
+
+    python benchmarks/bench_capture_date.py /photos/card1 [--json results.json]
+
+Note that after the first pass files are in the OS page cache; run against a
+network share or drop caches between runs to see the I/O latency effects.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from photo_tool import core # noqa: E402
+from photo_tool.fastexif import FastPathError, read_capture_metadata # noqa: E402
+
+
+class CountingFile:
+    """Wraps a binary file object and counts the bytes read through it."""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+        self.read_calls = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.bytes_read += len(data)
+        self.read_calls += 1
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def exifread_baseline(filepath):
+    """Runs exifread the way core.read_exif_metadata_exifread does, counting bytes."""
+    import exifread
+
+    with open(filepath, "rb") as f:
+        counting_file = CountingFile(f)
+        try:
+            exifread.process_file(counting_file, stop_tag="DateTimeOriginal", details=False)
+        except Exception:
+            pass
+        return counting_file.bytes_read, counting_file.read_calls
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(core.list_folder_files(path)))
+        else:
+            files.append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="files or folders to read")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    import logging
+    logging.getLogger("exifread").setLevel(logging.ERROR)
+
+    files = collect_files(args.paths)
+    per_file = []
+    print(f"{'file':32} {'fast bytes':>10} {'reads':>6} {'ms':>7}   {'exifread bytes':>14} {'reads':>6} {'ms':>7}")
+    for filepath in files:
+        start = time.perf_counter()
+        try:
+            _, reader = read_capture_metadata(filepath)
+            fast_bytes, fast_reads = reader.bytes_read, reader.read_calls
+        except (FastPathError, OSError):
+            fast_bytes = fast_reads = None
+        fast_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        baseline_bytes, baseline_reads = exifread_baseline(filepath)
+        baseline_seconds = time.perf_counter() - start
+
+        per_file.append({
+            "file": filepath,
+            "fast_path_bytes": fast_bytes,
+            "fast_path_reads": fast_reads,
+            "fast_path_seconds": fast_seconds,
+            "exifread_bytes": baseline_bytes,
+            "exifread_reads": baseline_reads,
+            "exifread_seconds": baseline_seconds,
+        })
+        fast_label = "fallback" if fast_bytes is None else str(fast_bytes)
+        print(f"{os.path.basename(filepath)[:32]:32} {fast_label:>10} {fast_reads or '':>6} {fast_seconds * 1000:7.2f}   "
+              f"{baseline_bytes:14} {baseline_reads:6} {baseline_seconds * 1000:7.2f}")
+
+    start = time.perf_counter()
+    for filepath in files:
+        core.read_exif_metadata(filepath)
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.read_exif_metadata_many(files)
+    pooled_seconds = time.perf_counter() - start
+
+    summary = {
+        "files": len(files),
+        "serial_seconds": serial_seconds,
+        "thread_pool_seconds": pooled_seconds,
+        "thread_pool_workers": core.METADATA_READ_THREADS,
+    }
+    print(f"\n{len(files)} files: serial {serial_seconds:.3f} s, "
+          f"thread pool ({core.METADATA_READ_THREADS} threads) {pooled_seconds:.3f} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"per_file": per_file, "summary": summary}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
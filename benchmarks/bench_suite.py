@@ -0,0 +1,264 @@
+"""Throughput and peak-memory benchmarks on synthetic fixtures.
+
+For every folder size it generates a fixture folder (see fixtures.py, cached
+between runs) and measures:
+
+- discover: scanning the folder
+- sort_name, sort_created: sorting by name / creation date
+- sort_exif_cold, sort_exif_warm: sorting by capture date with an empty and
+  with a filled metadata cache
+- convert, convert_passthrough: converting the DNGs (fresh export folder)
+- convert_profiles: converting the DNGs to the full, web and proof export
+  profiles at once (fresh export folder)
+- convert_incremental: running the conversion again (everything up to date)
+- combined: renaming the DNGs by capture date and converting them in one
+  streaming pass; "first output" is the time until the first JPG was written
+- offload: copying the DNGs to a new folder under names by capture date,
+  verifying the copies and converting them in one streaming pass
+
+Each scenario runs in its own Python process, so its peak resident memory
+(ru_maxrss; not available on Windows) isn't affected by the others. Results
+are written as JSON, and a previous result file can be compared against:
+
+    python benchmarks/bench_suite.py --sizes 100,1000,10000 --json results.json
+    python benchmarks/bench_suite.py --sizes 100,1000,10000 --compare results.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from photo_tool import core, profiles # noqa: E402
+from photo_tool.instrument import JobTrace # noqa: E402
+
+SCENARIOS = ("discover", "sort_name", "sort_created", "sort_exif_cold", "sort_exif_warm",
+             "convert", "convert_passthrough", "convert_profiles", "convert_incremental", "combined", "offload")
+CONVERSION_SCENARIOS = ("convert", "convert_passthrough", "convert_profiles", "convert_incremental", "combined",
+                        "offload")
+DEFAULT_SIZES = "100,1000"
+DEFAULT_CONVERT_MAX_SIZE = 1000
+
+# Bump when fixtures.py changes, so cached fixture folders are regenerated
+FIXTURE_VERSION = 1
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak = max(peak, children)
+    return peak // 1024 if sys.platform == "darwin" else peak # bytes on macOS, KiB elsewhere
+
+
+def _prepare(scenario, folder, work_dir):
+    """Does the untimed setup of a scenario and returns the export base folder it uses."""
+    config_dir = os.path.join(work_dir, "config")
+    export_base = os.path.join(work_dir, "export")
+    if scenario == "sort_exif_cold":
+        shutil.rmtree(config_dir, ignore_errors=True)
+    if scenario in ("convert", "convert_passthrough", "convert_profiles", "combined", "offload"):
+        shutil.rmtree(export_base, ignore_errors=True)
+    os.environ["PHOTO_TOOL_CONFIG_DIR"] = config_dir
+    return export_base
+
+
+def _run(scenario, folder, export_base, workers, trace=None):
+    """Runs one scenario and returns the number of files it handled."""
+    if scenario == "discover":
+        return len(core.list_folder_files(folder))
+    if scenario.startswith("sort_"):
+        files = core.list_folder_files(folder)
+        sort_method = {"sort_name": core.SORT_ALPHABETICALLY, "sort_created": core.SORT_CREATION_DATE}.get(
+            scenario, core.SORT_EXIF_DATE)
+        return len(core.sort_files(files, sort_method))
+    if scenario == "offload":
+        _, _, copy_failed_count, processed_count, skipped_count, failed_count, _ = core.offload_files(
+            core.list_raw_files(folder), export_base, "Bench", core.SORT_EXIF_DATE, workers, trace=trace)
+        if copy_failed_count or failed_count:
+            raise RuntimeError(f"{copy_failed_count} copies and {failed_count} conversions failed")
+        return processed_count + skipped_count
+
+    # Conversions read the RAWs from the fixture folder but export elsewhere,
+    # by linking the DNGs into a folder of their own (fixtures stay untouched)
+    raw_folder = os.path.join(export_base, "raws")
+    if not os.path.isdir(raw_folder):
+        os.makedirs(raw_folder)
+        for raw_file_path in core.list_raw_files(folder):
+            target = os.path.join(raw_folder, os.path.basename(raw_file_path))
+            try:
+                os.link(raw_file_path, target)
+            except OSError:
+                shutil.copy2(raw_file_path, target)
+    output_mode = core.OUTPUT_PASSTHROUGH if scenario == "convert_passthrough" else core.OUTPUT_REENCODE
+    export_profiles = None
+    if scenario == "convert_profiles":
+        export_profiles = [profiles.BUILTIN_PROFILES[name] for name in ("full", "web", "proof")]
+    options = core.ConversionOptions(output_mode=output_mode, profiles=export_profiles)
+    if scenario == "combined":
+        _, rename_failed_count, processed_count, skipped_count, failed_count, _ = core.rename_and_convert(
+            core.list_raw_files(raw_folder), "Bench", core.SORT_EXIF_DATE, workers, options=options,
+            journal_folder=os.path.join(export_base, "journals"), trace=trace)
+        failed_count += rename_failed_count
+    else:
+        processed_count, skipped_count, failed_count = core.convert_raw_files(
+            core.list_raw_files(raw_folder), raw_folder, workers, options=options, trace=trace)
+    if failed_count:
+        raise RuntimeError(f"{failed_count} conversions failed")
+    return processed_count + skipped_count
+
+
+def run_scenario(scenario, folder, work_dir, workers):
+    """Runs a scenario in this process and returns its result dict."""
+    export_base = _prepare(scenario, folder, work_dir)
+    # Untimed first pass, so there is something to skip / a filled cache
+    if scenario == "convert_incremental":
+        _run("convert", folder, export_base, workers)
+    elif scenario == "sort_exif_warm":
+        _run("sort_exif_cold", folder, export_base, workers)
+    tracemalloc.start()
+    start = time.perf_counter()
+    trace = JobTrace(scenario, enabled=False)
+    files = _run(scenario, folder, export_base, workers, trace)
+    seconds = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "files": files,
+        "seconds": seconds,
+        "files_per_second": files / seconds if seconds else None,
+        "first_output_seconds": trace.first_output_seconds,
+        "peak_python_bytes": traced_peak,
+        "peak_rss_kb": _peak_rss_kb(),
+    }
+
+
+def fixture_folder(fixtures_dir, size):
+    """Returns a fixture folder with `size` files, generating it if needed."""
+    sys.path.insert(0, BENCHMARK_DIR)
+    import fixtures
+
+    folder = os.path.join(fixtures_dir, f"fixtures_{size}")
+    marker = os.path.join(fixtures_dir, f"fixtures_{size}.done")
+    expected = f"{FIXTURE_VERSION} {size}"
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read().strip() == expected:
+                return folder
+    shutil.rmtree(folder, ignore_errors=True)
+    print(f"Generating {size} fixtures in {folder}...", flush=True)
+    fixtures.generate_folder(folder, size)
+    with open(marker, "w") as f:
+        f.write(expected)
+    return folder
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare(results, baseline_path):
+    """Prints the change in time and memory against a previous result file."""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':22} {'size':>7} {'time':>9} {'peak RSS':>9}")
+    for result in results:
+        old = baseline.get((result["scenario"], result["size"]))
+        if old is None:
+            continue
+        time_change = (result["seconds"] / old["seconds"] - 1) * 100 if old["seconds"] else 0
+        memory_change = ""
+        if result["peak_rss_kb"] and old.get("peak_rss_kb"):
+            memory_change = f"{(result['peak_rss_kb'] / old['peak_rss_kb'] - 1) * 100:+8.1f}%"
+        print(f"{result['scenario']:22} {result['size']:7} {time_change:+8.1f}% {memory_change:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma-separated folder sizes, e.g. 100,1000,10000,50000 (default: {DEFAULT_SIZES})")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run (default: all)")
+    parser.add_argument("--convert-max-size", type=int, default=DEFAULT_CONVERT_MAX_SIZE,
+                        help=f"skip conversion scenarios for larger folders (default: {DEFAULT_CONVERT_MAX_SIZE})")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="conversion worker processes")
+    parser.add_argument("--fixtures-dir", help="where fixture folders are generated and kept (default: a temporary folder)")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="JSON", help="compare the results with a previous result file")
+    # Internal: run one scenario and print its result as JSON
+    parser.add_argument("--run-scenario", nargs=3, metavar=("SCENARIO", "FOLDER", "WORK_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        scenario, folder, work_dir = args.run_scenario
+        print(json.dumps(run_scenario(scenario, folder, work_dir, args.workers)))
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix="photo_tool_bench_")
+    results = []
+    print(f"{'scenario':22} {'size':>7} {'files':>7} {'seconds':>9} {'files/s':>10} {'peak RSS':>10} {'first output':>13}")
+    for size in sizes:
+        folder = fixture_folder(fixtures_dir, size)
+        work_dir = os.path.join(fixtures_dir, f"work_{size}")
+        for scenario in scenarios:
+            if scenario in CONVERSION_SCENARIOS and size > args.convert_max_size:
+                continue
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--workers", str(args.workers),
+                 "--run-scenario", scenario, folder, work_dir],
+                stdout=subprocess.PIPE, text=True, check=True).stdout
+            result = {"scenario": scenario, "size": size, **json.loads(output.strip().splitlines()[-1])}
+            results.append(result)
+            rss = f"{result['peak_rss_kb'] // 1024} MB" if result["peak_rss_kb"] else "n/a"
+            first_output = f"{result['first_output_seconds']:.3f} s" if result["first_output_seconds"] is not None else ""
+            print(f"{scenario:22} {size:7} {result['files']:7} {result['seconds']:9.3f} "
+                  f"{result['files_per_second'] or 0:10.0f} {rss:>10} {first_output:>13}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "meta": {
+                    "commit": _git_commit(),
+                    "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpu_count": os.cpu_count(),
+                    "workers": args.workers,
+                    "fixture_version": FIXTURE_VERSION,
+                },
+                "results": results,
+            }, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    if not args.fixtures_dir:
+        shutil.rmtree(fixtures_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Synthetic photo fixtures for the benchmarks, generated offline.
+
+- JPEGs with an EXIF DateTimeOriginal and Orientation.
+- Minimal DNGs that LibRaw opens: a tiny 16-bit CFA image in a SubIFD and a
+  JPEG preview in IFD0, with the same EXIF fields as the JPEGs.
+
+Dates, orientations and file modification times come from a seeded random
+generator, so a folder generated twice is identical.
+
+    python benchmarks/fixtures.py /tmp/fixtures --count 1000
+"""
+
+import argparse
+import datetime
+import io
+import os
+import random
+import struct
+import sys
+
+FIXTURE_SEED = 1234
+RAW_WIDTH = 64
+RAW_HEIGHT = 48
+PREVIEW_SIZE = (320, 240)
+ORIENTATIONS = (1, 1, 1, 3, 6, 8) # Mostly upright, like a real card
+DATE_RANGE_START = datetime.datetime(2023, 6, 1, 8, 0, 0)
+
+TAG_NEW_SUBFILE_TYPE = 254
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_MAKE = 271
+TAG_MODEL = 272
+TAG_STRIP_OFFSETS = 273
+TAG_ORIENTATION = 274
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_SUB_IFDS = 330
+TAG_CFA_REPEAT_PATTERN_DIM = 33421
+TAG_CFA_PATTERN = 33422
+TAG_EXIF_IFD = 34665
+TAG_DATETIME_ORIGINAL = 36867
+TAG_DNG_VERSION = 50706
+TAG_DNG_BACKWARD_VERSION = 50707
+TAG_UNIQUE_CAMERA_MODEL = 50708
+
+TYPE_BYTE = 1
+TYPE_ASCII = 2
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+MAKE = b"Canon\0"
+MODEL = b"Canon EOS 5D Mark III\0"
+
+
+class _TiffBuilder:
+    """Lays out little-endian IFDs and their out-of-line data."""
+
+    def __init__(self):
+        self.ifds = [] # Lists of (tag, type, count, value or bytes)
+        self.blobs = []
+
+    def add_ifd(self, entries):
+        self.ifds.append(entries)
+        return len(self.ifds) - 1
+
+    def build(self, trailing_data=b""):
+        """Returns the TIFF bytes; entry values of ('ifd', n) / ('blob', data) are resolved to offsets."""
+        ifd_offsets = []
+        offset = 8
+        for entries in self.ifds:
+            ifd_offsets.append(offset)
+            offset += 2 + len(entries) * 12 + 4
+
+        blob_offsets = {}
+        blob_data = b""
+        for entries in self.ifds:
+            for _, _, _, value in entries:
+                if isinstance(value, tuple) and value[0] == "blob" and id(value) not in blob_offsets:
+                    blob_offsets[id(value)] = offset + len(blob_data)
+                    blob_data += value[1]
+                    if len(blob_data) % 2:
+                        blob_data += b"\0"
+        trailing_offset = offset + len(blob_data)
+
+        out = b"II*\0" + struct.pack("<I", ifd_offsets[0])
+        for entries in self.ifds:
+            out += struct.pack("<H", len(entries))
+            for tag, field_type, count, value in sorted(entries, key=lambda entry: entry[0]):
+                if isinstance(value, tuple):
+                    if value[0] == "ifd":
+                        value = ifd_offsets[value[1]]
+                    elif value[0] == "blob":
+                        value = blob_offsets[id(value)]
+                    elif value[0] == "trailing":
+                        value = trailing_offset + value[1]
+                if field_type == TYPE_SHORT and count == 1:
+                    out += struct.pack("<HHIHH", tag, field_type, count, value, 0)
+                else:
+                    out += struct.pack("<HHII", tag, field_type, count, value)
+            out += struct.pack("<I", 0)
+        return out + blob_data + trailing_data
+
+
+def _ascii(text):
+    data = text.encode("ascii") + b"\0"
+    return ("blob", data), len(data)
+
+
+def _base_preview_jpeg():
+    """A small JPEG preview without metadata, encoded once with Pillow."""
+    from PIL import Image
+
+    image = Image.new("RGB", PREVIEW_SIZE, (180, 120, 60))
+    for x in range(0, PREVIEW_SIZE[0], 16):
+        image.paste((40, 90, 160), (x, 0, x + 8, PREVIEW_SIZE[1]))
+    buffer = io.BytesIO()
+    image.save(buffer, "jpeg", quality=85)
+    return buffer.getvalue()
+
+
+def make_jpeg(preview, date, orientation):
+    """Returns `preview` with an APP1 EXIF segment holding `date` and `orientation`."""
+    builder = _TiffBuilder()
+    date_value, date_count = _ascii(date.strftime("%Y:%m:%d %H:%M:%S"))
+    builder.add_ifd([
+        (TAG_ORIENTATION, TYPE_SHORT, 1, orientation),
+        (TAG_EXIF_IFD, TYPE_LONG, 1, ("ifd", 1)),
+    ])
+    builder.add_ifd([(TAG_DATETIME_ORIGINAL, TYPE_ASCII, date_count, date_value)])
+    payload = b"Exif\0\0" + builder.build()
+    return preview[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + preview[2:]
+
+
+def make_dng(preview, date, orientation):
+    """Returns a minimal DNG with a CFA image and `preview` as its embedded JPEG."""
+    builder = _TiffBuilder()
+    date_value, date_count = _ascii(date.strftime("%Y:%m:%d %H:%M:%S"))
+    raw_data = bytes(RAW_WIDTH * RAW_HEIGHT * 2)
+    make_value = ("blob", MAKE)
+    model_value = ("blob", MODEL)
+    builder.add_ifd([
+        (TAG_NEW_SUBFILE_TYPE, TYPE_LONG, 1, 1), # IFD0 holds the preview
+        (TAG_IMAGE_WIDTH, TYPE_LONG, 1, PREVIEW_SIZE[0]),
+        (TAG_IMAGE_LENGTH, TYPE_LONG, 1, PREVIEW_SIZE[1]),
+        (TAG_BITS_PER_SAMPLE, TYPE_SHORT, 1, 8),
+        (TAG_COMPRESSION, TYPE_SHORT, 1, 7), # JPEG
+        (TAG_PHOTOMETRIC, TYPE_SHORT, 1, 6), # YCbCr
+        (TAG_MAKE, TYPE_ASCII, len(MAKE), make_value),
+        (TAG_MODEL, TYPE_ASCII, len(MODEL), model_value),
+        (TAG_STRIP_OFFSETS, TYPE_LONG, 1, ("trailing", 0)),
+        (TAG_ORIENTATION, TYPE_SHORT, 1, orientation),
+        (TAG_SAMPLES_PER_PIXEL, TYPE_SHORT, 1, 3),
+        (TAG_STRIP_BYTE_COUNTS, TYPE_LONG, 1, len(preview)),
+        (TAG_SUB_IFDS, TYPE_LONG, 1, ("ifd", 1)),
+        (TAG_EXIF_IFD, TYPE_LONG, 1, ("ifd", 2)),
+        (TAG_DNG_VERSION, TYPE_BYTE, 4, struct.unpack("<I", bytes([1, 4, 0, 0]))[0]),
+        (TAG_DNG_BACKWARD_VERSION, TYPE_BYTE, 4, struct.unpack("<I", bytes([1, 1, 0, 0]))[0]),
+        (TAG_UNIQUE_CAMERA_MODEL, TYPE_ASCII, len(MODEL), model_value),
+    ])
+    builder.add_ifd([
+        (TAG_NEW_SUBFILE_TYPE, TYPE_LONG, 1, 0), # The RAW image
+        (TAG_IMAGE_WIDTH, TYPE_LONG, 1, RAW_WIDTH),
+        (TAG_IMAGE_LENGTH, TYPE_LONG, 1, RAW_HEIGHT),
+        (TAG_BITS_PER_SAMPLE, TYPE_SHORT, 1, 16),
+        (TAG_COMPRESSION, TYPE_SHORT, 1, 1),
+        (TAG_PHOTOMETRIC, TYPE_SHORT, 1, 32803), # CFA
+        (TAG_STRIP_OFFSETS, TYPE_LONG, 1, ("trailing", len(preview))),
+        (TAG_SAMPLES_PER_PIXEL, TYPE_SHORT, 1, 1),
+        (TAG_ROWS_PER_STRIP, TYPE_LONG, 1, RAW_HEIGHT),
+        (TAG_STRIP_BYTE_COUNTS, TYPE_LONG, 1, len(raw_data)),
+        (TAG_CFA_REPEAT_PATTERN_DIM, TYPE_SHORT, 2, struct.unpack("<I", struct.pack("<HH", 2, 2))[0]),
+        (TAG_CFA_PATTERN, TYPE_BYTE, 4, struct.unpack("<I", bytes([0, 1, 1, 2]))[0]), # RGGB
+    ])
+    builder.add_ifd([(TAG_DATETIME_ORIGINAL, TYPE_ASCII, date_count, date_value)])
+    return builder.build(preview + raw_data)
+
+
+def generate_folder(folder, count, raw_ratio=0.5, seed=FIXTURE_SEED):
+    """Fills `folder` with `count` fixtures (IMG_00001.DNG, IMG_00002.JPG, ...).
+
+    About `raw_ratio` of them are DNGs. File names are in a shuffled order
+    relative to the capture dates, so the sort methods give different results.
+    Returns the list of created paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    preview = _base_preview_jpeg()
+    capture_offsets = list(range(count))
+    rng.shuffle(capture_offsets)
+    paths = []
+    for i in range(count):
+        date = DATE_RANGE_START + datetime.timedelta(seconds=capture_offsets[i] * 7)
+        orientation = rng.choice(ORIENTATIONS)
+        is_raw = rng.random() < raw_ratio
+        path = os.path.join(folder, f"IMG_{i + 1:05d}.{'DNG' if is_raw else 'JPG'}")
+        data = make_dng(preview, date, orientation) if is_raw else make_jpeg(preview, date, orientation)
+        with open(path, "wb") as f:
+            f.write(data)
+        # Modification times in yet another order, for the creation-date fallback
+        timestamp = (DATE_RANGE_START + datetime.timedelta(seconds=rng.randrange(count * 10))).timestamp()
+        os.utime(path, (timestamp, timestamp))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--raw-ratio", type=float, default=0.5, help="share of DNGs among the files (default: 0.5)")
+    args = parser.parse_args(argv)
+    paths = generate_folder(args.folder, args.count, args.raw_ratio)
+    print(f"Created {len(paths)} files in {args.folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
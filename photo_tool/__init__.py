@@ -0,0 +1,8 @@
+"""Headless core of Photo Tool: renaming, EXIF sorting and RAW to JPG conversion.
+
+The GUI in photo_tool_v1.0.py and the command-line interface (python -m photo_tool)
+are both thin front ends over this package. Nothing in here imports tkinter, and
+rawpy/Pillow/exifread are only imported when the work that needs them runs.
+"""
+
+__version__ = "1.0"
@@ -0,0 +1,348 @@
+"""Command-line interface for running Photo Tool jobs without a GUI.
+
+Usage examples:
+
+    python -m photo_tool rename /photos/card1 --name Wedding --sort exif
+    python -m photo_tool convert /photos/card1 --workers 8
+    python -m photo_tool convert /media/card/DCIM --recursive
+    python -m photo_tool combined /photos/card1 --name Wedding --sort exif
+    python -m photo_tool watch /photos/tethered --name Studio
+    python -m photo_tool offload /media/card/DCIM -r --to /photos/wedding --name Wedding --sort exif
+    python -m photo_tool undo
+    python -m photo_tool resume --roll-back
+
+Only the standard library is imported at startup; rawpy and Pillow are loaded
+by the conversion code when a conversion actually runs.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+
+from photo_tool import __version__, contentindex, core, develop, offload, prefetch, profiles, watch
+from photo_tool.discovery import FileEntry, scan_files
+from photo_tool.instrument import JobTrace, default_trace_folder
+
+SORT_CHOICES = {
+    "name": core.SORT_ALPHABETICALLY,
+    "created": core.SORT_CREATION_DATE,
+    "exif": core.SORT_EXIF_DATE,
+}
+# Commands that work through files and get a performance trace; undo and resume only rename back and forth
+TRACED_COMMANDS = ("rename", "convert", "combined", "watch", "offload")
+
+
+def _collect_files(paths, recursive=False, patterns=None, log=None):
+    """Expands folder arguments to the files inside them.
+
+    Returns the list of files and a {path: FileEntry} dict with their stat data.
+    """
+    file_info = {}
+    for path in paths:
+        if os.path.isdir(path):
+            on_error = (lambda e: log(f"Warning: {e}")) if log else None
+            for entry in scan_files(path, recursive, patterns=patterns, on_error=on_error):
+                file_info[entry.path] = entry
+        elif os.path.isfile(path):
+            file_info[path] = FileEntry.from_path(path)
+        else:
+            raise FileNotFoundError(f"No such file or folder: {path}")
+    return list(file_info), file_info
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive whole number")
+    return number
+
+
+def _non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("must be a whole number of 0 or more")
+    return number
+
+
+def _positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("must be a number greater than 0")
+    return number
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="photo_tool", description="Rename photos and convert RAW files to JPG.")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-q", "--quiet", action="store_true", help="only print errors and the final summary")
+    common.add_argument("-r", "--recursive", action="store_true", help="also process files in subfolders")
+    common.add_argument("--trace", metavar="PATH",
+                        help="write a Chrome trace of the job's stages to PATH, or a JSON summary if PATH ends "
+                             "in .summary.json (default: a new file in the traces folder of the config folder)")
+    common.add_argument("--no-trace", dest="tracing", action="store_false", help="disable stage timing entirely")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_rename_arguments(subparser):
+        subparser.add_argument("paths", nargs="+", help="files or folders to rename")
+        subparser.add_argument("-n", "--name", required=True, help="new base name for the files")
+        subparser.add_argument("-s", "--sort", choices=SORT_CHOICES, default="name",
+                               help="sort order used for numbering (default: name)")
+        subparser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                               help="don't use the persistent EXIF metadata cache")
+        subparser.add_argument("--include", dest="patterns", action="append", metavar="PATTERN",
+                               help="only take files matching this name pattern from folders, e.g. 'IMG_*' "
+                                    "(case-insensitive, can be repeated)")
+
+    def add_conversion_arguments(subparser):
+        subparser.add_argument("-w", "--workers", type=_positive_int, default=os.cpu_count() or 1,
+                               help="number of conversion worker processes (default: number of CPU cores)")
+        subparser.add_argument("--passthrough", action="store_true",
+                               help="write embedded previews as they are instead of re-encoding them")
+        subparser.add_argument("--develop", action="store_true",
+                               help="develop the full RAW data instead of exporting the embedded preview")
+        subparser.add_argument("--half-size", action="store_true", help="develop at half resolution (much faster)")
+        subparser.add_argument("--bps", type=int, choices=develop.OUTPUT_BPS_CHOICES, default=8,
+                               help="developed output bit depth: 8 (JPG) or 16 (TIFF)")
+        subparser.add_argument("--white-balance", choices=develop.WHITE_BALANCE_MODES, default=develop.WHITE_BALANCE_CAMERA)
+        subparser.add_argument("--demosaic", choices=develop.DEMOSAIC_ALGORITHMS, default="AHD")
+        subparser.add_argument("--memory-budget", type=_positive_int, metavar="MB",
+                               help="memory budget for concurrent developments (default: half of RAM)")
+        subparser.add_argument("--prefetch", type=_non_negative_int, default=prefetch.DEFAULT_PREFETCH_FILES, metavar="FILES",
+                               help=f"read this many files ahead of the conversion, 0 to disable "
+                                    f"(default: {prefetch.DEFAULT_PREFETCH_FILES})")
+        subparser.add_argument("--prefetch-mb", type=_non_negative_int, default=prefetch.DEFAULT_PREFETCH_MB, metavar="MB",
+                               help=f"memory cap for read-ahead (default: {prefetch.DEFAULT_PREFETCH_MB})")
+        subparser.add_argument("-p", "--profile", dest="profiles", action="append", metavar="NAME",
+                               help=f"export profile to write, can be repeated to write several outputs per RAW file "
+                                    f"(built in: {', '.join(profiles.BUILTIN_PROFILES)}; more can be defined in "
+                                    f"{profiles.PROFILES_FILENAME} in the config folder; default: full)")
+        subparser.add_argument("--duplicates", choices=contentindex.DUPLICATE_MODES, default=contentindex.DUPLICATES_REPORT,
+                               help="what to do with RAWs whose content was already converted with the same settings, "
+                                    "in any folder: report them and convert anyway (default), skip them, link the "
+                                    "existing outputs, or don't check (off)")
+
+    add_rename_arguments(subparsers.add_parser("rename", parents=[common], help="rename files"))
+
+    convert_parser = subparsers.add_parser("convert", parents=[common], help="convert RAW files in a folder to JPG")
+    convert_parser.add_argument("folder", help="folder containing RAW files")
+    add_conversion_arguments(convert_parser)
+
+    combined_parser = subparsers.add_parser("combined", parents=[common], help="rename files, then convert the RAW files to JPG")
+    add_rename_arguments(combined_parser)
+    add_conversion_arguments(combined_parser)
+
+    watch_parser = subparsers.add_parser("watch", parents=[common],
+                                         help="convert RAW files as they arrive in a folder, until Ctrl+C")
+    watch_parser.add_argument("folder", help="folder to watch")
+    watch_parser.add_argument("-n", "--name", help="rename arriving files to NAME_0001, NAME_0002, ... before converting")
+    watch_parser.add_argument("--existing", action="store_true", help="also process files already in the folder")
+    watch_parser.add_argument("--settle", type=_positive_float, default=watch.DEFAULT_SETTLE_SECONDS, metavar="SECONDS",
+                              help=f"wait until a file has stopped changing for this long "
+                                   f"(default: {watch.DEFAULT_SETTLE_SECONDS:g})")
+    watch_parser.add_argument("--polling", action="store_true",
+                              help="rescan the folder instead of using inotify (needed for network shares)")
+    watch_parser.add_argument("--poll-interval", type=_positive_float, default=watch.DEFAULT_POLL_INTERVAL,
+                              metavar="SECONDS", help=f"rescan interval when polling (default: {watch.DEFAULT_POLL_INTERVAL:g})")
+    watch_parser.add_argument("--stats-interval", type=_positive_float, default=watch.DEFAULT_STATS_INTERVAL,
+                              metavar="SECONDS", help=f"print queue and latency statistics this often "
+                                                      f"(default: {watch.DEFAULT_STATS_INTERVAL:g})")
+    add_conversion_arguments(watch_parser)
+
+    offload_parser = subparsers.add_parser("offload", parents=[common],
+                                           help="copy files from a card under their new names, verify them and "
+                                                "convert the RAW files to JPG")
+    add_rename_arguments(offload_parser)
+    offload_parser.add_argument("--to", dest="destination", required=True, metavar="FOLDER",
+                                help="folder to copy the files to; the JPGs go to its export folder")
+    offload_parser.add_argument("--no-convert", dest="convert", action="store_false", help="only copy the files")
+    offload_parser.add_argument("--no-verify", dest="verify", action="store_false",
+                                help="don't read the copies back to check them against the checksum taken while copying")
+    offload_parser.add_argument("--reads-per-device", type=_positive_int, default=offload.DEFAULT_READS_PER_DEVICE,
+                                metavar="N", help=f"concurrent copies reading from one device "
+                                                  f"(default: {offload.DEFAULT_READS_PER_DEVICE})")
+    offload_parser.add_argument("--writes-per-device", type=_positive_int, default=offload.DEFAULT_WRITES_PER_DEVICE,
+                                metavar="N", help=f"concurrent copies writing to one device "
+                                                  f"(default: {offload.DEFAULT_WRITES_PER_DEVICE})")
+    add_conversion_arguments(offload_parser)
+
+    subparsers.add_parser("undo", parents=[common], help="undo the last rename job")
+    resume_parser = subparsers.add_parser("resume", parents=[common],
+                                          help="finish rename jobs that were interrupted, e.g. by a crash")
+    resume_parser.add_argument("--roll-back", action="store_true",
+                               help="put the files back under their old names instead")
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def log(message, detail=False):
+        if not args.quiet:
+            print(message, flush=True)
+
+    trace = JobTrace(args.command, enabled=args.tracing and args.command in TRACED_COMMANDS)
+    try:
+        return _run_command(args, log, trace)
+    finally:
+        if trace.enabled:
+            _save_trace(args, trace)
+
+
+def _save_trace(args, trace):
+    try:
+        if not args.trace:
+            path = trace.save(default_trace_folder(core.user_config_dir()))
+        elif args.trace.endswith(".summary.json"):
+            path = args.trace
+            trace.write_json(path)
+        else:
+            path = args.trace
+            trace.write_chrome_trace(path)
+    except OSError as e:
+        print(f"Warning: Could not write the performance trace: {e}", file=sys.stderr)
+        return
+    files_per_second, mb_per_second = trace.throughput()
+    if not args.quiet:
+        print(f"Throughput: {files_per_second:.1f} files/s, {mb_per_second:.1f} MB/s. Performance trace: {path}")
+
+
+def _run_command(args, log, trace):
+    try:
+        if args.command in ("convert", "combined", "watch", "offload"):
+            try:
+                export_profiles = _export_profiles(args.profiles)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 2
+            options = core.ConversionOptions(
+                output_mode=core.OUTPUT_PASSTHROUGH if args.passthrough else core.OUTPUT_REENCODE,
+                source=core.SOURCE_DEVELOP if args.develop else core.SOURCE_PREVIEW,
+                half_size=args.half_size,
+                output_bps=args.bps,
+                white_balance=args.white_balance,
+                demosaic=args.demosaic,
+                memory_budget_mb=args.memory_budget,
+                prefetch_files=args.prefetch,
+                prefetch_mb=args.prefetch_mb,
+                profiles=export_profiles,
+                duplicates=args.duplicates,
+            )
+
+        if args.command == "convert":
+            if not os.path.isdir(args.folder):
+                print(f"Error: Not a folder: {args.folder}", file=sys.stderr)
+                return 2
+            log(f"Starting standard RAW to JPG conversion in '{args.folder}'...")
+            # Conversion starts on the first files while the rest are still being discovered
+            raw_files = scan_files(args.folder, args.recursive, extensions=core.SUPPORTED_RAW_FORMATS,
+                                   on_error=lambda e: log(f"Warning: {e}"))
+            processed_count, skipped_count, failed_count = core.convert_raw_files(
+                raw_files, args.folder, args.workers, log, options=options, trace=trace)
+            print(f"RAW to JPG Conversion: {processed_count} processed, {skipped_count} skipped, {failed_count} failed.")
+            return 1 if failed_count else 0
+
+        if args.command == "watch":
+            if not os.path.isdir(args.folder):
+                print(f"Error: Not a folder: {args.folder}", file=sys.stderr)
+                return 2
+            return _watch(args, log, options, trace)
+
+        if args.command == "undo":
+            return _undo_rename(log)
+
+        if args.command == "resume":
+            return _resume_renames(args, log)
+
+        for job in core.interrupted_rename_jobs():
+            log(f"Warning: The rename job from {job.created} was interrupted. Run 'photo_tool resume' to finish it "
+                f"or 'photo_tool resume --roll-back' to undo it.")
+        files, file_info = _collect_files(args.paths, args.recursive, args.patterns, log)
+        sort_method = SORT_CHOICES[args.sort]
+
+        if args.command == "offload":
+            copied_count, already_count, copy_failed_count, processed_count, skipped_count, failed_count, jpg_folder = \
+                core.offload_files(files, args.destination, args.name, sort_method, args.workers, log,
+                                   use_cache=args.use_cache, options=options, file_info=file_info, convert=args.convert,
+                                   verify=args.verify, reads_per_device=args.reads_per_device,
+                                   writes_per_device=args.writes_per_device, trace=trace)
+            print(f"Offload: {copied_count} copied, {already_count} already there, {copy_failed_count} failed.")
+            if jpg_folder is not None:
+                print(f"RAW to JPG Conversion: {processed_count} processed, {skipped_count} skipped, {failed_count} failed.")
+            return 1 if copy_failed_count or failed_count else 0
+
+        if args.command == "rename":
+            renamed_count, failed_count, _, _ = core.rename_files(files, args.name, sort_method, log, use_cache=args.use_cache,
+                                                               file_info=file_info, trace=trace)
+            print(f"Renaming: {renamed_count} successful, {failed_count} failed.")
+            return 1 if failed_count else 0
+
+        # A single folder argument keeps its export folder at the top, even for files from subfolders
+        output_dir_base = args.paths[0] if len(args.paths) == 1 and os.path.isdir(args.paths[0]) else None
+        renamed_count, rename_failed_count, processed_count, skipped_count, failed_count, _ = \
+            core.rename_and_convert(files, args.name, sort_method, args.workers, log, use_cache=args.use_cache,
+                                    options=options, file_info=file_info, output_dir_base=output_dir_base,
+                                    trace=trace)
+        print(f"Renaming: {renamed_count} successful, {rename_failed_count} failed.\n"
+              f"RAW to JPG Conversion: {processed_count} processed, {skipped_count} skipped, {failed_count} failed.")
+        return 1 if rename_failed_count or failed_count else 0
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+def _undo_rename(log):
+    job = core.last_rename_job()
+    if job is None:
+        print("Nothing to undo.")
+        return 0
+    restored_count, failed_count = core.revert_rename_job(job, log)
+    print(f"Undo: {restored_count} restored, {failed_count} failed.")
+    return 1 if failed_count else 0
+
+
+def _resume_renames(args, log):
+    jobs = core.interrupted_rename_jobs()
+    if not jobs:
+        print("No interrupted rename jobs.")
+        return 0
+    total_failed = 0
+    for job in jobs:
+        if args.roll_back:
+            done_count, failed_count = core.revert_rename_job(job, log)
+            print(f"Roll back: {done_count} restored, {failed_count} failed.")
+        else:
+            done_count, failed_count = core.resume_rename_job(job, log)
+            print(f"Resume: {done_count} renamed, {failed_count} failed.")
+        total_failed += failed_count
+    return 1 if total_failed else 0
+
+
+def _export_profiles(names):
+    """Returns the ExportProfiles with the given names (default: full); raises ValueError for unknown ones."""
+    available = profiles.load_profiles(core.user_config_dir())
+    selected = []
+    for name in names or [profiles.PROFILE_FULL.name]:
+        if name not in available:
+            raise ValueError(f"Unknown export profile '{name}' (available: {', '.join(available)})")
+        selected.append(available[name])
+    profiles.check_profiles(selected)
+    return selected
+
+
+def _watch(args, log, options, trace):
+    stop_event = threading.Event()
+    # Ctrl+C stops the watch after the conversions in progress have finished
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    try:
+        stats = watch.watch_folder(args.folder, options, args.workers, args.recursive, args.name, stop_event, log,
+                                   trace=trace, settle_seconds=args.settle, poll_interval=args.poll_interval,
+                                   stats_interval=args.stats_interval, process_existing=args.existing,
+                                   polling=args.polling)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    print(f"RAW to JPG Conversion: {stats.converted} processed, {stats.skipped} skipped, {stats.failed} failed.")
+    return 1 if stats.failed else 0
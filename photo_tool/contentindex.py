@@ -0,0 +1,269 @@
+"""Persistent index of converted RAW files by content, for finding duplicates.
+
+Cards often get imported more than once, so the same RAW ends up in several
+folders under different names (or under a new name after renaming). Every
+converted RAW is recorded with its size and a sample key (a hash of the size
+plus the first and last SAMPLE_SIZE bytes), together with the conversion
+settings and the outputs written.
+
+Finding a duplicate is cheap for the common case: a file whose size no
+other indexed file has is ruled out by one indexed SQLite lookup, without
+reading it. Only when the size matches is the sample key read, and only
+when that matches too is the whole file hashed to confirm. The hash of an
+indexed file's whole content is likewise only computed (and then stored)
+the first time such a match turns up, so converting a folder doesn't read
+every RAW a second time. When duplicates are skipped or linked, where a
+missed duplicate costs a conversion, the conversion workers hash each file
+up front instead, while it is in memory and before it can be moved away.
+
+Hashes use xxHash (XXH3, 128 bit) if the optional `xxhash` package is
+installed, otherwise BLAKE2b, which is slower but in the standard library.
+Each hash is stored with the name of its algorithm, so hashes made with
+different algorithms never match.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_INDEX_FILENAME = "content_index.sqlite3"
+DEFAULT_MAX_ENTRIES = 1_000_000
+# Converted files recorded per put_many() call; one transaction each
+WRITE_BATCH_SIZE = 200
+# Bytes hashed from each end of a file for the sample key
+SAMPLE_SIZE = 64 * 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Stays below SQLite's limit on query parameters
+_PATHS_PER_QUERY = 500
+
+DUPLICATES_OFF = "off"
+DUPLICATES_REPORT = "report"
+DUPLICATES_SKIP = "skip"
+DUPLICATES_LINK = "link"
+DUPLICATE_MODES = (DUPLICATES_OFF, DUPLICATES_REPORT, DUPLICATES_SKIP, DUPLICATES_LINK)
+
+
+def new_hash():
+    """Returns (algorithm name, hash object) for the fastest available hash."""
+    try:
+        import xxhash
+    except ImportError:
+        return "blake2b", hashlib.blake2b(digest_size=16)
+    return "xxh3", xxhash.xxh3_128()
+
+
+def content_hash(path, data=None):
+    """Returns the 'algorithm:hexdigest' hash of a file's content, from `data` if it was already read."""
+    algorithm, digest = new_hash()
+    if data is not None:
+        digest.update(data)
+    else:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return f"{algorithm}:{digest.hexdigest()}"
+
+
+def sample_key(path, data=None):
+    """Returns the hash of a file's size and its first and last SAMPLE_SIZE bytes."""
+    if data is not None:
+        size = len(data)
+        head = data[:SAMPLE_SIZE]
+        tail = data[max(SAMPLE_SIZE, size - SAMPLE_SIZE):]
+    else:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(SAMPLE_SIZE)
+            tail = b""
+            if size > SAMPLE_SIZE:
+                f.seek(max(SAMPLE_SIZE, size - SAMPLE_SIZE))
+                tail = f.read(SAMPLE_SIZE)
+    algorithm, digest = new_hash()
+    digest.update(size.to_bytes(8, "little"))
+    digest.update(head)
+    digest.update(tail)
+    return f"{algorithm}:{digest.hexdigest()}"
+
+
+def needs_content_hash(duplicates):
+    """Whether converted files are hashed in full up front with this duplicates mode (see module docstring)."""
+    return duplicates in (DUPLICATES_SKIP, DUPLICATES_LINK)
+
+
+def settings_key(settings):
+    """Returns the conversion settings in the canonical form they are compared in."""
+    return json.dumps(settings, sort_keys=True, separators=(",", ":"))
+
+
+def _outputs_intact(outputs):
+    for output_file, output_size, _ in outputs:
+        try:
+            if os.path.getsize(output_file) != output_size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+class ContentIndex:
+    """SQLite index of converted RAW files: content hashes, settings and outputs.
+
+    Entries are keyed by the absolute path of the source file. `outputs` are
+    (absolute output path, size, checksum) tuples, as returned by
+    convert_raw_to_jpg(). The content hash of an entry is '' until it is
+    first needed. Lookups on size and on (size, sample key) are indexed,
+    so they stay fast with hundreds of thousands of entries; beyond
+    `max_entries`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        # Rows in the table, counted on the first put_many() and kept up to date from then on
+        self._row_count = None
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS content_index ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sample TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " settings TEXT NOT NULL,"
+            " outputs TEXT NOT NULL,"
+            " last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS content_index_sample ON content_index (size, sample)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS content_index_last_used ON content_index (last_used)")
+        self._connection.commit()
+
+    @classmethod
+    def open_default(cls, config_dir, max_entries=DEFAULT_MAX_ENTRIES):
+        """Opens (creating if needed) the index file inside the user config folder."""
+        os.makedirs(config_dir, exist_ok=True)
+        return cls(os.path.join(config_dir, DEFAULT_INDEX_FILENAME), max_entries)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM content_index").fetchone()[0]
+
+    def find_duplicate(self, path, size, settings):
+        """Looks for an indexed file with the same content as `path`.
+
+        Returns (original_path, outputs, sample, digest), where sample and
+        digest are the keys of both files, or None.
+
+        Only originals converted with the same `settings` whose outputs are
+        still intact count. The file is only read if another indexed file
+        has the same size.
+        """
+        path = os.path.abspath(path)
+        settings = settings_key(settings)
+        with self._lock:
+            if self._connection.execute("SELECT 1 FROM content_index WHERE size = ? AND path != ? LIMIT 1",
+                                        (size, path)).fetchone() is None:
+                return None
+        try:
+            sample = sample_key(path)
+        except OSError:
+            return None
+        with self._lock:
+            candidates = self._connection.execute(
+                "SELECT path, mtime_ns, digest, outputs FROM content_index"
+                " WHERE size = ? AND sample = ? AND settings = ? AND path != ?",
+                (size, sample, settings, path),
+            ).fetchall()
+        digest = None
+        for original_path, original_mtime_ns, original_digest, outputs in candidates:
+            outputs = [tuple(output) for output in json.loads(outputs)]
+            if not _outputs_intact(outputs):
+                continue
+            if not original_digest:
+                original_digest = self._hash_entry(original_path, size, original_mtime_ns)
+                if original_digest is None:
+                    continue
+            if digest is None:
+                try:
+                    digest = content_hash(path)
+                except OSError:
+                    return None
+            if digest == original_digest:
+                with self._lock:
+                    self._connection.execute("UPDATE content_index SET last_used = ? WHERE path = ?",
+                                             (time.time_ns(), original_path))
+                    self._connection.commit()
+                return original_path, outputs, sample, digest
+        return None
+
+    def _hash_entry(self, path, size, mtime_ns):
+        """Computes and stores the content hash of an indexed file; None if it was changed or removed since."""
+        try:
+            stat_result = os.stat(path)
+            if stat_result.st_size != size or stat_result.st_mtime_ns != mtime_ns:
+                return None
+            digest = content_hash(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._connection.execute("UPDATE content_index SET digest = ? WHERE path = ? AND mtime_ns = ?",
+                                     (digest, path, mtime_ns))
+            self._connection.commit()
+        return digest
+
+    def put_many(self, entries):
+        """Records converted files.
+
+        `entries` is an iterable of (path, size, mtime_ns, sample, digest,
+        settings, outputs) tuples, with `settings` as in ConversionOptions.settings()
+        and digest None if the file wasn't hashed in full.
+        """
+        now = time.time_ns()
+        # Keyed by path, so the rows added can be counted without counting the table
+        rows = {}
+        for path, size, mtime_ns, sample, digest, settings, outputs in entries:
+            path = os.path.abspath(path)
+            rows[path] = (path, size, mtime_ns, sample, digest or "", settings_key(settings),
+                          json.dumps([[os.path.abspath(output_file), output_size, checksum]
+                                      for output_file, output_size, checksum in outputs]), now)
+        if not rows:
+            return
+        with self._lock:
+            if self._row_count is None:
+                self._row_count = self._connection.execute("SELECT COUNT(*) FROM content_index").fetchone()[0]
+            paths = list(rows)
+            replaced = 0
+            for start in range(0, len(paths), _PATHS_PER_QUERY):
+                chunk = paths[start:start + _PATHS_PER_QUERY]
+                replaced += self._connection.execute(
+                    f"SELECT COUNT(*) FROM content_index WHERE path IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO content_index"
+                " (path, size, mtime_ns, sample, digest, settings, outputs, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows.values(),
+            )
+            self._row_count += len(rows) - replaced
+            excess = self._row_count - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM content_index WHERE path IN"
+                    " (SELECT path FROM content_index ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._row_count = self.max_entries
+            self._connection.commit()
@@ -0,0 +1,1532 @@
+"""GUI-free rename, EXIF sort and RAW to JPG conversion logic.
+
+Every long-running function takes two optional callbacks:
+
+- ``log(message, detail=False)`` receives human-readable status lines.
+  Routine per-file lines ("Renamed: ...") are passed with ``detail=True`` so
+  front ends can collapse them; warnings and errors never are.
+- ``progress(stage, done, total)`` is called after each file of a stage
+  ("rename" or "convert") has been handled. ``total`` is None while the
+  number of files isn't known yet (e.g. files still being discovered).
+
+Both default to doing nothing, so the functions can be used from scripts,
+the CLI and the GUI alike.
+"""
+
+import datetime
+import io
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Expanded list of common RAW formats
+SUPPORTED_RAW_FORMATS = (
+    '.arw', '.cr2', '.cr3', '.nef', '.dng', '.orf', '.raf', '.pef',
+    '.rw2', '.srw', '.kdc', '.dcr', '.mrw', '.3fr'
+)
+
+SORT_ALPHABETICALLY = "Alphabetically"
+SORT_CREATION_DATE = "Creation Date"
+SORT_EXIF_DATE = "Date Taken (EXIF)"
+SORT_METHODS = (SORT_ALPHABETICALLY, SORT_CREATION_DATE, SORT_EXIF_DATE)
+
+EXPORT_FOLDER_NAME = 'exported_jpg'
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Metadata reads are I/O bound, so more threads than cores helps hide latency
+METADATA_READ_THREADS = 8
+
+# Rename conflicts logged individually before summarizing the rest
+MAX_LISTED_CONFLICTS = 10
+
+# How long the conversion engine waits for a running conversion when its job stream has nothing ready
+ENGINE_IDLE_WAIT_SECONDS = 0.1
+
+
+def _no_log(message, detail=False):
+    pass
+
+
+def _no_progress(stage, done, total):
+    pass
+
+
+def user_config_dir():
+    """Returns the per-user folder for Photo Tool's settings and caches.
+
+    Can be overridden with the PHOTO_TOOL_CONFIG_DIR environment variable.
+    """
+    override = os.environ.get("PHOTO_TOOL_CONFIG_DIR")
+    if override:
+        return override
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "photo_tool")
+
+
+def is_raw_file(path):
+    """Returns True if the path has one of the supported RAW extensions."""
+    return path.lower().endswith(SUPPORTED_RAW_FORMATS)
+
+
+def list_folder_files(folder, recursive=False, patterns=None):
+    """Returns the paths of all regular files inside a folder (and its subfolders if recursive)."""
+    from photo_tool.discovery import scan_files
+
+    return [entry.path for entry in scan_files(folder, recursive, patterns=patterns)]
+
+
+def list_raw_files(folder, recursive=False):
+    """Returns the paths of all RAW files inside a folder (and its subfolders if recursive)."""
+    from photo_tool.discovery import scan_files
+
+    return [entry.path for entry in scan_files(folder, recursive, extensions=SUPPORTED_RAW_FORMATS)]
+
+
+def _stat_file(f_path, file_info):
+    """Returns the FileEntry for a path, from `file_info` if it's there, or None if it can't be read."""
+    from photo_tool.discovery import FileEntry
+
+    if file_info and f_path in file_info:
+        return file_info[f_path]
+    try:
+        return FileEntry.from_path(f_path)
+    except OSError:
+        return None
+
+
+def read_exif_metadata(filepath):
+    """Reads the capture metadata of a file.
+
+    Returns a (date_original, date_digitized, orientation) tuple of the raw EXIF
+    DateTimeOriginal and DateTimeDigitized strings and the Orientation value;
+    each is None if the file doesn't have it.
+
+    Uses the bounded-read parser in photo_tool.fastexif and falls back to
+    exifread for files it can't handle, and for files where it finds no
+    capture date: some RAWs (e.g. RW2, and some DNG and ORF files) keep
+    their dates outside the EXIF IFD the fast path follows.
+    """
+    from photo_tool.fastexif import FastPathError, read_capture_metadata
+
+    try:
+        (date_original, date_digitized, orientation), _ = read_capture_metadata(filepath)
+    except (FastPathError, OSError):
+        return read_exif_metadata_exifread(filepath)
+    if date_original is None and date_digitized is None:
+        date_original, date_digitized, exifread_orientation = read_exif_metadata_exifread(filepath)
+        if orientation is None:
+            orientation = exifread_orientation
+    return date_original, date_digitized, orientation
+
+
+def read_exif_metadata_exifread(filepath):
+    """Same as read_exif_metadata, but always uses exifread."""
+    import exifread
+
+    date_original = date_digitized = orientation = None
+    try:
+        with open(filepath, 'rb') as f:
+            tags = exifread.process_file(f, stop_tag='DateTimeOriginal')
+        if 'EXIF DateTimeOriginal' in tags:
+            date_original = str(tags['EXIF DateTimeOriginal'])
+        if 'EXIF DateTimeDigitized' in tags:
+            date_digitized = str(tags['EXIF DateTimeDigitized'])
+        if 'Image Orientation' in tags:
+            orientation = tags['Image Orientation'].values[0]
+    except Exception:
+        pass
+    return date_original, date_digitized, orientation
+
+
+def parse_exif_date(date_original, date_digitized):
+    """Turns EXIF date strings into a datetime, preferring DateTimeOriginal."""
+    for date_str in (date_original, date_digitized):
+        if date_str:
+            try:
+                return datetime.datetime.strptime(date_str, EXIF_DATE_FORMAT)
+            except ValueError:
+                pass
+    return None
+
+
+def get_exif_date(filepath):
+    """Extracts the 'DateTimeOriginal' from a file's EXIF data."""
+    date_original, date_digitized, _ = read_exif_metadata(filepath)
+    return parse_exif_date(date_original, date_digitized)
+
+
+def _open_metadata_cache(log):
+    """Opens the default metadata cache, or returns None if it can't be used."""
+    from photo_tool.metacache import MetadataCache
+
+    try:
+        return MetadataCache.open_default(user_config_dir())
+    except Exception as e:
+        log(f"Warning: EXIF metadata cache unavailable, reading all files: {e}")
+        return None
+
+
+def open_content_index(log):
+    """Opens the default content index, or returns None if it can't be used."""
+    from photo_tool.contentindex import ContentIndex
+
+    try:
+        return ContentIndex.open_default(user_config_dir())
+    except Exception as e:
+        log(f"Warning: Content index unavailable, duplicates won't be detected: {e}")
+        return None
+
+
+def read_exif_metadata_many(files, max_workers=METADATA_READ_THREADS):
+    """Reads capture metadata for many files on a thread pool.
+
+    Returns a list of (date_original, date_digitized, orientation) tuples in
+    the same order as `files`.
+    """
+    files = list(files)
+    if max_workers <= 1 or len(files) <= 1:
+        return [read_exif_metadata(f_path) for f_path in files]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        return list(pool.map(read_exif_metadata, files))
+
+
+def get_exif_dates(files, log=None, metadata_cache=None, use_cache=True, file_info=None):
+    """Returns a dict mapping each file to its EXIF capture date (or None).
+
+    Results are looked up in and stored to the persistent metadata cache, so
+    unchanged files are only read once; the rest are read concurrently. A
+    cache can be passed in; otherwise the default one in the user config
+    folder is used unless `use_cache` is False. `file_info` optionally maps
+    paths to FileEntry objects from discovery, saving a stat per file.
+    """
+    log = log or _no_log
+    owns_cache = False
+    if metadata_cache is None and use_cache:
+        metadata_cache = _open_metadata_cache(log)
+        owns_cache = metadata_cache is not None
+
+    try:
+        keys = []
+        for f_path in files:
+            entry = _stat_file(f_path, file_info)
+            if entry is not None:
+                keys.append((f_path, entry.size, entry.mtime_ns))
+            else:
+                keys.append((f_path, None, None))
+
+        cached = {}
+        if metadata_cache is not None:
+            cached = metadata_cache.get_many([key for key in keys if key[1] is not None])
+
+        missing = [key for key in keys if os.path.abspath(key[0]) not in cached]
+        read_metadata = read_exif_metadata_many([f_path for f_path, _, _ in missing])
+
+        new_entries = []
+        metadata_by_path = {}
+        for (f_path, size, mtime_ns), metadata in zip(missing, read_metadata):
+            metadata_by_path[f_path] = metadata
+            if size is not None:
+                new_entries.append((f_path, size, mtime_ns) + metadata)
+
+        dates = {}
+        for f_path, _, _ in keys:
+            metadata = metadata_by_path.get(f_path) or cached[os.path.abspath(f_path)]
+            date_original, date_digitized, _ = metadata
+            dates[f_path] = parse_exif_date(date_original, date_digitized)
+
+        if metadata_cache is not None:
+            metadata_cache.put_many(new_entries)
+            log(f"EXIF metadata cache: {len(cached)} hits, {len(keys) - len(cached)} misses.")
+        return dates
+    finally:
+        if owns_cache:
+            metadata_cache.close()
+
+
+def sort_files(files, sort_method, log=None, use_cache=True, file_info=None):
+    """Returns a new list with the files ordered according to `sort_method`.
+
+    `file_info` optionally maps paths to FileEntry objects from discovery,
+    whose stat data is used instead of stat-ing each file again.
+    """
+    log = log or _no_log
+    files = list(files)
+
+    if sort_method == SORT_EXIF_DATE:
+        log("Sorting files by date taken (EXIF)...")
+        exif_dates = get_exif_dates(files, log, use_cache=use_cache, file_info=file_info)
+        files_with_dates = []
+        for f_path in files:
+            exif_date = exif_dates[f_path]
+            if exif_date:
+                files_with_dates.append((exif_date, f_path))
+            else:
+                entry = _stat_file(f_path, file_info)
+                if entry is not None:
+                    files_with_dates.append((datetime.datetime.fromtimestamp(entry.ctime), f_path))
+                    log(f"No EXIF date for '{os.path.basename(f_path)}', using creation date.", detail=True)
+                else:
+                    files_with_dates.append((datetime.datetime.min, f_path))
+                    log(f"No EXIF date and error reading creation date for '{os.path.basename(f_path)}'.")
+
+        files_with_dates.sort(key=lambda x: (x[0], x[1]))
+        files = [f_path for date, f_path in files_with_dates]
+        log("Files sorted by date taken (EXIF).")
+
+    elif sort_method == SORT_CREATION_DATE:
+        try:
+            files.sort(key=lambda f: file_info[f].ctime if file_info and f in file_info else os.path.getctime(f))
+            log("Files sorted by creation date.")
+        except OSError as e:
+            log(f"Error while sorting files by creation date: {e}. Continuing with alphabetical sort.")
+            files.sort()
+    else: # "Alphabetically"
+        files.sort()
+        log("Files sorted alphabetically.")
+
+    return files
+
+
+def plan_renames(files_to_rename, new_base_name, sort_method, log=None, use_cache=True, file_info=None):
+    """Returns the (old_path, new_path) pairs rename_files() would rename, in sorted order.
+
+    Nothing is renamed, so front ends can show the resulting order first.
+    """
+    files_to_rename = sort_files(files_to_rename, sort_method, log, use_cache, file_info)
+    num_digits = max(2, len(str(len(files_to_rename))))
+    plan = []
+    for i, old_path in enumerate(files_to_rename):
+        directory, old_filename = os.path.split(old_path)
+        _, file_extension = os.path.splitext(old_filename)
+        counter = str(i + 1).zfill(num_digits)
+        plan.append((old_path, os.path.join(directory, f"{new_base_name}_{counter}{file_extension}")))
+    return plan
+
+
+def rename_files(files_to_rename, new_base_name, sort_method, log=None, progress=None, use_cache=True, file_info=None,
+                 trace=None, journal_folder=None, stop_event=None):
+    """Sorts and renames files to '{new_base_name}_{NN}{ext}'.
+
+    The whole plan is checked first: if a new name is already taken by a
+    file that isn't being renamed, or two files would get the same name,
+    nothing is renamed. The renames are then done as a journaled job (see
+    photo_tool.journal) in `journal_folder` (default: the config folder's),
+    so an interrupted job can be resumed or rolled back and the last job undone.
+
+    Returns a (renamed_count, failed_count, status, renamed_paths) tuple where
+    status is "no_files", "conflict", "completed" or "stopped" and renamed_paths
+    lists the new path of every file (or its old path if renaming it failed),
+    in sorted order. `file_info` is passed on to sort_files. Sorting and
+    renaming are timed in `trace` (a photo_tool.instrument.JobTrace), if given.
+    Setting `stop_event` (a threading.Event, e.g. when the application exits)
+    stops the job between two renames; it is then left interrupted, to be
+    resumed or rolled back like one interrupted by a crash, and the status is
+    "stopped" (renamed_paths only covers the files renamed so far).
+    """
+    from photo_tool.instrument import JobTrace
+
+    log = log or _no_log
+    progress = progress or _no_progress
+
+    if not files_to_rename:
+        log("No files to rename.")
+        return (0, 0, "no_files", [])
+
+    trace = trace or JobTrace("rename", enabled=False)
+    plan, journal = _start_rename_job(files_to_rename, new_base_name, sort_method, log, use_cache, file_info, trace,
+                                      journal_folder)
+    if journal is None:
+        return (0, len(plan), "conflict", [old_path for old_path, _ in plan])
+
+    log(f"Starting to rename {len(plan)} files...")
+    renamed_count, failed_count, renamed_paths, moves = _run_rename_job(journal, log, progress, trace,
+                                                                        stop_event=stop_event)
+    _finish_rename_job(renamed_count, failed_count, moves, sort_method, use_cache, log)
+    return (renamed_count, failed_count, "completed" if journal.complete else "stopped", renamed_paths)
+
+
+def _start_rename_job(files_to_rename, new_base_name, sort_method, log, use_cache, file_info, trace, journal_folder):
+    """Plans a rename job and writes its journal.
+
+    Returns (plan, journal); journal is None (and the reasons are logged) if
+    the plan has conflicts, in which case nothing may be renamed.
+    """
+    from photo_tool.journal import RenameJournal, find_conflicts
+
+    with trace.stage("sort"):
+        plan = plan_renames(files_to_rename, new_base_name, sort_method, log, use_cache, file_info)
+
+    with trace.stage("check"):
+        conflicts = find_conflicts(plan)
+    if conflicts:
+        for problem in conflicts[:MAX_LISTED_CONFLICTS]:
+            log(f"Error: {problem}")
+        if len(conflicts) > MAX_LISTED_CONFLICTS:
+            log(f"... and {len(conflicts) - MAX_LISTED_CONFLICTS} more.")
+        log(f"Renaming canceled: {len(conflicts)} conflict(s) found, no files were renamed. "
+            "Choose another base name or move the conflicting files away.")
+        return plan, None
+
+    return plan, RenameJournal.create(journal_folder or _default_journal_folder(), plan)
+
+
+def _finish_rename_job(renamed_count, failed_count, moves, sort_method, use_cache, log):
+    if sort_method == SORT_EXIF_DATE and use_cache and moves:
+        _move_cached_metadata(moves, log)
+
+    log("--- Renaming finished ---")
+    log(f"Successfully renamed {renamed_count} files.")
+    if failed_count > 0:
+        log(f"Failed to rename {failed_count} files.")
+
+
+def _default_journal_folder():
+    from photo_tool.journal import default_journal_folder
+
+    return default_journal_folder(user_config_dir())
+
+
+def _run_rename_job(journal, log, progress, trace=None, on_renamed=None, stop_event=None):
+    """Runs (or resumes) a RenameJournal, logging and reporting progress per file.
+
+    `on_renamed(index, old_path, new_path, error)` is called as soon as each
+    file has its final name (or failed to get it). If `stop_event` stops the
+    job, that is logged and the journal stays interrupted.
+    Returns (renamed_count, failed_count, renamed_paths, moves), where moves
+    lists the (old_path, new_path) pairs renamed by this run.
+    """
+    from photo_tool.instrument import JobTrace
+    from photo_tool.journal import prune_journals
+
+    trace = trace or JobTrace("rename", enabled=False)
+    total_files = len(journal.moves)
+    # Moves a resumed job finished before it was interrupted
+    renamed_paths = [journal.path_at(index, journal.locate(index)) for index in range(journal.phase_done[2])]
+    already_done = sum(index not in journal.failed for index in range(journal.phase_done[2]))
+    moves = []
+    counts = {"renamed": 0, "failed": 0}
+
+    def on_result(index, old_path, new_path, error):
+        old_filename = os.path.basename(old_path)
+        if error is None:
+            log(f"Renamed: '{old_filename}' to '{os.path.basename(new_path)}'", detail=True)
+            counts["renamed"] += 1
+            renamed_paths.append(new_path)
+            moves.append((old_path, new_path))
+            trace.file_done()
+        else:
+            log(f"Error renaming '{old_filename}': {error}")
+            counts["failed"] += 1
+            renamed_paths.append(old_path) # Keep old path if rename failed
+        progress("rename", index + 1, total_files)
+        if on_renamed is not None:
+            on_renamed(index, old_path, new_path, error)
+
+    journal.run(on_result, trace, stop_event)
+    if not journal.complete:
+        log(f"Renaming stopped after {journal.phase_done[2]} of {total_files} files. "
+            "The job can be finished or rolled back at the next start.")
+    prune_journals(os.path.dirname(journal.path))
+    return counts["renamed"] + already_done, counts["failed"], renamed_paths, moves
+
+
+def _move_cached_metadata(moves, log):
+    """Keeps the cached EXIF metadata valid under the new names."""
+    metadata_cache = _open_metadata_cache(log)
+    if metadata_cache is not None:
+        try:
+            metadata_cache.move_many(moves)
+        finally:
+            metadata_cache.close()
+
+
+def resume_rename_job(journal, log=None, progress=None, use_cache=True, stop_event=None):
+    """Finishes an interrupted rename job from its journal (see interrupted_rename_jobs()).
+
+    Only the renames since the journal's last flush are checked on disk;
+    nothing is rescanned or sorted again. `stop_event` stops it between two
+    renames, as in rename_files(). Returns (renamed_count, failed_count).
+    """
+    log = log or _no_log
+    progress = progress or _no_progress
+
+    log(f"Resuming rename job from {journal.created} ({journal.phase_done[2]} of {len(journal.moves)} files done)...")
+    renamed_count, failed_count, _, moves = _run_rename_job(journal, log, progress, stop_event=stop_event)
+    if use_cache and moves:
+        _move_cached_metadata(moves, log)
+    if journal.complete and journal.reverts:
+        # A stopped rollback or undo: the job it reverts is only marked once all files are back
+        _mark_reverted(os.path.join(os.path.dirname(journal.path), journal.reverts), log)
+    log(f"--- Rename job resumed: {renamed_count} renamed, {failed_count} failed ---")
+    return (renamed_count, failed_count)
+
+
+def _mark_reverted(journal_path, log):
+    from photo_tool.journal import RenameJournal
+
+    try:
+        journal = RenameJournal.load(journal_path)
+        if not journal.reverted:
+            journal.mark_reverted()
+    except (OSError, ValueError) as e:
+        log(f"Warning: Could not mark the reverted rename job: {e}")
+
+
+def revert_rename_job(journal, log=None, progress=None, use_cache=True, stop_event=None):
+    """Puts every file of a rename job back under its old name.
+
+    Rolls back an interrupted job, or undoes a completed one. The revert is
+    itself a journaled job (so it can be resumed, and undone to redo the
+    rename); `stop_event` stops it between two renames, as in rename_files().
+    Returns (restored_count, failed_count); if files now occupy the old
+    names, nothing is done and failed_count is the number of files.
+    """
+    from photo_tool.journal import KIND_ROLLBACK, KIND_UNDO, RenameJournal, find_conflicts
+
+    log = log or _no_log
+    progress = progress or _no_progress
+
+    moves = journal.revert_moves()
+    missing = [new_path for new_path, _ in moves if not os.path.lexists(new_path)]
+    conflicts = find_conflicts(moves)
+    if missing or conflicts:
+        for new_path in missing[:MAX_LISTED_CONFLICTS]:
+            log(f"Error: '{new_path}' was moved or deleted since it was renamed.")
+        for problem in conflicts[:MAX_LISTED_CONFLICTS]:
+            log(f"Error: {problem}")
+        log("Nothing was restored.")
+        return (0, len(moves))
+
+    kind = KIND_UNDO if journal.complete else KIND_ROLLBACK
+    revert_journal = RenameJournal.create(os.path.dirname(journal.path), moves, kind, os.path.basename(journal.path))
+    log(f"{'Undoing' if kind == KIND_UNDO else 'Rolling back'} rename job from {journal.created}: "
+        f"restoring {len(moves)} file names...")
+    renamed_count, failed_count, _, done_moves = _run_rename_job(revert_journal, log, progress, stop_event=stop_event)
+    if revert_journal.complete:
+        journal.mark_reverted()
+    if use_cache and done_moves:
+        _move_cached_metadata(done_moves, log)
+    log(f"--- Restored {renamed_count} file names ---")
+    if failed_count > 0:
+        log(f"Failed to restore {failed_count} files.")
+    return (renamed_count, failed_count)
+
+
+def interrupted_rename_jobs(journal_folder=None):
+    """Returns the RenameJournals of rename jobs that were interrupted (e.g. by a crash)."""
+    from photo_tool.journal import interrupted_journals
+
+    return interrupted_journals(journal_folder or _default_journal_folder())
+
+
+def last_rename_job(journal_folder=None):
+    """Returns the RenameJournal of the last completed rename job that can be undone, or None."""
+    from photo_tool.journal import last_undoable_journal
+
+    return last_undoable_journal(journal_folder or _default_journal_folder())
+
+
+def rotate_image_based_on_exif(image):
+    """Rotates a PIL Image object based on its EXIF Orientation tag.
+
+    Returns the (possibly rotated) image and a warning message, or None.
+    """
+    try:
+        exif = image.getexif()
+        if exif:
+            orientation_tag_id = 274 # Hex 0x0112, corresponds to Orientation
+            if orientation_tag_id in exif:
+                orientation = exif[orientation_tag_id]
+                if orientation == 3:
+                    image = image.rotate(180, expand=True)
+                elif orientation == 6:
+                    image = image.rotate(270, expand=True)
+                elif orientation == 8:
+                    image = image.rotate(90, expand=True)
+    except Exception as e:
+        return image, f"Warning: Error processing EXIF data for rotation: {e}"
+    return image, None
+
+
+OUTPUT_REENCODE = "reencode"
+OUTPUT_PASSTHROUGH = "passthrough"
+
+SOURCE_PREVIEW = "preview"
+SOURCE_DEVELOP = "develop"
+
+# Values of the 'method' entry in the info dict returned by convert_raw_to_jpg
+METHOD_REENCODE = "reencode"
+METHOD_PASSTHROUGH = "passthrough"
+METHOD_LOSSLESS_ROTATE = "lossless_rotate"
+METHOD_DEVELOP = "develop"
+
+
+class ConversionOptions:
+    """Settings for converting RAW files to JPG.
+
+    source:
+        SOURCE_PREVIEW exports the camera's embedded JPG preview (fast).
+        SOURCE_DEVELOP develops the RAW data with LibRaw at full quality, falling
+        back to the embedded preview if that fails. half_size, output_bps (8 for
+        JPG, 16 for TIFF), white_balance and demosaic control the development,
+        and memory_budget_mb caps the estimated memory of concurrent
+        developments (default: half of the physical memory).
+    output_mode (for embedded previews):
+        OUTPUT_REENCODE decodes the embedded preview, rotates the pixels and
+        re-encodes it at quality 95.
+        OUTPUT_PASSTHROUGH writes the embedded preview's bytes as they are. If
+        the image needs rotating, it is rotated losslessly with jpegtran when
+        available, otherwise the EXIF Orientation tag is set so viewers rotate it.
+        Passthrough only applies to full-size profiles.
+    prefetch_files, prefetch_mb:
+        How many files (and at most how many MB) are read into memory ahead of
+        the conversion, so reading overlaps with converting; see
+        photo_tool.prefetch. prefetch_files=0 turns read-ahead off.
+    profiles:
+        The photo_tool.profiles.ExportProfile outputs written per RAW file
+        (default: a single full-size JPG in the export folder). With a
+        16-bit development, full-size profiles are written as TIFFs and
+        smaller ones as 8-bit JPGs.
+    duplicates:
+        What to do with RAWs whose content was already converted with the
+        same settings, e.g. from an earlier import of the same card (see
+        photo_tool.contentindex): DUPLICATES_REPORT (default) logs them and
+        converts them anyway, DUPLICATES_SKIP skips them, DUPLICATES_LINK
+        hard-links the existing outputs under the new names, and
+        DUPLICATES_OFF neither checks nor indexes anything.
+    """
+
+    def __init__(self, output_mode=None, source=None, half_size=False, output_bps=8,
+                 white_balance="camera", demosaic="AHD", memory_budget_mb=None,
+                 prefetch_files=None, prefetch_mb=None, profiles=None, duplicates=None):
+        from photo_tool.contentindex import DUPLICATES_REPORT
+        from photo_tool.prefetch import DEFAULT_PREFETCH_FILES, DEFAULT_PREFETCH_MB
+        from photo_tool.profiles import PROFILE_FULL
+
+        self.output_mode = output_mode or OUTPUT_REENCODE
+        self.source = source or SOURCE_PREVIEW
+        self.half_size = half_size
+        self.output_bps = output_bps
+        self.white_balance = white_balance
+        self.demosaic = demosaic
+        self.memory_budget_mb = memory_budget_mb
+        self.prefetch_files = DEFAULT_PREFETCH_FILES if prefetch_files is None else prefetch_files
+        self.prefetch_mb = DEFAULT_PREFETCH_MB if prefetch_mb is None else prefetch_mb
+        self.profiles = list(profiles) if profiles else [PROFILE_FULL]
+        self.duplicates = duplicates or DUPLICATES_REPORT
+
+    def to_dict(self):
+        """Returns the options as plain JSON data, with the export profiles by name (e.g. for a saved job queue)."""
+        return {"output_mode": self.output_mode, "source": self.source, "half_size": self.half_size,
+                "output_bps": self.output_bps, "white_balance": self.white_balance, "demosaic": self.demosaic,
+                "memory_budget_mb": self.memory_budget_mb, "prefetch_files": self.prefetch_files,
+                "prefetch_mb": self.prefetch_mb, "profiles": [profile.name for profile in self.profiles],
+                "duplicates": self.duplicates}
+
+    @classmethod
+    def from_dict(cls, data, available_profiles):
+        """Restores options saved by to_dict(); raises ValueError for unknown profile names.
+
+        `available_profiles` maps names to ExportProfiles, as returned by
+        photo_tool.profiles.load_profiles().
+        """
+        data = dict(data)
+        names = data.pop("profiles", None) or []
+        missing = [name for name in names if name not in available_profiles]
+        if missing:
+            raise ValueError(f"Unknown export profile(s): {', '.join(missing)}")
+        return cls(profiles=[available_profiles[name] for name in names], **data)
+
+    def output_extension(self, profile=None):
+        if self.source == SOURCE_DEVELOP and self.output_bps == 16 and (profile is None or profile.max_edge is None):
+            return '.tif'
+        return '.jpg'
+
+    def settings(self):
+        """Returns the settings that affect the output, as recorded in the conversion manifest."""
+        from photo_tool.profiles import PROFILE_FULL
+
+        if self.source == SOURCE_DEVELOP:
+            settings = {"source": self.source, "half_size": self.half_size, "output_bps": self.output_bps,
+                        "white_balance": self.white_balance, "demosaic": self.demosaic, "output_mode": self.output_mode}
+        else:
+            settings = {"source": self.source, "output_mode": self.output_mode}
+        # Left out for the default, so manifests written before export profiles existed stay valid
+        if self.profiles != [PROFILE_FULL]:
+            settings["profiles"] = [profile.settings() for profile in self.profiles]
+        return settings
+
+    def memory_budget_bytes(self):
+        from photo_tool.develop import default_memory_budget
+
+        if self.memory_budget_mb:
+            return self.memory_budget_mb * 1024 * 1024
+        return default_memory_budget()
+
+
+def _write_preview_passthrough(preview_data, raw_flip, output_file, recorder):
+    """Writes an embedded JPEG preview without decoding it. Returns the method used."""
+    from photo_tool import jpegtools
+    from photo_tool.manifest import write_output
+
+    with recorder.stage("orientation"):
+        orientation = jpegtools.get_jpeg_orientation(preview_data)
+        if orientation is None:
+            # The preview has no orientation of its own; use the one LibRaw found in the RAW
+            orientation = jpegtools.LIBRAW_FLIP_TO_ORIENTATION.get(raw_flip, 1)
+            if orientation != 1:
+                preview_data = jpegtools.set_jpeg_orientation(preview_data, orientation)
+
+    method = METHOD_PASSTHROUGH
+    if orientation not in (None, 1):
+        with recorder.stage("lossless_rotate"):
+            transformed = jpegtools.lossless_transform(preview_data, orientation)
+        if transformed is not None:
+            preview_data = transformed
+            method = METHOD_LOSSLESS_ROTATE
+
+    with recorder.stage("write"):
+        write_output(output_file, preview_data)
+    return method
+
+
+def _save_embedded_preview(raw, raw_file_path, outputs, options, messages, recorder):
+    """Saves the embedded JPG preview of an open RAW file for each (profile, output_file) in `outputs`.
+
+    The preview is decoded at most once for all profiles. Returns the method
+    used for the first output, or None.
+    """
+    import rawpy
+    from PIL import Image
+    from photo_tool.profiles import draft_size, save_jpeg
+
+    # Extract the embedded thumbnail, which is usually a JPG
+    with recorder.stage("extract_thumb"):
+        embedded_image = raw.extract_thumb()
+    if embedded_image.format != rawpy.ThumbFormat.JPEG:
+        messages.append(f"Warning: Embedded JPG image not found in RAW file: '{os.path.basename(raw_file_path)}'")
+        return None
+
+    methods = []
+    to_encode = []
+    for profile, output_file in outputs:
+        # Passthrough only applies to full-size outputs; smaller ones have to be re-encoded
+        if options.output_mode == OUTPUT_PASSTHROUGH and profile.max_edge is None:
+            methods.append(_write_preview_passthrough(embedded_image.data, raw.sizes.flip, output_file, recorder))
+        else:
+            methods.append(METHOD_REENCODE)
+            to_encode.append((profile, output_file))
+
+    if to_encode:
+        with recorder.stage("decode"):
+            img = Image.open(io.BytesIO(embedded_image.data))
+            # Let the JPEG decoder scale down in the DCT when all outputs are much smaller than the preview
+            requested_size = draft_size(img.size, [profile for profile, _ in to_encode])
+            if requested_size is not None:
+                img.draft(img.mode, requested_size)
+            img.load()
+        with recorder.stage("rotate"):
+            img, warning = rotate_image_based_on_exif(img)
+        if warning:
+            messages.append(warning)
+        for profile, output_file in to_encode:
+            save_jpeg(img, profile, output_file, recorder)
+    return methods[0]
+
+
+def convert_raw_to_jpg(raw_file_path, output_files, options=None, record_stages=False, data=None):
+    """Converts a single RAW file, by default by exporting its embedded JPG preview.
+
+    `output_files` holds one output path per profile in `options.profiles`
+    (see export_paths()); a single path is accepted for a single profile.
+
+    Runs in worker processes, so instead of logging directly it returns a
+    (success, messages, info) tuple for the caller to log. `messages` only holds
+    warnings and errors; on success `info` has a 'method' entry saying how the
+    first output was written (one of the METHOD_* constants), an 'outputs'
+    list of (path actually written, size, checksum) per profile, and the
+    'output_file' of the first profile and 'output_size' of all outputs.
+    With `record_stages`, `info` also has a 'stages' list of (stage, start,
+    end) timings (see photo_tool.instrument) and the worker's 'pid'.
+    `data` is the RAW file's content if it was already read (see
+    photo_tool.prefetch); otherwise LibRaw reads the file itself. Unless
+    duplicate checks are off, `info` also has the 'sample_key' of the RAW
+    file for the content index, and its 'content_hash' if the duplicates
+    mode hashes files up front (see contentindex.needs_content_hash).
+
+    Outputs are written to temporary files and renamed into place when
+    complete, so an interrupted conversion never leaves a truncated output.
+    """
+    import rawpy
+    from photo_tool.contentindex import DUPLICATES_OFF, content_hash, needs_content_hash, sample_key
+    from photo_tool.develop import develop_raw
+    from photo_tool.instrument import NULL_RECORDER, StageRecorder
+    from photo_tool.manifest import commit_output, temporary_path
+
+    options = options or ConversionOptions()
+    if isinstance(output_files, str):
+        output_files = [output_files]
+    messages = []
+    info = {}
+    recorder = NULL_RECORDER
+    if record_stages:
+        recorder = StageRecorder()
+        info["stages"] = recorder.events
+        info["pid"] = os.getpid()
+    temp_files = []
+    try:
+        with recorder.stage("open"):
+            raw = rawpy.imread(io.BytesIO(data) if data is not None else raw_file_path)
+        with raw:
+            method = None
+            if options.source == SOURCE_DEVELOP:
+                temp_files = [temporary_path(output_file) for output_file in output_files]
+                try:
+                    develop_raw(raw, list(zip(options.profiles, temp_files)), options, recorder)
+                    method = METHOD_DEVELOP
+                except MemoryError:
+                    messages.append(f"Warning: Not enough memory to develop '{os.path.basename(raw_file_path)}', using embedded preview instead.")
+                except Exception as e:
+                    messages.append(f"Warning: Could not develop '{os.path.basename(raw_file_path)}' ({e}), using embedded preview instead.")
+                if method is None:
+                    _remove_files(temp_files)
+                    # The preview is always a JPG, even if a 16-bit TIFF was requested
+                    output_files = [os.path.splitext(output_file)[0] + '.jpg' for output_file in output_files]
+
+            if method is None:
+                temp_files = [temporary_path(output_file) for output_file in output_files]
+                method = _save_embedded_preview(raw, raw_file_path, list(zip(options.profiles, temp_files)), options,
+                                                messages, recorder)
+                if method is None:
+                    return False, messages, info
+
+        outputs = []
+        with recorder.stage("commit"):
+            for temp_file, output_file in zip(temp_files, output_files):
+                outputs.append((output_file,) + commit_output(temp_file, output_file))
+        temp_files = []
+        info["method"] = method
+        info["outputs"] = outputs
+        info["output_file"] = outputs[0][0]
+        info["output_size"] = sum(size for _, size, _ in outputs)
+        if options.duplicates != DUPLICATES_OFF:
+            # Hashed here, from the data already in memory, rather than read again by the main process
+            with recorder.stage("hash"):
+                try:
+                    info["sample_key"] = sample_key(raw_file_path, data)
+                    if needs_content_hash(options.duplicates):
+                        info["content_hash"] = content_hash(raw_file_path, data)
+                except OSError as e:
+                    messages.append(f"Warning: Could not hash '{os.path.basename(raw_file_path)}' for duplicate detection: {e}")
+        return True, messages, info
+    except rawpy.LibRawFileException as e:
+        messages.append(f"LibRaw error while processing '{os.path.basename(raw_file_path)}': {e}")
+        return False, messages, info
+    except Exception as e:
+        messages.append(f"Unexpected error while processing '{os.path.basename(raw_file_path)}': {e}")
+        return False, messages, info
+    finally:
+        _remove_files(temp_files)
+
+
+def _remove_files(paths):
+    from photo_tool.manifest import discard_output
+
+    for path in paths:
+        discard_output(path)
+
+
+def _ignore_interrupts():
+    # Ctrl+C reaches the whole process group; the main process decides when the workers stop
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class RawConversionEngine:
+    """Fans RAW to JPG conversions out across a pool of worker processes.
+
+    At most `max_in_flight` conversions are queued at once, so large folders
+    don't build up a backlog of pending futures, and results are yielded in
+    completion order rather than submission order. When developing full RAWs,
+    files are additionally only submitted while their estimated memory fits
+    into the options' memory budget.
+
+    With `max_tasks_per_child`, each worker process is replaced after that
+    many conversions (Python 3.11+), so memory leaked by LibRaw is given back;
+    a single worker then also runs in its own process. A worker that dies
+    fails only the files it had been given, and the pool is started again.
+    """
+
+    def __init__(self, max_workers=None, max_in_flight=None, options=None, record_stages=False,
+                 max_tasks_per_child=None):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.max_in_flight = max(1, max_in_flight or self.max_workers * 2)
+        self.options = options or ConversionOptions()
+        self.record_stages = record_stages
+        self.max_tasks_per_child = max_tasks_per_child
+
+    def _estimate_memory(self, raw_file_path):
+        from photo_tool.develop import estimate_develop_memory
+
+        try:
+            file_size = os.path.getsize(raw_file_path)
+        except OSError:
+            return 0 # The conversion will report the error
+        return estimate_develop_memory(file_size, self.options.half_size, self.options.output_bps)
+
+    def _new_pool(self):
+        # 'spawn' avoids forking a process that may be running a Tk main loop
+        context = multiprocessing.get_context("spawn")
+        extra = {}
+        if self.max_tasks_per_child and sys.version_info >= (3, 11):
+            extra["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=_ignore_interrupts,
+                                   **extra)
+
+    def run(self, jobs):
+        """Converts (raw_file_path, output_files) pairs from the `jobs` iterable.
+
+        Jobs may also be (raw_file_path, output_files, data) triples carrying the
+        file's content, as yielded by photo_tool.prefetch.Prefetcher. The
+        executor keeps a job's arguments, data included, until its result is
+        back, so buffers handed in with a job are only free once it has been
+        yielded. A job of None means no file is ready yet (e.g. while watching a
+        folder, or while the read-ahead waits for memory): the engine then yields
+        whatever finishes within ENGINE_IDLE_WAIT_SECONDS and asks again.
+        Yields (raw_file_path, output_files, success, messages, info) as each file finishes.
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        if self.max_workers == 1 and not self.max_tasks_per_child:
+            # No point paying for a process pool with a single worker
+            for job in jobs:
+                if job is None:
+                    continue
+                raw_file_path, output_files, *data = job
+                success, messages, info = convert_raw_to_jpg(raw_file_path, output_files, self.options, self.record_stages,
+                                                             data[0] if data else None)
+                yield raw_file_path, output_files, success, messages, info
+            return
+
+        from photo_tool.develop import MemoryBudget
+
+        budget = None
+        if self.options.source == SOURCE_DEVELOP:
+            budget = MemoryBudget(self.options.memory_budget_bytes())
+
+        jobs = iter(jobs)
+        pending = {}
+        waiting_job = None # Next job, held back until it fits into the memory budget
+        exhausted = False
+        pool = self._new_pool()
+        broken = False # A worker died; the pool is replaced once its other conversions are done
+        try:
+            while True:
+                idle = False
+                while len(pending) < self.max_in_flight:
+                    if waiting_job is None:
+                        if exhausted:
+                            break
+                        try:
+                            job = next(jobs)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if job is None:
+                            idle = True
+                            break
+                        raw_file_path, output_files, *data = job
+                        memory = self._estimate_memory(raw_file_path) if budget else 0
+                        waiting_job = (raw_file_path, output_files, memory, data[0] if data else None)
+                    if budget and not budget.try_reserve(waiting_job[2]):
+                        break
+                    raw_file_path, output_files, memory, data = waiting_job
+                    arguments = (convert_raw_to_jpg, raw_file_path, output_files, self.options, self.record_stages, data)
+                    try:
+                        future = pool.submit(*arguments)
+                    except BrokenProcessPool:
+                        # A crashed worker breaks the whole pool; start a new one and retry
+                        pool.shutdown(wait=False)
+                        pool = self._new_pool()
+                        future = pool.submit(*arguments)
+                    pending[future] = (raw_file_path, output_files, memory)
+                    waiting_job = arguments = data = None # The executor holds the data until the job is done
+
+                if not pending:
+                    if exhausted:
+                        break
+                    continue
+
+                done, _ = wait(pending, timeout=ENGINE_IDLE_WAIT_SECONDS if idle else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    raw_file_path, output_files, memory = pending.pop(future)
+                    if budget:
+                        budget.release(memory)
+                    try:
+                        success, messages, info = future.result()
+                    except Exception as e: # e.g. a worker process died inside LibRaw
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        success = False
+                        messages = [f"Unexpected error while processing '{os.path.basename(raw_file_path)}': {e}"]
+                        info = {}
+                    yield raw_file_path, output_files, success, messages, info
+                if broken and not pending:
+                    pool.shutdown(wait=False)
+                    pool = self._new_pool()
+                    broken = False
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def export_path(raw_file_path, output_dir_base, final_jpg_folder, extension):
+    """Returns where the output for a RAW file goes.
+
+    Files in subfolders of `output_dir_base` (e.g. DCIM/100CANON) get the same
+    subfolders inside the export folder, so equal names from different
+    folders don't collide.
+    """
+    directory, filename = os.path.split(raw_file_path)
+    relative_dir = os.path.relpath(directory, output_dir_base) if directory else os.curdir
+    if relative_dir == os.curdir or relative_dir.startswith(os.pardir) or os.path.isabs(relative_dir):
+        relative_dir = ''
+    return os.path.join(final_jpg_folder, relative_dir, os.path.splitext(filename)[0] + extension)
+
+
+def export_paths(raw_file_path, output_dir_base, final_jpg_folder, options):
+    """Returns the output path of a RAW file for each of the options' export profiles."""
+    return [export_path(raw_file_path, output_dir_base, os.path.join(final_jpg_folder, profile.subfolder),
+                        options.output_extension(profile))
+            for profile in options.profiles]
+
+
+def _link_outputs(original_outputs, output_files):
+    """Hard-links (or copies, across file systems) the outputs of a duplicate's original to `output_files`.
+
+    Returns the (output_file, size, checksum) of each output.
+    """
+    import shutil
+    from photo_tool.manifest import temporary_path
+
+    outputs = []
+    for (original_file, size, checksum), output_file in zip(original_outputs, output_files):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        temp_file = temporary_path(output_file)
+        try:
+            os.link(original_file, temp_file)
+        except OSError:
+            shutil.copy2(original_file, temp_file)
+        os.replace(temp_file, output_file)
+        outputs.append((output_file, size, checksum))
+    return outputs
+
+
+def handle_duplicate(content_index, raw_file_path, entry, output_files, options, settings, manifest, log):
+    """Looks a RAW file up in the content index and applies `options.duplicates` if it is a duplicate.
+
+    `entry` is its FileEntry and `output_files` its export_paths(). Linked
+    outputs are recorded in `manifest` and the index. Returns an
+    (is_duplicate, handled) pair; if handled, the file was skipped or linked
+    and must not be converted.
+    """
+    from photo_tool.contentindex import DUPLICATES_LINK, DUPLICATES_REPORT
+
+    duplicate = content_index.find_duplicate(raw_file_path, entry.size, settings)
+    if duplicate is None:
+        return False, False
+    original_path, original_outputs, sample, digest = duplicate
+    name = os.path.basename(raw_file_path)
+    if options.duplicates == DUPLICATES_REPORT:
+        log(f"Duplicate: '{name}' has the same content as '{original_path}', converting it anyway.", detail=True)
+        return True, False
+    if options.duplicates == DUPLICATES_LINK:
+        try:
+            outputs = _link_outputs(original_outputs, output_files)
+        except OSError as e:
+            log(f"Warning: Could not link the outputs of '{original_path}' for '{name}', converting it instead: {e}")
+            return True, False
+        manifest.record(raw_file_path, entry.size, entry.mtime_ns, settings, outputs)
+        content_index.put_many([(raw_file_path, entry.size, entry.mtime_ns, sample, digest, settings, outputs)])
+        log(f"Linked '{os.path.basename(outputs[0][0])}' from the outputs of its duplicate '{original_path}'.", detail=True)
+    else:
+        log(f"Skipping '{name}': same content as '{original_path}', already converted to "
+            f"'{original_outputs[0][0]}'.", detail=True)
+    return True, True
+
+
+def convert_raw_files(files_to_convert, output_dir_base, worker_count=1, log=None, progress=None, options=None, trace=None,
+                      file_count=None, cancel_event=None):
+    """Converts RAW files to JPGs in the 'exported_jpg' subfolder of `output_dir_base`.
+
+    One output is written per export profile in `options` (by default a
+    single full-size JPG); profiles with a subfolder write inside it.
+
+    `files_to_convert` holds paths or FileEntry objects and may be a lazy
+    iterable (e.g. straight from discovery), in which case conversion starts
+    on the first files while the rest are still being found. `file_count`
+    is the number of files a lazy iterable will yield, if known, for progress.
+    A lazy iterable may yield None while no file is ready yet (see
+    RawConversionEngine.run()), so it need not block until the next one is.
+    Entries with a `data` attribute (photo_tool.offload.OffloadedFile) bring
+    the file's content along, which is then not read again.
+
+    Files are skipped if the export folder's conversion manifest shows they
+    were already converted from the same source file with the same settings
+    and their outputs are still intact; see photo_tool.manifest. Files with
+    the same content as a RAW converted before (in any folder) are handled
+    as set by `options.duplicates`, and converted files are added to the
+    content index; see photo_tool.contentindex. Skipped and linked
+    duplicates count as skipped. Setting `cancel_event` (a threading.Event)
+    stops the job between files: no further files are started, and the
+    conversions already running are finished and recorded. Stage timings
+    and throughput are added to `trace` (a photo_tool.instrument.JobTrace),
+    if given. Returns a (processed_count, skipped_count, failed_count) tuple.
+    """
+    from photo_tool.contentindex import DUPLICATES_LINK, DUPLICATES_OFF, DUPLICATES_REPORT, WRITE_BATCH_SIZE
+    from photo_tool.instrument import JobTrace
+    from photo_tool.manifest import ConversionManifest, scan_outputs
+
+    log = log or _no_log
+    progress = progress or _no_progress
+    options = options or ConversionOptions()
+    trace = trace or JobTrace("convert", enabled=False)
+
+    processed_count = 0
+    skipped_count = 0
+    failed_count = 0
+    final_jpg_folder = os.path.join(output_dir_base, EXPORT_FOLDER_NAME)
+
+    if not os.path.exists(final_jpg_folder):
+        os.makedirs(final_jpg_folder)
+        log(f"Created JPG output folder: {final_jpg_folder}")
+
+    # Only known up front for lists; lazy input reports a running total instead
+    total_files = len(files_to_convert) if hasattr(files_to_convert, '__len__') else file_count
+    if total_files == 0:
+        log("No RAW files to process.")
+        return (0, 0, 0)
+
+    try:
+        manifest = ConversionManifest.load(output_dir_base, final_jpg_folder)
+    except ValueError as e:
+        log(f"Warning: {e}. All files will be converted again.")
+        manifest = ConversionManifest(output_dir_base, final_jpg_folder)
+    # One scan of the export folder replaces an existence check per file
+    output_sizes, leftovers = scan_outputs(final_jpg_folder)
+    for leftover in leftovers:
+        try:
+            os.remove(leftover)
+        except OSError:
+            pass
+    if leftovers:
+        log(f"Removed {len(leftovers)} incomplete output(s) left by an interrupted run.")
+    settings = options.settings()
+    content_index = open_content_index(log) if options.duplicates != DUPLICATES_OFF else None
+    index_entries = []
+    duplicate_count = 0
+
+    created_folders = {final_jpg_folder}
+    source_stats = {}
+    seen_count = 0
+
+    def jobs():
+        nonlocal skipped_count, seen_count, duplicate_count
+        for item in files_to_convert:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if item is None:
+                yield None # Nothing ready yet; the engine finishes running conversions meanwhile
+                continue
+            seen_count += 1
+            raw_file_path = getattr(item, 'path', item)
+            entry = item if item is not raw_file_path else _stat_file(raw_file_path, None)
+            output_files = export_paths(raw_file_path, output_dir_base, final_jpg_folder, options)
+
+            if entry is not None:
+                existing_output = manifest.output_for(raw_file_path, entry.size, entry.mtime_ns, settings, output_sizes)
+                if existing_output is not None:
+                    log(f"Skipping '{os.path.basename(existing_output)}' (up to date).", detail=True)
+                    skipped_count += 1
+                    progress("convert", processed_count + skipped_count + failed_count, total_files)
+                    continue
+                if content_index is not None:
+                    with trace.stage("find_duplicate"):
+                        is_duplicate, handled = handle_duplicate(content_index, raw_file_path, entry, output_files,
+                                                                 options, settings, manifest, log)
+                    duplicate_count += is_duplicate
+                    if handled:
+                        skipped_count += 1
+                        progress("convert", processed_count + skipped_count + failed_count, total_files)
+                        continue
+                source_stats[raw_file_path] = (entry.size, entry.mtime_ns)
+
+            for output_file in output_files:
+                output_folder = os.path.dirname(output_file)
+                if output_folder not in created_folders:
+                    os.makedirs(output_folder, exist_ok=True)
+                    created_folders.add(output_folder)
+            data = getattr(item, 'data', None)
+            yield (raw_file_path, output_files) if data is None else (raw_file_path, output_files, data)
+
+    job_stream = jobs()
+    prefetcher = None
+    if options.prefetch_files > 0:
+        from photo_tool.prefetch import Prefetcher
+
+        job_stream = prefetcher = Prefetcher(job_stream, options.prefetch_files, options.prefetch_mb * 1024 ** 2,
+                                             lambda raw_file_path: source_stats.get(raw_file_path, (None, None))[0],
+                                             trace)
+
+    max_workers = min(worker_count, total_files) if total_files else worker_count
+    engine = RawConversionEngine(max_workers=max_workers, options=options, record_stages=trace.enabled)
+    log(f"Converting files using {engine.max_workers} worker process(es)...")
+    if options.source == SOURCE_DEVELOP and engine.max_workers > 1:
+        log(f"Developing full RAW data with a memory budget of {options.memory_budget_bytes() // 1024 ** 2} MB.")
+    method_counts = {}
+    try:
+        for raw_file_path, _, success, messages, info in engine.run(job_stream):
+            if prefetcher is not None:
+                prefetcher.release(raw_file_path) # Only now has the engine let go of the file's content
+            for message in messages:
+                log(message)
+            source_size, source_mtime_ns = source_stats.pop(raw_file_path, (None, None))
+            trace.add_events(info.get("stages", ()), pid=info.get("pid"), file=os.path.basename(raw_file_path))
+            trace.file_done(source_size or 0, info.get("output_size", 0))
+            if success:
+                if trace.first_output_seconds is None:
+                    trace.output_ready()
+                    log(f"First output after {trace.first_output_seconds:.2f} s.")
+                if source_size is not None:
+                    manifest.record(raw_file_path, source_size, source_mtime_ns, settings, info["outputs"])
+                    if content_index is not None and "sample_key" in info:
+                        index_entries.append((raw_file_path, source_size, source_mtime_ns, info["sample_key"],
+                                              info.get("content_hash"), settings, info["outputs"]))
+                        if len(index_entries) >= WRITE_BATCH_SIZE:
+                            content_index.put_many(index_entries)
+                            index_entries.clear()
+                method = info.get("method")
+                method_counts[method] = method_counts.get(method, 0) + 1
+                output_name = os.path.basename(info["output_file"])
+                if method == METHOD_DEVELOP:
+                    log(f"Saved developed image: '{output_name}'", detail=True)
+                elif method == METHOD_REENCODE:
+                    log(f"Saved and rotated JPG preview: '{output_name}'", detail=True)
+                else:
+                    log(f"Saved JPG preview without re-encoding: '{output_name}'", detail=True)
+                processed_count += 1
+            else:
+                failed_count += 1
+            progress("convert", processed_count + skipped_count + failed_count, total_files)
+    finally:
+        try:
+            manifest.compact()
+        except OSError as e:
+            log(f"Warning: Could not save the conversion manifest: {e}")
+        if content_index is not None:
+            try:
+                content_index.put_many(index_entries)
+            except Exception as e:
+                log(f"Warning: Could not update the content index: {e}")
+            finally:
+                content_index.close()
+
+    if cancel_event is not None and cancel_event.is_set():
+        remaining = f" ({total_files - seen_count} not started)" if total_files else ""
+        log(f"Conversion canceled after {processed_count + skipped_count + failed_count} files{remaining}.")
+    elif seen_count == 0:
+        log("No RAW files to process.")
+    elif trace.enabled and processed_count + failed_count:
+        stage_summary = trace.summary_line()
+        if stage_summary:
+            log(stage_summary)
+
+    if duplicate_count:
+        action = {DUPLICATES_REPORT: "converted anyway", DUPLICATES_LINK: "linked to the existing outputs"}.get(
+            options.duplicates, "skipped")
+        log(f"Found {duplicate_count} file(s) with the same content as RAWs converted before ({action}).")
+
+    fast_count = method_counts.get(METHOD_PASSTHROUGH, 0) + method_counts.get(METHOD_LOSSLESS_ROTATE, 0)
+    if options.source == SOURCE_DEVELOP:
+        log(f"Output: {method_counts.get(METHOD_DEVELOP, 0)} developed, "
+            f"{processed_count - method_counts.get(METHOD_DEVELOP, 0)} fell back to the embedded preview.")
+    elif method_counts:
+        log(f"Output: {fast_count} written without re-encoding "
+            f"({method_counts.get(METHOD_LOSSLESS_ROTATE, 0)} rotated losslessly), "
+            f"{method_counts.get(METHOD_REENCODE, 0)} re-encoded.")
+
+    return (processed_count, skipped_count, failed_count)
+
+
+def rename_and_convert(files_to_process, new_base_name, sort_method, worker_count=1, log=None, progress=None, use_cache=True,
+                       options=None, file_info=None, output_dir_base=None, trace=None, journal_folder=None,
+                       cancel_event=None, stop_event=None):
+    """Renames files and converts the renamed RAW files to JPG in a single streaming pass.
+
+    The rename job runs on a background thread, and each RAW file is handed
+    to the conversion as soon as it has its final name, so the first JPGs
+    are written while the rest of the files are still being renamed. The
+    stat data from discovery (`file_info`) travels with each file, so the
+    conversion neither stats it again nor waits for the whole rename.
+
+    The JPGs go to the export folder of `output_dir_base`, which defaults to
+    the folder of the first RAW file (pass the scanned folder when files come
+    from several subfolders). `trace` is passed on to both steps; its
+    first_output_seconds is the time from the start of the job to the first JPG.
+    `cancel_event` only stops the conversion: the renames always run to the
+    end, so a canceled job never leaves a folder half renamed. `stop_event`
+    (e.g. when the application exits) stops the renames too, as in
+    rename_files(), and should be set together with `cancel_event`.
+
+    Returns a (renamed_count, rename_failed_count, processed_count, skipped_count,
+    failed_count, jpg_folder) tuple. jpg_folder is None when there were no files
+    to rename or no RAW files among them.
+    """
+    import queue
+    import threading
+    from photo_tool.discovery import FileEntry
+    from photo_tool.instrument import JobTrace
+    from photo_tool.journal import AT_OLD
+
+    log = log or _no_log
+    progress = progress or _no_progress
+    trace = trace or JobTrace("combined", enabled=False)
+
+    if not files_to_process:
+        log("No files to rename.")
+        return (0, 0, 0, 0, 0, None)
+
+    plan, journal = _start_rename_job(files_to_process, new_base_name, sort_method, log, use_cache, file_info, trace,
+                                      journal_folder)
+    if journal is None:
+        return (0, len(plan), 0, 0, 0, None)
+
+    raw_count = sum(1 for _, new_path in plan if is_raw_file(new_path))
+    if not raw_count:
+        log(f"Starting to rename {len(plan)} files...")
+        renamed_count, rename_failed_count, _, moves = _run_rename_job(journal, log, progress, trace,
+                                                                       stop_event=stop_event)
+        _finish_rename_job(renamed_count, rename_failed_count, moves, sort_method, use_cache, log)
+        log("No RAW files to convert after renaming. Ending combined process.")
+        return (renamed_count, rename_failed_count, 0, 0, 0, None)
+
+    if output_dir_base is None:
+        output_dir_base = os.path.dirname(next(new_path for _, new_path in plan if is_raw_file(new_path)))
+
+    log("\n--- Starting combined process: Rename RAW + Convert to JPG ---")
+    log(f"Renaming {len(plan)} files; each of the {raw_count} RAW files is converted as soon as it is renamed...")
+
+    renamed_raw_files = queue.Queue()
+    rename_result = {}
+
+    def on_renamed(index, old_path, new_path, error):
+        if error is None:
+            path = new_path
+        elif journal.failed.get(index) == AT_OLD:
+            path = old_path # Converted under its old name, as before
+        else:
+            return # Stuck at a temporary name; it is reported as failed
+        if not is_raw_file(path):
+            return
+        entry = file_info.get(old_path) if file_info else None
+        if entry is not None:
+            # Renaming keeps size and mtime, so the conversion can use the stat data from discovery
+            renamed_raw_files.put(FileEntry(path, os.path.basename(path), entry.size, entry.mtime_ns, entry.ctime))
+        else:
+            renamed_raw_files.put(path)
+
+    def rename_task():
+        try:
+            rename_result["result"] = _run_rename_job(journal, log, progress, trace, on_renamed, stop_event)
+        except Exception as e:
+            rename_result["error"] = e
+        finally:
+            renamed_raw_files.put(None)
+
+    def renamed_raws():
+        while True:
+            try:
+                item = renamed_raw_files.get(timeout=ENGINE_IDLE_WAIT_SECONDS)
+            except queue.Empty:
+                yield None # Lets the conversion go on with the files it has while the next one is renamed
+                continue
+            if item is None:
+                return
+            yield item
+
+    rename_thread = threading.Thread(target=rename_task, name="rename", daemon=True)
+    rename_thread.start()
+    try:
+        processed_count, skipped_count, failed_count = \
+            convert_raw_files(renamed_raws(), output_dir_base, worker_count, log, progress, options, trace, raw_count,
+                              cancel_event)
+    finally:
+        rename_thread.join()
+    if "error" in rename_result:
+        raise rename_result["error"]
+
+    renamed_count, rename_failed_count, _, moves = rename_result["result"]
+    _finish_rename_job(renamed_count, rename_failed_count, moves, sort_method, use_cache, log)
+    return (renamed_count, rename_failed_count, processed_count, skipped_count, failed_count,
+            os.path.join(output_dir_base, EXPORT_FOLDER_NAME))
+
+
+def offload_files(files_to_offload, destination_folder, new_base_name, sort_method, worker_count=1, log=None, progress=None,
+                  use_cache=True, options=None, file_info=None, convert=True, verify=True, reads_per_device=None,
+                  writes_per_device=None, trace=None, cancel_event=None):
+    """Copies files (e.g. from a camera card) to `destination_folder` under their final names, converting the RAWs.
+
+    Files are numbered '{new_base_name}_{NN}{ext}' in `sort_method` order, as
+    rename_files() would, and copied, verified and named in a single pass;
+    see photo_tool.offload. With `convert`, each RAW file is handed to the
+    conversion as soon as it is copied, together with its content while the
+    read-ahead memory of `options` allows, so it isn't read again; the JPGs
+    go to the export folder of `destination_folder`. Files copied by an
+    earlier offload are not copied again, but still converted if needed.
+
+    `reads_per_device` and `writes_per_device` cap the concurrent copies per
+    source and destination device. Nothing is copied if a target name is
+    taken by a different file. Setting `cancel_event` (a threading.Event)
+    stops copying and converting between files; copies are never left
+    half-written under their final names.
+
+    Returns a (copied_count, already_copied_count, copy_failed_count,
+    processed_count, skipped_count, failed_count, jpg_folder) tuple;
+    jpg_folder is None when nothing was converted.
+    """
+    import queue
+    import threading
+    from photo_tool import offload
+    from photo_tool.instrument import JobTrace
+    from photo_tool.journal import find_conflicts
+
+    log = log or _no_log
+    progress = progress or _no_progress
+    options = options or ConversionOptions()
+    trace = trace or JobTrace("offload", enabled=False)
+    reads_per_device = reads_per_device or offload.DEFAULT_READS_PER_DEVICE
+    writes_per_device = writes_per_device or offload.DEFAULT_WRITES_PER_DEVICE
+
+    if not files_to_offload:
+        log("No files to offload.")
+        return (0, 0, 0, 0, 0, 0, None)
+
+    os.makedirs(destination_folder, exist_ok=True)
+    removed_count = offload.remove_leftovers(destination_folder)
+    if removed_count:
+        log(f"Removed {removed_count} incomplete copies left by an interrupted offload.")
+    with trace.stage("sort"):
+        plan = offload.plan_offload(files_to_offload, destination_folder, new_base_name, sort_method, log, use_cache,
+                                    file_info)
+    to_copy, already_copied = offload.split_copied(plan, file_info)
+    problems = find_conflicts(to_copy)
+    if problems:
+        log(f"Offload canceled: {len(problems)} file(s) can't be copied safely, nothing was copied.")
+        for problem in problems[:MAX_LISTED_CONFLICTS]:
+            log(f"  {problem}")
+        if len(problems) > MAX_LISTED_CONFLICTS:
+            log(f"  ... and {len(problems) - MAX_LISTED_CONFLICTS} more.")
+        return (0, 0, len(plan), 0, 0, 0, None)
+    if already_copied:
+        log(f"{len(already_copied)} file(s) were copied by an earlier offload and are not copied again.")
+
+    raw_count = sum(1 for _, target_path in plan if is_raw_file(target_path)) if convert else 0
+    log(f"Offloading {len(to_copy)} files to '{destination_folder}' "
+        f"({reads_per_device} per source device, {writes_per_device} per destination device"
+        f"{', verified' if verify else ''})...")
+    if raw_count:
+        log(f"Each of the {raw_count} RAW files is converted as soon as it is copied...")
+
+    copied_raw_files = queue.Queue()
+    memory_lock = threading.Lock()
+    held_bytes = [0] # Content of copied RAWs not yet taken by the conversion
+    reserved = {} # Source path -> bytes set aside by keep_data until its copy finishes
+    memory_cap = options.prefetch_mb * 1024 ** 2 if options.prefetch_files > 0 else 0
+    done_count = [0]
+
+    def keep_data(source_path, size):
+        if not raw_count or not is_raw_file(source_path):
+            return False
+        with memory_lock:
+            if held_bytes[0] + size > memory_cap:
+                return False
+            held_bytes[0] += size
+            reserved[source_path] = size
+            return True
+
+    def on_copied(source_path, target_path, result, error):
+        with memory_lock:
+            done_count[0] += 1
+            done = done_count[0]
+            size = reserved.pop(source_path, 0)
+            if error is not None or result.data is None:
+                held_bytes[0] -= size # Nothing for the conversion to take
+            else:
+                held_bytes[0] += len(result.data) - size # copied_raws releases what it actually holds
+        if error is not None:
+            log(f"Error copying '{os.path.basename(source_path)}': {error}")
+        else:
+            log(f"Copied '{os.path.basename(source_path)}' to '{result.name}'.", detail=True)
+            if not raw_count:
+                trace.file_done(result.size, result.size)
+            elif is_raw_file(target_path):
+                copied_raw_files.put(result)
+        progress("offload", done, len(to_copy))
+
+    def copy_task():
+        try:
+            copy_result["result"] = offload.run_offload(to_copy, on_copied, reads_per_device, writes_per_device, verify,
+                                                        keep_data, trace, cancel_event)
+        except Exception as e:
+            copy_result["error"] = e
+        finally:
+            copied_raw_files.put(None)
+
+    def copied_raws():
+        # Copied earlier, so only the conversion manifest decides whether they still need converting
+        for _, target_path in already_copied:
+            if is_raw_file(target_path):
+                yield target_path
+        while True:
+            try:
+                item = copied_raw_files.get(timeout=ENGINE_IDLE_WAIT_SECONDS)
+            except queue.Empty:
+                yield None # Lets the conversion go on with the files it has while the next one is copied
+                continue
+            if item is None:
+                return
+            if item.data is not None:
+                with memory_lock:
+                    held_bytes[0] -= len(item.data)
+            yield item
+
+    copy_result = {}
+    processed_count = skipped_count = failed_count = 0
+    jpg_folder = None
+    if raw_count:
+        copy_thread = threading.Thread(target=copy_task, name="offload", daemon=True)
+        copy_thread.start()
+        try:
+            processed_count, skipped_count, failed_count = \
+                convert_raw_files(copied_raws(), destination_folder, worker_count, log, progress, options, trace, raw_count,
+                                  cancel_event)
+        finally:
+            copy_thread.join()
+        jpg_folder = os.path.join(destination_folder, EXPORT_FOLDER_NAME)
+    else:
+        copy_task()
+    if "error" in copy_result:
+        raise copy_result["error"]
+
+    copied_count, copy_failed_count = copy_result["result"]
+    if cancel_event is not None and cancel_event.is_set():
+        log(f"Offload canceled: {len(to_copy) - copied_count - copy_failed_count} file(s) were not copied.")
+    log(f"Offload finished: {copied_count} copied, {len(already_copied)} already there, {copy_failed_count} failed.")
+    return (copied_count, len(already_copied), copy_failed_count, processed_count, skipped_count, failed_count,
+            jpg_folder)
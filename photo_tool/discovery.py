@@ -0,0 +1,129 @@
+"""Streaming file discovery built on os.scandir.
+
+scan_files() yields files as the directory is read, so callers can start
+working on the first files while the rest of a large folder (or camera card
+tree like DCIM/100CANON, DCIM/101CANON, ...) is still being listed. Each
+FileEntry carries the size and timestamps from a single stat per file, so
+later stages (sorting, caching, skipping) don't have to stat again.
+"""
+
+import fnmatch
+import os
+
+# Folders never descended into (besides hidden ones): our own JPG output
+DEFAULT_EXCLUDED_DIRS = ('exported_jpg',)
+
+
+class FileEntry:
+    """A discovered file and the stat data read while discovering it."""
+
+    __slots__ = ('path', 'name', 'size', 'mtime_ns', 'ctime')
+
+    def __init__(self, path, name, size, mtime_ns, ctime):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ctime = ctime
+
+    @classmethod
+    def from_dir_entry(cls, dir_entry):
+        stat_result = dir_entry.stat()
+        return cls(dir_entry.path, dir_entry.name, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime)
+
+    @classmethod
+    def from_path(cls, path):
+        stat_result = os.stat(path)
+        return cls(path, os.path.basename(path), stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime)
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r}, size={self.size})"
+
+
+def _matches(name, extensions, patterns):
+    lower_name = name.lower()
+    if extensions and not lower_name.endswith(extensions):
+        return False
+    if patterns and not any(fnmatch.fnmatchcase(lower_name, pattern) for pattern in patterns):
+        return False
+    return True
+
+
+def scan_files(folder, recursive=False, extensions=None, patterns=None, excluded_dirs=DEFAULT_EXCLUDED_DIRS, on_error=None):
+    """Yields a FileEntry for every regular file in `folder`.
+
+    recursive: also descend into subfolders (hidden folders and `excluded_dirs` are skipped).
+    extensions: only yield files with one of these (lowercase) extensions, e.g. ('.cr2', '.jpg').
+    patterns: only yield files whose name matches one of these glob patterns
+        (case-insensitive), e.g. ('img_*', '*.arw').
+    on_error: called with the OSError for subfolders or files that can't be read;
+        errors listing `folder` itself are raised.
+
+    Files are yielded in directory order; callers that need a stable order sort them.
+    """
+    extensions = tuple(ext.lower() for ext in extensions) if extensions else None
+    patterns = tuple(pattern.lower() for pattern in patterns) if patterns else None
+    excluded_dirs = {name.lower() for name in excluded_dirs}
+
+    pending_folders = [folder]
+    while pending_folders:
+        current = pending_folders.pop()
+        try:
+            iterator = os.scandir(current)
+        except OSError as e:
+            if current == folder:
+                raise
+            if on_error:
+                on_error(e)
+            continue
+        with iterator:
+            subfolders = []
+            for dir_entry in iterator:
+                try:
+                    if dir_entry.is_file():
+                        if _matches(dir_entry.name, extensions, patterns):
+                            yield FileEntry.from_dir_entry(dir_entry)
+                    elif recursive and dir_entry.is_dir(follow_symlinks=False):
+                        if not dir_entry.name.startswith('.') and dir_entry.name.lower() not in excluded_dirs:
+                            subfolders.append(dir_entry.path)
+                except OSError as e:
+                    if on_error:
+                        on_error(e)
+            # Visit subfolders in name order (DCIM/100XXXXX before 101XXXXX)
+            pending_folders.extend(sorted(subfolders, reverse=True))
+
+
+def scan_ahead(entries, on_total):
+    """Yields the items of `entries` (e.g. from scan_files()) while a background thread reads them to the end.
+
+    A conversion takes files far slower than a folder is listed, so reading
+    the listing lazily would only reveal the total when the job is nearly
+    done. Here the listing runs ahead, and `on_total(count)` is called as
+    soon as it is complete, without listing the folder a second time.
+    Errors raised by `entries` are re-raised by this generator.
+    """
+    import queue
+    import threading
+
+    found = queue.Queue()
+    done = object()
+
+    def read_all():
+        count = 0
+        try:
+            for item in entries:
+                count += 1
+                found.put(item)
+            on_total(count)
+        except Exception as e:
+            found.put(e)
+        found.put(done)
+
+    threading.Thread(target=read_all, name="scan-ahead", daemon=True).start()
+    while True:
+        item = found.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
@@ -0,0 +1,290 @@
+"""Fast, bounded-read extraction of capture dates and orientation.
+
+exifread is thorough but, for several RAW containers, it reads and seeks far
+more of the file than is needed to find DateTimeOriginal. This module knows
+just enough about each supported container to jump straight to the TIFF/EXIF
+structures holding the capture metadata:
+
+- TIFF-based RAWs (ARW, CR2, NEF, DNG, PEF, SRW, KDC, DCR, 3FR, ORF, RW2)
+- JPEG (APP1 'Exif' segment)
+- RAF (the EXIF block of the embedded JPEG)
+- CR3 (the CMT1/CMT2 boxes in Canon's ISO-BMFF 'uuid' box)
+- MRW (the TTW block)
+
+Reads are served from a small head buffer and a sliding window, and every
+read is bounded. Anything unexpected raises FastPathError so callers can fall
+back to exifread.
+"""
+
+import io
+import struct
+
+HEAD_SIZE = 16 * 1024
+WINDOW_SIZE = 4 * 1024
+# Refuse to read huge blocks: capture metadata never needs more than this at once
+MAX_READ_SIZE = 256 * 1024
+# Refuse to follow more than this many boxes/markers/blocks looking for metadata
+MAX_STRUCTURES = 512
+
+TAG_ORIENTATION = 0x0112
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+
+TYPE_ASCII = 2
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+# Standard TIFF ('*'), Olympus ORF ('RO' / 'RS') and Panasonic RW2 ('U')
+_TIFF_MAGICS = (42, 0x4F52, 0x5352, 0x55)
+
+CR3_CANON_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+
+
+class FastPathError(Exception):
+    """Raised when the fast path can't handle a file and exifread should be used."""
+
+
+class BoundedReader:
+    """Random-access reader over a binary file that tracks bytes read and read calls.
+
+    The first HEAD_SIZE bytes are read up front. Reads outside of them load a
+    WINDOW_SIZE window at the requested offset, so walking a small structure
+    elsewhere in the file costs one extra read instead of one per field.
+    """
+
+    def __init__(self, f, head_size=HEAD_SIZE):
+        self._f = f
+        self.head = f.read(head_size)
+        self.bytes_read = len(self.head)
+        self.read_calls = 1
+        self._window_offset = 0
+        self._window = b""
+
+    def read_at(self, offset, size):
+        if offset < 0 or size < 0 or size > MAX_READ_SIZE:
+            raise FastPathError(f"Refusing to read {size} bytes at offset {offset}")
+        end = offset + size
+        if end <= len(self.head):
+            return self.head[offset:end]
+        window_end = self._window_offset + len(self._window)
+        if offset < self._window_offset or end > window_end:
+            self._f.seek(offset)
+            self._window = self._f.read(max(size, WINDOW_SIZE))
+            self._window_offset = offset
+            self.bytes_read += len(self._window)
+            self.read_calls += 1
+        start = offset - self._window_offset
+        data = self._window[start:start + size]
+        if len(data) != size:
+            raise FastPathError(f"Unexpected end of file at offset {offset}")
+        return data
+
+
+def _parse_tiff(reader, base):
+    """Reads capture metadata from a TIFF structure starting at `base`.
+
+    Returns a (date_original, date_digitized, orientation) tuple.
+    """
+    header = reader.read_at(base, 8)
+    if header[:2] == b"II":
+        order = "<"
+    elif header[:2] == b"MM":
+        order = ">"
+    else:
+        raise FastPathError("Not a TIFF header")
+    magic, ifd0_offset = struct.unpack(order + "HI", header[2:8])
+    if magic not in _TIFF_MAGICS:
+        raise FastPathError(f"Unknown TIFF magic {magic:#x}")
+
+    ifd0 = _read_ifd(reader, base, ifd0_offset, order)
+    orientation = _short_value(ifd0.get(TAG_ORIENTATION), order)
+    date_original = date_digitized = None
+
+    exif_entry = ifd0.get(TAG_EXIF_IFD)
+    if exif_entry is not None:
+        exif_offset = struct.unpack(order + "I", exif_entry[2])[0]
+        exif_ifd = _read_ifd(reader, base, exif_offset, order)
+        date_original = _ascii_value(reader, base, exif_ifd.get(TAG_DATETIME_ORIGINAL), order)
+        date_digitized = _ascii_value(reader, base, exif_ifd.get(TAG_DATETIME_DIGITIZED), order)
+
+    return date_original, date_digitized, orientation
+
+
+def _read_ifd(reader, base, offset, order):
+    """Returns {tag: (type, count, raw_value_bytes)} for the IFD at `offset`."""
+    count = struct.unpack(order + "H", reader.read_at(base + offset, 2))[0]
+    if count > MAX_STRUCTURES:
+        raise FastPathError(f"Implausible IFD entry count {count}")
+    data = reader.read_at(base + offset + 2, count * 12)
+    entries = {}
+    for i in range(count):
+        tag, field_type, value_count = struct.unpack(order + "HHI", data[i * 12:i * 12 + 8])
+        entries[tag] = (field_type, value_count, data[i * 12 + 8:i * 12 + 12])
+    return entries
+
+
+def _short_value(entry, order):
+    if entry is None:
+        return None
+    field_type, _, value = entry
+    if field_type == TYPE_SHORT:
+        return struct.unpack(order + "H", value[:2])[0]
+    if field_type == TYPE_LONG:
+        return struct.unpack(order + "I", value)[0]
+    return None
+
+
+def _ascii_value(reader, base, entry, order):
+    if entry is None:
+        return None
+    field_type, value_count, value = entry
+    if field_type != TYPE_ASCII or value_count == 0:
+        return None
+    if value_count <= 4:
+        data = value[:value_count]
+    else:
+        data = reader.read_at(base + struct.unpack(order + "I", value)[0], value_count)
+    text = data.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+    return text or None
+
+
+def _parse_jpeg(reader, base):
+    """Finds the APP1 'Exif' segment of a JPEG starting at `base`."""
+    if reader.read_at(base, 2) != b"\xff\xd8":
+        raise FastPathError("Not a JPEG")
+    offset = base + 2
+    for _ in range(MAX_STRUCTURES):
+        marker = reader.read_at(offset, 4)
+        if marker[0] != 0xFF:
+            raise FastPathError("Corrupt JPEG marker")
+        marker_type = marker[1]
+        if marker_type == 0xFF: # Fill byte
+            offset += 1
+            continue
+        if marker_type in (0xD9, 0xDA): # End of image / start of scan: no EXIF
+            return None, None, None
+        length = struct.unpack(">H", marker[2:4])[0]
+        if marker_type == 0xE1 and reader.read_at(offset + 4, 6) == b"Exif\0\0":
+            return _parse_tiff(reader, offset + 10)
+        offset += 2 + length
+    raise FastPathError("Too many JPEG segments")
+
+
+def _parse_raf(reader):
+    """Fujifilm RAF: the capture metadata lives in the embedded JPEG."""
+    jpeg_offset, jpeg_length = struct.unpack(">II", reader.read_at(84, 8))
+    if not jpeg_offset or not jpeg_length:
+        raise FastPathError("RAF without embedded JPEG")
+    return _parse_jpeg(reader, jpeg_offset)
+
+
+def _iter_boxes(reader, start, end):
+    """Yields (box_type, payload_offset, box_end) for ISO-BMFF boxes in [start, end)."""
+    offset = start
+    for _ in range(MAX_STRUCTURES):
+        if end is not None and offset + 8 > end:
+            return
+        header = reader.read_at(offset, 8)
+        size, box_type = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", reader.read_at(offset + 8, 8))[0]
+            payload += 8
+        elif size == 0:
+            if end is None:
+                raise FastPathError("Box extends to end of file")
+            size = end - offset
+        if size < payload - offset:
+            raise FastPathError("Corrupt ISO-BMFF box")
+        yield box_type, payload, offset + size
+        offset += size
+    raise FastPathError("Too many ISO-BMFF boxes")
+
+
+def _parse_cr3(reader):
+    """Canon CR3: IFD0 is in the CMT1 box, the EXIF IFD in CMT2."""
+    for box_type, payload, box_end in _iter_boxes(reader, 0, None):
+        if box_type != b"moov":
+            continue
+        for child_type, child_payload, child_end in _iter_boxes(reader, payload, box_end):
+            if child_type != b"uuid" or reader.read_at(child_payload, 16) != CR3_CANON_UUID:
+                continue
+            orientation = date_original = date_digitized = None
+            for cmt_type, cmt_payload, _ in _iter_boxes(reader, child_payload + 16, child_end):
+                if cmt_type == b"CMT1":
+                    _, _, orientation = _parse_tiff(reader, cmt_payload)
+                elif cmt_type == b"CMT2":
+                    date_original, date_digitized = _parse_cmt2(reader, cmt_payload)
+            return date_original, date_digitized, orientation
+        raise FastPathError("CR3 without Canon metadata box")
+    raise FastPathError("CR3 without moov box")
+
+
+def _parse_cmt2(reader, base):
+    """CMT2 is a TIFF structure whose first IFD is the EXIF IFD itself."""
+    header = reader.read_at(base, 8)
+    order = "<" if header[:2] == b"II" else ">"
+    ifd_offset = struct.unpack(order + "I", header[4:8])[0]
+    exif_ifd = _read_ifd(reader, base, ifd_offset, order)
+    return (_ascii_value(reader, base, exif_ifd.get(TAG_DATETIME_ORIGINAL), order),
+            _ascii_value(reader, base, exif_ifd.get(TAG_DATETIME_DIGITIZED), order))
+
+
+def _parse_mrw(reader):
+    """Minolta MRW: a block list whose TTW block is a TIFF structure."""
+    header_length = struct.unpack(">I", reader.read_at(4, 4))[0]
+    offset = 8
+    end = 8 + header_length
+    for _ in range(MAX_STRUCTURES):
+        if offset + 8 > end:
+            break
+        name, length = struct.unpack(">4sI", reader.read_at(offset, 8))
+        if name == b"\0TTW":
+            return _parse_tiff(reader, offset + 8)
+        offset += 8 + length
+    raise FastPathError("MRW without TTW block")
+
+
+def parse_capture_metadata(reader):
+    """Detects the container format from the head buffer and parses it."""
+    head = reader.head
+    if head[:2] in (b"II", b"MM"):
+        return _parse_tiff(reader, 0)
+    if head[:2] == b"\xff\xd8":
+        return _parse_jpeg(reader, 0)
+    if head[:16] == b"FUJIFILMCCD-RAW ":
+        return _parse_raf(reader)
+    if head[4:8] == b"ftyp" and head[8:12] == b"crx ":
+        return _parse_cr3(reader)
+    if head[:4] == b"\0MRM":
+        return _parse_mrw(reader)
+    raise FastPathError("Unrecognized file format")
+
+
+def read_capture_metadata(filepath):
+    """Reads (date_original, date_digitized, orientation) using bounded reads.
+
+    Returns the metadata and the reader (for its bytes_read / read_calls
+    counters) as a ((date_original, date_digitized, orientation), reader) tuple.
+    Raises FastPathError (or OSError) if the file can't be handled.
+    """
+    with open(filepath, "rb") as f:
+        reader = BoundedReader(f)
+        try:
+            metadata = parse_capture_metadata(reader)
+        except (struct.error, IndexError) as e:
+            raise FastPathError(f"Malformed metadata: {e}") from e
+    return metadata, reader
+
+
+def read_capture_metadata_from_bytes(data):
+    """Like read_capture_metadata, for a file that is already in memory.
+
+    Returns (date_original, date_digitized, orientation); raises FastPathError.
+    """
+    reader = BoundedReader(io.BytesIO(data))
+    try:
+        return parse_capture_metadata(reader)
+    except (struct.error, IndexError) as e:
+        raise FastPathError(f"Malformed metadata: {e}") from e
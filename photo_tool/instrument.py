@@ -0,0 +1,220 @@
+"""Per-stage timing and throughput counters for jobs.
+
+A JobTrace collects timed stages ("open", "extract_thumb", "decode",
+"rotate", "encode", "write", ...) from the job's own thread and from the
+conversion worker processes, plus file and byte counters for a live
+throughput readout. At the end of a job it can be written as plain JSON
+(per-stage totals) or as a Chrome trace (chrome://tracing, Perfetto) showing
+every stage of every file on its worker's timeline.
+
+Recording a stage costs two perf_counter() calls and a list append, so
+tracing can stay on; a disabled JobTrace records nothing at all.
+Timestamps are time.perf_counter() values, which come from a system-wide
+monotonic clock on Linux, macOS and Windows, so events from different
+worker processes line up.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+# Only the first MAX_EVENTS individual events are kept for the Chrome trace;
+# per-stage totals always include everything
+MAX_EVENTS = 200_000
+# Keep this many trace files in the default trace folder
+MAX_TRACE_FILES = 20
+
+
+class StageRecorder:
+    """Records (stage, start, end) tuples; used inside a single conversion.
+
+    Cheap enough to pickle back from a worker process with the result.
+    """
+
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = []
+
+    def stage(self, name):
+        return _RecordedStage(self.events, name)
+
+
+class _RecordedStage:
+    __slots__ = ('_events', '_name', '_start')
+
+    def __init__(self, events, name):
+        self._events = events
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._events.append((self._name, self._start, time.perf_counter()))
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class NullRecorder:
+    """StageRecorder stand-in that records nothing."""
+
+    __slots__ = ()
+    events = ()
+
+    def stage(self, name):
+        return NULL_STAGE
+
+
+NULL_RECORDER = NullRecorder()
+
+
+class JobTrace:
+    """Stage timings and throughput counters of one job (rename, conversion, ...)."""
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.started_at = datetime.datetime.now()
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.first_output_seconds = None # Time to the first finished output; recorded even when disabled
+        self.stage_totals = {} # stage: [count, seconds]
+        self._events = [] # (stage, start, end, pid, tid, file)
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Context manager timing a stage run in the current thread."""
+        if not self.enabled:
+            return NULL_STAGE
+        return _TracedStage(self, name)
+
+    def add_events(self, events, pid=None, tid=0, file=None):
+        """Adds (stage, start, end) events recorded elsewhere, e.g. by a worker process."""
+        if not self.enabled:
+            return
+        pid = pid or os.getpid()
+        with self._lock:
+            for name, start, end in events:
+                totals = self.stage_totals.setdefault(name, [0, 0.0])
+                totals[0] += 1
+                totals[1] += end - start
+                if len(self._events) < MAX_EVENTS:
+                    self._events.append((name, start, end, pid, tid, file))
+
+    def file_done(self, bytes_read=0, bytes_written=0):
+        """Counts a finished file for the throughput readout."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.files += 1
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+
+    def output_ready(self):
+        """Records the time to the first finished output, on the first call."""
+        if self.first_output_seconds is None:
+            self.first_output_seconds = self.elapsed()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def throughput(self):
+        """Returns (files per second, MB read per second) since the job started."""
+        elapsed = self.elapsed()
+        if not elapsed:
+            return 0.0, 0.0
+        return self.files / elapsed, self.bytes_read / elapsed / 1024 ** 2
+
+    def summary_line(self):
+        """Returns e.g. 'Time per stage: open 1.20 s, extract_thumb 0.31 s, ...', or None."""
+        with self._lock:
+            stages = sorted(self.stage_totals.items(), key=lambda item: -item[1][1])
+        if not stages:
+            return None
+        return "Time per stage: " + ", ".join(f"{name} {seconds:.2f} s" for name, (_, seconds) in stages)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job": self.name,
+                "started": self.started_at.isoformat(timespec="seconds"),
+                "seconds": self.elapsed(),
+                "files": self.files,
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+                "first_output_seconds": self.first_output_seconds,
+                "stages": {name: {"count": count, "seconds": seconds} for name, (count, seconds) in self.stage_totals.items()},
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        """Writes the events in Chrome's Trace Event Format, with the totals as metadata."""
+        with self._lock:
+            events = list(self._events)
+        trace_events = []
+        for name, start, end, pid, tid, file in events:
+            event = {"name": name, "ph": "X", "ts": (start - self.started) * 1e6, "dur": (end - start) * 1e6,
+                     "pid": pid, "tid": tid}
+            if file:
+                event["args"] = {"file": file}
+            trace_events.append(event)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": self.to_dict()}, f)
+
+    def save(self, folder):
+        """Writes the job's Chrome trace to a new file in `folder` and returns its path.
+
+        Only the newest MAX_TRACE_FILES traces in the folder are kept.
+        """
+        os.makedirs(folder, exist_ok=True)
+        filename = f"{self.started_at:%Y%m%d-%H%M%S-%f}-{self.name}.trace.json"
+        path = os.path.join(folder, filename)
+        self.write_chrome_trace(path)
+        old_traces = sorted(f for f in os.listdir(folder) if f.endswith(".trace.json"))
+        for old_trace in old_traces[:-MAX_TRACE_FILES]:
+            try:
+                os.remove(os.path.join(folder, old_trace))
+            except OSError:
+                pass
+        return path
+
+
+class _TracedStage:
+    __slots__ = ('_trace', '_name', '_start')
+
+    def __init__(self, trace, name):
+        self._trace = trace
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._trace.add_events([(self._name, self._start, time.perf_counter())], tid=threading.get_ident())
+        return False
+
+
+def default_trace_folder(config_dir):
+    return os.path.join(config_dir, "traces")
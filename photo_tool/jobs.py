@@ -0,0 +1,343 @@
+"""A persistent queue of jobs with priorities, cancellation and progress/ETA.
+
+Front ends submit jobs (rename, convert, ...) instead of starting a thread
+per job. One worker thread runs them one at a time, most urgent first and
+in submission order within a priority, since each conversion already uses
+all cores. Queued jobs can be canceled or moved up, and a running job is
+canceled cooperatively: its cancel_event is passed to the core functions,
+which check it between files.
+
+The queue is saved to a JSON file in the config folder whenever it
+changes, so jobs still waiting when the application is closed (or
+crashes) can be picked up on the next start. A job's parameters must
+therefore be plain JSON data; anything else a job needs, such as the
+results of a folder scan, goes into its `extras`, which are not saved.
+
+Every job measures its own throughput from its progress reports: the ETA
+is based on the rate over the last RATE_WINDOW_SECONDS, so it follows
+speed changes (e.g. a slow card after a fast SSD) instead of averaging
+over the whole job.
+"""
+
+import collections
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+QUEUE_VERSION = 1
+DEFAULT_QUEUE_FILENAME = "job_queue.json"
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITIES = (PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_LOW)
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_CANCELED = "canceled"
+
+# The throughput for the ETA is measured over this many recent seconds
+RATE_WINDOW_SECONDS = 30.0
+# Progress samples kept per job for the rate
+MAX_RATE_SAMPLES = 256
+
+
+class _StageProgress:
+    """Latest report and recent (time, done) samples of one stage of a job."""
+
+    def __init__(self):
+        self.done = 0
+        self.total = None
+        self.samples = collections.deque(maxlen=MAX_RATE_SAMPLES)
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return None
+        (first_time, first_done), (last_time, last_done) = self.samples[0], self.samples[-1]
+        if last_time > first_time and last_done > first_done:
+            return (last_done - first_done) / (last_time - first_time)
+        return None
+
+
+class JobProgress:
+    """Progress of a job: the latest (done, total) report and the rate behind the ETA, per stage.
+
+    Written by the job's threads and read by the UI under a lock. Stages can
+    report at the same time (an offload copies while it converts, a combined
+    job renames while it converts), so each keeps its own counts and rate.
+    The job is shown by the stage that started last, e.g. "convert" once it
+    has reported. Reports without a total keep the one from set_total(), if any.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {} # stage: _StageProgress
+        self.stage = None # The stage that is shown
+
+    def _stage(self, stage):
+        progress = self._stages.get(stage)
+        if progress is None:
+            progress = self._stages[stage] = _StageProgress()
+            self.stage = stage
+        return progress
+
+    def update(self, stage, done, total):
+        now = time.monotonic()
+        with self._lock:
+            progress = self._stage(stage)
+            if done < progress.done:
+                progress.samples.clear()
+            progress.done = done
+            if total is not None:
+                progress.total = total
+            progress.samples.append((now, done))
+            while len(progress.samples) > 2 and now - progress.samples[0][0] > RATE_WINDOW_SECONDS:
+                progress.samples.popleft()
+
+    def set_total(self, stage, total):
+        """Sets the total of `stage` for reports that don't include one, e.g. while files are still being discovered."""
+        with self._lock:
+            progress = self._stage(stage)
+            if progress.total is None:
+                progress.total = total
+
+    def snapshot(self):
+        """Returns (stage, done, total, files_per_second, eta_seconds) of the shown stage; the last two may be None."""
+        with self._lock:
+            progress = self._stages.get(self.stage)
+            if progress is None:
+                return None, 0, None, None, None
+            rate = progress.rate()
+            eta = None
+            if rate and progress.total is not None:
+                eta = max(0, progress.total - progress.done) / rate
+            return self.stage, progress.done, progress.total, rate, eta
+
+
+class Job:
+    """A queued job. `params` are saved with the queue; `extras` only live in memory."""
+
+    def __init__(self, job_id, kind, title, params, priority=PRIORITY_NORMAL, created=None, started=False, extras=None):
+        self.id = job_id
+        self.kind = kind
+        self.title = title
+        self.params = params
+        self.priority = priority
+        self.created = created or time.strftime("%Y-%m-%d %H:%M:%S")
+        # Whether the job ever started; a restored job that did may have done part of its work
+        self.started = started
+        self.extras = extras or {}
+        self.state = STATE_QUEUED
+        self.cancel_event = threading.Event()
+        # Set by JobQueue.cancel(), as opposed to a shutdown, which also sets cancel_event
+        self.cancel_requested = False
+        self.progress = JobProgress()
+        self.error = None
+
+    def report_progress(self, stage, done, total):
+        """A `progress(stage, done, total)` callback for the core functions."""
+        self.progress.update(stage, done, total)
+
+    def to_dict(self):
+        return {"id": self.id, "kind": self.kind, "title": self.title, "params": self.params,
+                "priority": self.priority, "created": self.created, "started": self.started}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["kind"], data["title"], data["params"], data["priority"], data["created"],
+                   data.get("started", False))
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind!r}, {self.state})"
+
+
+def format_eta(seconds):
+    """Formats a duration for a progress line: '45 s', '12 min', '2 h 05 min'."""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} s"
+    minutes = (seconds + 30) // 60
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60:02d} min"
+
+
+class JobQueue:
+    """Runs submitted jobs one at a time on a worker thread, most urgent first.
+
+    `run_job(job)` does the work and is called on the worker thread; it
+    should pass job.cancel_event and job.report_progress on to the core
+    functions. Exceptions it raises mark the job as failed and are logged.
+    The queue is saved to `path` on every change (if `path` is set).
+    Nothing runs until start() is called, so restored jobs can be looked at
+    (see restored_jobs) before they are run.
+    """
+
+    def __init__(self, path, run_job, log=None):
+        self.path = path
+        self.run_job = run_job
+        self.log = log or (lambda message, detail=False: None)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._heap = [] # (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._ids = itertools.count(1)
+        self._running = None
+        self._closing = False
+        # Set by shutdown(). Jobs that ignore their cancel_event to finish their renames stop on this instead
+        self.stop_event = threading.Event()
+        self._thread = None
+        # Bumped on every change, so a UI only redraws its job list when needed
+        self.version = 0
+        self.restored_jobs = self._load()
+
+    @classmethod
+    def open_default(cls, config_dir, run_job, log=None):
+        """Opens the queue file inside the user config folder, restoring the jobs saved in it."""
+        os.makedirs(config_dir, exist_ok=True)
+        return cls(os.path.join(config_dir, DEFAULT_QUEUE_FILENAME), run_job, log)
+
+    def _load(self):
+        """Queues the jobs saved in the queue file and returns them."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != QUEUE_VERSION:
+                raise ValueError(f"unknown version {data.get('version')}")
+            jobs = [Job.from_dict(job_data) for job_data in data["jobs"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log(f"Warning: Could not read the saved job queue '{self.path}': {e}. It is cleared.")
+            return []
+        for job in jobs:
+            heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+        self._ids = itertools.count(max((job.id for job in jobs), default=0) + 1)
+        return jobs
+
+    def _save(self):
+        """Writes the waiting and running jobs to the queue file. Called with the lock held."""
+        self.version += 1
+        if not self.path:
+            return
+        jobs = ([self._running] if self._running is not None else []) + [job for _, _, job in sorted(self._heap)]
+        temp_file = self.path + ".tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"version": QUEUE_VERSION, "jobs": [job.to_dict() for job in jobs]}, f, indent=1)
+            os.replace(temp_file, self.path)
+        except (OSError, TypeError) as e:
+            self.log(f"Warning: Could not save the job queue: {e}")
+
+    def start(self):
+        """Starts the worker thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="job-queue", daemon=True)
+            self._thread.start()
+
+    def submit(self, kind, title, params, priority=PRIORITY_NORMAL, extras=None):
+        """Queues a job and returns it."""
+        with self._lock:
+            job = Job(next(self._ids), kind, title, params, priority, extras=extras)
+            heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+            self._save()
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, job_id):
+        """Removes a waiting job, or asks the running job to stop after the files in progress.
+
+        Returns the job, or None if there is no such job.
+        """
+        with self._lock:
+            if self._running is not None and self._running.id == job_id:
+                self._running.cancel_requested = True
+                self._running.cancel_event.set()
+                return self._running
+            for index, (_, _, job) in enumerate(self._heap):
+                if job.id == job_id:
+                    self._heap.pop(index)
+                    heapq.heapify(self._heap)
+                    job.state = STATE_CANCELED
+                    job.cancel_event.set()
+                    self._save()
+                    return job
+        return None
+
+    def move_to_front(self, job_id):
+        """Makes a waiting job urgent and the next one to run. Returns False if it isn't waiting."""
+        with self._lock:
+            for index, (_, _, job) in enumerate(self._heap):
+                if job.id == job_id:
+                    job.priority = PRIORITY_URGENT
+                    # Ahead of the other urgent jobs, too
+                    self._heap[index] = (job.priority, -next(self._sequence), job)
+                    heapq.heapify(self._heap)
+                    self._save()
+                    return True
+        return False
+
+    def clear(self):
+        """Removes all waiting jobs."""
+        with self._lock:
+            for _, _, job in self._heap:
+                job.state = STATE_CANCELED
+            self._heap.clear()
+            self._save()
+
+    def snapshot(self):
+        """Returns (running job or None, [waiting jobs in the order they will run])."""
+        with self._lock:
+            return self._running, [job for _, _, job in sorted(self._heap)]
+
+    def has_jobs(self, kinds):
+        """Whether a job of one of `kinds` is running or waiting."""
+        with self._lock:
+            jobs = ([self._running] if self._running is not None else []) + [job for _, _, job in self._heap]
+            return any(job.kind in kinds for job in jobs)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._heap and not self._closing:
+                    self._wakeup.wait()
+                if self._closing:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                job.state = STATE_RUNNING
+                job.started = True
+                self._running = job
+                self._save()
+            try:
+                self.run_job(job)
+                job.state = STATE_CANCELED if job.cancel_event.is_set() else STATE_DONE
+            except Exception as e:
+                job.state = STATE_FAILED
+                job.error = e
+                self.log(f"Error: The job '{job.title}' failed: {e}")
+            with self._lock:
+                self._running = None
+                if self._closing and job.cancel_event.is_set() and not job.cancel_requested:
+                    # Stopped by shutdown(), so it stays saved and continues on the next start
+                    heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+                self._save()
+
+    def shutdown(self):
+        """Stops the worker after the running job's files in progress; waiting jobs stay saved.
+
+        Blocks until the running job has returned, so run_job() should pass
+        stop_event to work that doesn't stop on the job's cancel_event.
+        """
+        with self._lock:
+            self._closing = True
+            self.stop_event.set()
+            if self._running is not None:
+                self._running.cancel_event.set()
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
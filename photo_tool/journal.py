@@ -0,0 +1,345 @@
+"""Crash-safe rename jobs: conflict checks, two-phase execution and an append-only journal.
+
+A rename job is planned in full before anything is touched. find_conflicts()
+rejects plans that would overwrite files outside the job (e.g. renaming to
+a base name that is already used in the folder) or give two files the same
+name. Chains and cycles inside the job (a -> b while b -> c, or a <-> b)
+are fine: every file whose name is another file's target is first moved
+to a unique temporary name (phase 1), and only then are all files moved
+to their final names (phase 2).
+
+The plan is written to a journal file before the first rename, and
+progress is appended to it every FLUSH_INTERVAL renames. After a crash the
+journal says which files were moved, so the job can be resumed or rolled
+back without rescanning the folder or reading any EXIF data again: only
+the renames since the last flush are checked on disk. Completed jobs stay
+in the journal folder, so the last job can be undone.
+"""
+
+import datetime
+import json
+import os
+import sys
+
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"
+# Renames between journal flushes; on resume, at most this many are checked on disk
+FLUSH_INTERVAL = 500
+# Finished journals kept for undo
+MAX_JOURNALS = 20
+
+KIND_RENAME = "rename"
+KIND_UNDO = "undo"
+KIND_ROLLBACK = "rollback"
+
+# Where a file of a job is
+AT_OLD = "old"
+AT_TEMP = "temp"
+AT_NEW = "new"
+
+
+def default_journal_folder(config_dir):
+    return os.path.join(config_dir, "rename_journals")
+
+
+def _path_key(path):
+    """Returns a key under which two spellings of the same path compare equal."""
+    key = os.path.normcase(os.path.abspath(path))
+    if sys.platform == "darwin": # Case-insensitive by default, but normcase doesn't fold case there
+        key = key.lower()
+    return key
+
+
+def find_conflicts(moves):
+    """Returns a list of reasons why the (old_path, new_path) `moves` can't be done safely.
+
+    Targets may be files of the job itself (they are moved out of the way
+    first), but not other existing files, and no two files may get the same name.
+    Each target folder is listed once instead of checking every target.
+    """
+    source_keys = {_path_key(old_path) for old_path, _ in moves}
+    target_sources = {}
+    folder_contents = {}
+    problems = []
+    for old_path, new_path in moves:
+        target_key = _path_key(new_path)
+        if target_key in target_sources:
+            problems.append(f"'{os.path.basename(target_sources[target_key])}' and '{os.path.basename(old_path)}' "
+                            f"would both be renamed to '{os.path.basename(new_path)}'.")
+            continue
+        target_sources[target_key] = old_path
+        if target_key in source_keys:
+            continue
+        folder = os.path.dirname(new_path)
+        if folder not in folder_contents:
+            try:
+                with os.scandir(folder or os.curdir) as iterator:
+                    folder_contents[folder] = {_path_key(dir_entry.path) for dir_entry in iterator}
+            except OSError:
+                folder_contents[folder] = set()
+        if target_key in folder_contents[folder]:
+            problems.append(f"'{os.path.basename(new_path)}' already exists in '{folder}' and is not part of this rename.")
+    return problems
+
+
+class RenameJournal:
+    """A rename job and its journal file.
+
+    The first line of the file holds the job ({"moves": [[old, new], ...]});
+    each further line is a progress record: {"phase": 1|2, "done": n} (all
+    moves before index n finished that phase), {"failed": i, "at": location},
+    {"complete": true} or {"reverted": true}.
+    """
+
+    def __init__(self, path, moves, kind=KIND_RENAME, reverts=None, created=None):
+        self.path = path
+        self.job_id = os.path.basename(path)[:-len(JOURNAL_SUFFIX)]
+        self.moves = moves
+        self.kind = kind
+        self.reverts = reverts
+        self.created = created
+        self.phase_done = {1: 0, 2: 0}
+        self.failed = {} # index: where the file was left (AT_OLD or AT_TEMP)
+        self.complete = False
+        self.reverted = False
+        self._temp_group = None
+
+    @classmethod
+    def create(cls, folder, moves, kind=KIND_RENAME, reverts=None):
+        """Writes the journal of a new job to `folder` (before anything is renamed) and returns it."""
+        os.makedirs(folder, exist_ok=True)
+        now = datetime.datetime.now()
+        path = os.path.join(folder, f"{now:%Y%m%d-%H%M%S-%f}{JOURNAL_SUFFIX}")
+        journal = cls(path, [tuple(move) for move in moves], kind, reverts, now.isoformat(timespec="seconds"))
+        header = {"version": JOURNAL_VERSION, "kind": kind, "created": journal.created, "reverts": reverts,
+                  "moves": journal.moves}
+        with open(path, "x", encoding="utf-8") as f:
+            f.write(json.dumps(header, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        """Reads a journal; raises ValueError if it isn't one."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            header = json.loads(lines[0])
+        except (OSError, IndexError, ValueError) as e:
+            raise ValueError(f"Could not read rename journal '{path}': {e}") from e
+        if header.get("version") != JOURNAL_VERSION:
+            raise ValueError(f"Rename journal '{path}' has an unknown version.")
+        journal = cls(path, [tuple(move) for move in header["moves"]], header.get("kind", KIND_RENAME),
+                      header.get("reverts"), header.get("created"))
+        for line_number, line in enumerate(lines[1:], 2):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line_number == len(lines):
+                    break # Cut off by a crash while it was being written
+                raise ValueError(f"Rename journal '{path}' is damaged at line {line_number}.")
+            if "phase" in record:
+                journal.phase_done[record["phase"]] = max(journal.phase_done[record["phase"]], record["done"])
+            elif "failed" in record:
+                journal.failed[record["failed"]] = record["at"]
+            journal.complete = journal.complete or record.get("complete", False)
+            journal.reverted = journal.reverted or record.get("reverted", False)
+        return journal
+
+    @property
+    def finished(self):
+        """True if the job completed or was rolled back; otherwise it was interrupted."""
+        return self.complete or self.reverted
+
+    def _append(self, record):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def temp_path(self, index):
+        old_path = self.moves[index][0]
+        return os.path.join(os.path.dirname(old_path), f".photo_tool_rename_{self.job_id}_{index}.tmp")
+
+    def temp_group(self):
+        """Returns the indexes of moves whose file has to go through a temporary name (its name is another move's target)."""
+        if self._temp_group is None:
+            target_keys = {_path_key(new_path) for old_path, new_path in self.moves if old_path != new_path}
+            self._temp_group = {i for i, (old_path, new_path) in enumerate(self.moves)
+                                if old_path != new_path and _path_key(old_path) in target_keys}
+        return self._temp_group
+
+    def locate(self, index):
+        """Returns where the file of a move is now: AT_OLD, AT_TEMP or AT_NEW.
+
+        Comes from the journal for moves before the last flush; only the
+        moves after it are checked on disk.
+        """
+        old_path, new_path = self.moves[index]
+        if index in self.failed:
+            return self.failed[index]
+        if old_path == new_path:
+            return AT_NEW
+        in_temp_group = index in self.temp_group()
+        if index < self.phase_done[2]:
+            return AT_NEW
+        if self.phase_done[2] or self.phase_done[1] >= len(self.moves):
+            # Phase 2 has started: each file is in its phase 1 place or at its new name
+            if in_temp_group:
+                return AT_TEMP if os.path.lexists(self.temp_path(index)) else AT_NEW
+            # Nobody else's target, so a file at the old name is this one
+            return AT_OLD if os.path.lexists(old_path) else AT_NEW
+        if not in_temp_group:
+            return AT_OLD
+        if index < self.phase_done[1]:
+            return AT_TEMP
+        return AT_TEMP if os.path.lexists(self.temp_path(index)) else AT_OLD
+
+    def path_at(self, index, location):
+        old_path, new_path = self.moves[index]
+        return {AT_OLD: old_path, AT_TEMP: self.temp_path(index), AT_NEW: new_path}[location]
+
+    def run(self, on_result=None, trace=None, stop_event=None):
+        """Runs (or resumes) the job.
+
+        `on_result(index, old_path, new_path, error)` is called once per move
+        still to do in phase 2, with error None if the file has (or already
+        had) its new name. Renames are timed as "rename" stages in `trace`.
+        Once `stop_event` is set, the job stops before the next move and its
+        progress is recorded, so it stays interrupted (to be resumed or
+        rolled back) instead of complete; check `complete` afterwards.
+        """
+        from photo_tool.instrument import JobTrace
+
+        trace = trace or JobTrace("rename", enabled=False)
+        on_result = on_result or (lambda index, old_path, new_path, error: None)
+        move_count = len(self.moves)
+        temp_group = self.temp_group()
+
+        def record(entry):
+            # Progress is only recorded every FLUSH_INTERVAL moves, so syncing each record is cheap
+            with trace.stage("journal"):
+                self._append(entry)
+
+        def stopped(phase, index):
+            if stop_event is None or not stop_event.is_set():
+                return False
+            record({"phase": phase, "done": index})
+            return True
+
+        # Phase 1: move every file whose name is needed by another one out of the way
+        for index in range(self.phase_done[1], move_count):
+            if stopped(1, index):
+                return
+            if index in temp_group and index not in self.failed and self.locate(index) == AT_OLD:
+                try:
+                    with trace.stage("rename"):
+                        os.rename(self.moves[index][0], self.temp_path(index))
+                except OSError as e:
+                    self.failed[index] = AT_OLD
+                    record({"failed": index, "at": AT_OLD, "error": str(e)})
+            self.phase_done[1] = index + 1
+            if (index + 1) % FLUSH_INTERVAL == 0:
+                record({"phase": 1, "done": index + 1})
+        record({"phase": 1, "done": move_count})
+        self.phase_done[1] = move_count
+
+        # Phase 2: everything to its final name
+        for index in range(self.phase_done[2], move_count):
+            if stopped(2, index):
+                return
+            old_path, new_path = self.moves[index]
+            error = None
+            location = self.locate(index)
+            if index in self.failed:
+                error = OSError(f"'{os.path.basename(old_path)}' could not be moved out of the way")
+            elif location != AT_NEW:
+                current_path = self.path_at(index, location)
+                try:
+                    if os.path.lexists(new_path): # os.rename would silently replace it on POSIX
+                        raise FileExistsError(f"'{os.path.basename(new_path)}' already exists")
+                    with trace.stage("rename"):
+                        os.rename(current_path, new_path)
+                except OSError as e:
+                    error = e
+                    if location == AT_TEMP and not os.path.lexists(old_path):
+                        try:
+                            os.rename(current_path, old_path)
+                            location = AT_OLD
+                        except OSError:
+                            pass # Left at the temporary name; the journal knows where it is
+                    self.failed[index] = location
+                    record({"failed": index, "at": location, "error": str(e)})
+            self.phase_done[2] = index + 1
+            if (index + 1) % FLUSH_INTERVAL == 0:
+                record({"phase": 2, "done": index + 1})
+            on_result(index, old_path, new_path, error)
+        self.phase_done[2] = move_count
+        self.complete = True
+        record({"phase": 2, "done": move_count})
+        record({"complete": True})
+
+    def revert_moves(self):
+        """Returns the (current_path, old_path) moves that put every file of the job back."""
+        moves = []
+        for index, (old_path, _) in enumerate(self.moves):
+            location = self.locate(index)
+            if location != AT_OLD:
+                moves.append((self.path_at(index, location), old_path))
+        return moves
+
+    def mark_reverted(self):
+        self.reverted = True
+        self._append({"reverted": True})
+
+
+def list_journals(folder):
+    """Returns the paths of the journals in `folder`, oldest first."""
+    try:
+        names = sorted(name for name in os.listdir(folder) if name.endswith(JOURNAL_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(folder, name) for name in names]
+
+
+def interrupted_journals(folder):
+    """Returns the RenameJournals in `folder` that neither completed nor were rolled back."""
+    journals = []
+    for path in list_journals(folder):
+        try:
+            journal = RenameJournal.load(path)
+        except ValueError:
+            continue
+        if not journal.finished:
+            journals.append(journal)
+    return journals
+
+
+def last_undoable_journal(folder):
+    """Returns the newest completed job that hasn't been undone, or None.
+
+    Rollbacks of interrupted jobs can't be undone (that would put files back
+    under their temporary names), so they are skipped.
+    """
+    for path in reversed(list_journals(folder)):
+        try:
+            journal = RenameJournal.load(path)
+        except ValueError:
+            continue
+        if journal.complete and not journal.reverted and journal.kind != KIND_ROLLBACK:
+            return journal
+        if not journal.finished:
+            return None # An interrupted job has to be resumed or rolled back first
+    return None
+
+
+def prune_journals(folder, keep=MAX_JOURNALS):
+    """Deletes the oldest finished journals beyond `keep`; interrupted ones are always kept."""
+    paths = list_journals(folder)
+    for path in paths[:max(0, len(paths) - keep)]:
+        try:
+            if RenameJournal.load(path).finished:
+                os.remove(path)
+        except (OSError, ValueError):
+            pass
@@ -0,0 +1,148 @@
+"""Byte-level JPEG helpers that avoid decoding the image.
+
+- get_jpeg_orientation() reads the EXIF Orientation tag.
+- set_jpeg_orientation() rewrites it, adding an EXIF segment or an IFD0
+  entry if needed, without touching the compressed image data.
+- lossless_transform() rotates/flips in the DCT domain with the external
+  `jpegtran` tool (libjpeg-turbo), when it is installed.
+"""
+
+import shutil
+import struct
+import subprocess
+
+from photo_tool.fastexif import FastPathError, TAG_ORIENTATION, TYPE_SHORT, read_capture_metadata_from_bytes
+
+# jpegtran arguments that undo each EXIF orientation
+_JPEGTRAN_TRANSFORMS = {
+    2: ["-flip", "horizontal"],
+    3: ["-rotate", "180"],
+    4: ["-flip", "vertical"],
+    5: ["-transpose"],
+    6: ["-rotate", "90"],
+    7: ["-transverse"],
+    8: ["-rotate", "270"],
+}
+
+# LibRaw's 'flip' value mapped to the EXIF orientation it stands for
+LIBRAW_FLIP_TO_ORIENTATION = {0: 1, 3: 3, 5: 8, 6: 6}
+
+
+def _find_exif_segment(data):
+    """Returns (segment_offset, segment_length) of the APP1 'Exif' segment, or None.
+
+    segment_length counts the 2 length bytes and the payload, like the JPEG field.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise FastPathError("Not a JPEG")
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise FastPathError("Corrupt JPEG marker")
+        marker_type = data[offset + 1]
+        if marker_type == 0xFF:
+            offset += 1
+            continue
+        if marker_type in (0xD9, 0xDA):
+            return None
+        length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        if marker_type == 0xE1 and data[offset + 4:offset + 10] == b"Exif\0\0":
+            return offset, length
+        offset += 2 + length
+    return None
+
+
+def _tiff_ifd0(data, tiff_start):
+    """Returns (byte_order, ifd0_offset, entries) for the TIFF block at `tiff_start`.
+
+    entries is a list of (entry_offset, tag, type, count) with absolute offsets.
+    """
+    order = "<" if data[tiff_start:tiff_start + 2] == b"II" else ">"
+    ifd0_offset = struct.unpack(order + "I", data[tiff_start + 4:tiff_start + 8])[0]
+    position = tiff_start + ifd0_offset
+    count = struct.unpack(order + "H", data[position:position + 2])[0]
+    entries = []
+    for i in range(count):
+        entry_offset = position + 2 + i * 12
+        tag, field_type, value_count = struct.unpack(order + "HHI", data[entry_offset:entry_offset + 8])
+        entries.append((entry_offset, tag, field_type, value_count))
+    return order, ifd0_offset, entries
+
+
+def get_jpeg_orientation(data):
+    """Returns the EXIF Orientation of in-memory JPEG data, or None if it has none."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    try:
+        _, _, orientation = read_capture_metadata_from_bytes(data)
+    except FastPathError:
+        return None
+    return orientation
+
+
+def _minimal_exif_segment(orientation):
+    """Builds an APP1 Exif segment whose IFD0 only holds the Orientation tag."""
+    tiff = b"MM\x00\x2a" + struct.pack(">I", 8) + struct.pack(">H", 1) + \
+        struct.pack(">HHIHH", TAG_ORIENTATION, TYPE_SHORT, 1, orientation, 0) + struct.pack(">I", 0)
+    payload = b"Exif\0\0" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def set_jpeg_orientation(data, orientation):
+    """Returns a copy of JPEG `data` with its EXIF Orientation set to `orientation`.
+
+    The compressed image data is copied unchanged. If the file has an EXIF
+    Orientation entry it is patched in place; if it has EXIF without one, a new
+    IFD0 with the extra entry is appended to the TIFF block (existing offsets
+    stay valid); otherwise a minimal EXIF segment is inserted after SOI.
+    """
+    segment = _find_exif_segment(data)
+    if segment is None:
+        return data[:2] + _minimal_exif_segment(orientation) + data[2:]
+
+    segment_offset, segment_length = segment
+    tiff_start = segment_offset + 10
+    segment_end = segment_offset + 2 + segment_length
+    order, _, entries = _tiff_ifd0(data, tiff_start)
+
+    for entry_offset, tag, field_type, value_count in entries:
+        if tag == TAG_ORIENTATION and field_type == TYPE_SHORT and value_count == 1:
+            patched = bytearray(data)
+            patched[entry_offset + 8:entry_offset + 10] = struct.pack(order + "H", orientation)
+            return bytes(patched)
+
+    # Append a rebuilt IFD0 (old entries + Orientation) to the end of the TIFF block
+    tiff = data[tiff_start:segment_end]
+    new_entries = [data[entry_offset:entry_offset + 12] for entry_offset, tag, _, _ in entries if tag != TAG_ORIENTATION]
+    new_entries.append(struct.pack(order + "HHIHH", TAG_ORIENTATION, TYPE_SHORT, 1, orientation, 0))
+    new_entries.sort(key=lambda entry: struct.unpack(order + "H", entry[:2])[0])
+    old_ifd_end = entries[-1][0] + 12 if entries else tiff_start + struct.unpack(order + "I", tiff[4:8])[0] + 2
+    next_ifd = data[old_ifd_end:old_ifd_end + 4]
+
+    padding = b"\0" * (len(tiff) % 2) # IFDs start on a word boundary
+    new_ifd0_offset = len(tiff) + len(padding)
+    new_tiff = tiff[:4] + struct.pack(order + "I", new_ifd0_offset) + tiff[8:] + padding + \
+        struct.pack(order + "H", len(new_entries)) + b"".join(new_entries) + next_ifd
+    payload = b"Exif\0\0" + new_tiff
+    if len(payload) + 2 > 0xFFFF:
+        raise FastPathError("EXIF segment too large to extend")
+    return data[:segment_offset] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + data[segment_end:]
+
+
+def lossless_transform(data, orientation):
+    """Rotates/flips JPEG `data` upright in the DCT domain using jpegtran.
+
+    Returns the transformed JPEG with its Orientation reset to 1, or None if
+    jpegtran isn't installed or the image can't be transformed perfectly
+    (dimensions that aren't a multiple of the MCU size).
+    """
+    transform = _JPEGTRAN_TRANSFORMS.get(orientation)
+    jpegtran = shutil.which("jpegtran")
+    if transform is None or jpegtran is None:
+        return None
+    result = subprocess.run([jpegtran, "-copy", "all", "-perfect"] + transform,
+                            input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0 or not result.stdout:
+        return None
+    # jpegtran copies the EXIF block as is, so it still claims the old orientation
+    return set_jpeg_orientation(result.stdout, 1)
@@ -0,0 +1,99 @@
+"""Thread-safe, bounded log buffer that a UI drains in batches.
+
+Worker threads call put() (and progress()), which only appends to a deque
+under a lock. The UI calls drain() on a fixed timer and appends everything it
+gets back in one go, instead of handling one event per log line.
+
+Per-file "detail" lines (e.g. "Renamed: 'a' to 'b'") can be collapsed: they are
+still written to the log file, but on screen they are replaced by a periodic
+progress summary.
+"""
+
+import collections
+import threading
+import time
+
+DEFAULT_MAX_LINES = 2000
+DEFAULT_SUMMARY_INTERVAL = 1.0
+
+
+class LogQueue:
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, collapse_details=True, summary_interval=DEFAULT_SUMMARY_INTERVAL):
+        self.max_lines = max_lines
+        self.collapse_details = collapse_details
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        # Only the last max_lines lines could ever be shown, so older ones are dropped
+        self._pending = collections.deque(maxlen=max_lines)
+        self._log_file = None
+        self._hidden_details = 0
+        self._progress = None
+        self._progress_changed = False
+        self._last_summary_time = 0.0
+
+    def put(self, message, detail=False):
+        """Queues a log message. Safe to call from any thread."""
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.write(message + "\n")
+            if detail and self.collapse_details:
+                self._hidden_details += 1
+            else:
+                self._pending.append(message)
+
+    def progress(self, stage, done, total):
+        """Records the latest progress of a job, used for the collapsed summary."""
+        with self._lock:
+            self._progress = (stage, done, total)
+            self._progress_changed = True
+
+    def drain(self, force_summary=False):
+        """Returns the lines queued since the last call, oldest first.
+
+        When per-file lines are collapsed, a progress summary line is added
+        at most once per `summary_interval` seconds (or now, if `force_summary`).
+        """
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+
+            now = time.monotonic()
+            if (self._hidden_details or self._progress_changed) and \
+                    (force_summary or now - self._last_summary_time >= self.summary_interval):
+                summary = self._summary_line()
+                if summary:
+                    lines.append(summary)
+                self._hidden_details = 0
+                self._progress_changed = False
+                self._last_summary_time = now
+
+            if self._log_file is not None:
+                self._log_file.flush()
+        return lines[-self.max_lines:]
+
+    def _summary_line(self):
+        if self._progress is not None and self._progress_changed:
+            stage, done, total = self._progress
+            if total is None:
+                return f"Progress ({stage}): {done} files"
+            percent = done * 100 // total if total else 100
+            return f"Progress ({stage}): {done}/{total} files ({percent}%)"
+        if self._hidden_details:
+            return f"... {self._hidden_details} more file(s) processed."
+        return None
+
+    def set_collapse_details(self, collapse_details):
+        with self._lock:
+            self.collapse_details = collapse_details
+
+    def set_log_file(self, path):
+        """Streams the full log (including detail lines) to `path`, or stops if None."""
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+            if path:
+                self._log_file = open(path, "a", encoding="utf-8")
+
+    def close(self):
+        self.set_log_file(None)
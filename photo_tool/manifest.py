@@ -0,0 +1,263 @@
+"""Record of what was converted into an export folder, for incremental runs.
+
+The manifest lives in the export folder itself and maps each source RAW
+(by path relative to the converted folder, size and mtime) to the outputs it
+produced, one per export profile (path relative to the export folder, size,
+SHA-256 checksum), and the conversion settings used. A file is skipped only
+if its manifest entry matches the source, the settings, and the sizes of
+the outputs actually found on disk. Everything else (changed RAWs, changed settings, outputs that were
+deleted or truncated, outputs left by older versions without a manifest) is
+converted again.
+
+It is stored as JSON rather than SQLite because export folders often live on
+network shares, where SQLite's locking is unreliable. New records are
+appended to a log next to it every SAVE_INTERVAL records, so an interrupted
+run keeps most of its progress without rewriting the whole manifest each
+time (which would make a large job quadratic). At the end of a job,
+compact() folds the log into the manifest, which is replaced atomically;
+a log left by an interrupted run is replayed on load.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILENAME = ".photo_tool_manifest.json"
+# Records since the last compact(), one JSON object per line
+LOG_FILENAME = ".photo_tool_manifest.log"
+MANIFEST_VERSION = 2
+SAVE_INTERVAL = 200
+
+# Suffix of outputs that are still being written; see temporary_path()
+TEMP_SUFFIX = ".partial"
+# Allowed clock difference between this machine and a file server, for the age of temporary files
+TEMP_CLOCK_SLACK_SECONDS = 120
+
+# Temporary files last written before this are left over from runs that ended; newer ones may
+# belong to a conversion still running in another process (e.g. a watch of the same folder)
+_STALE_BEFORE_NS = time.time_ns() - TEMP_CLOCK_SLACK_SECONDS * 1_000_000_000
+
+_CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# (size, checksum) of temporary outputs written by write_output() in this process, until they are committed
+_written = {}
+
+
+def temporary_path(output_file):
+    """Returns the path an output is written to before being renamed into place."""
+    directory, filename = os.path.split(output_file)
+    return os.path.join(directory, f".{filename}{TEMP_SUFFIX}")
+
+
+def is_temporary_file(filename):
+    return filename.startswith(".") and filename.endswith(TEMP_SUFFIX)
+
+
+def is_stale_temporary_file(filename, mtime_ns):
+    """Whether a temporary file was left by an interrupted run and can be removed, rather than still being written."""
+    return is_temporary_file(filename) and mtime_ns < _STALE_BEFORE_NS
+
+
+def file_checksum(path):
+    """Returns the hex SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_output(temp_file, *chunks):
+    """Writes an output's encoded bytes to its temporary file, hashing them on the way.
+
+    commit_output() then takes the checksum from here instead of reading the file back.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_file, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += f.write(chunk)
+    except BaseException:
+        _written.pop(temp_file, None)
+        raise
+    _written[temp_file] = (size, digest.hexdigest())
+
+
+def discard_output(temp_file):
+    """Removes a temporary output that won't be committed, e.g. after a failed conversion."""
+    _written.pop(temp_file, None)
+    try:
+        os.remove(temp_file)
+    except OSError:
+        pass # Never written, or already gone
+
+
+def commit_output(temp_file, output_file):
+    """Moves a finished temporary output into place.
+
+    Returns the (size, checksum) of the output, as hashed by write_output(),
+    or read from disk if it was written otherwise. The rename is atomic, so
+    `output_file` either doesn't exist or is complete.
+    """
+    written = _written.pop(temp_file, None)
+    if written is None:
+        written = (os.path.getsize(temp_file), file_checksum(temp_file))
+    os.replace(temp_file, output_file)
+    return written
+
+
+class ConversionManifest:
+    """The conversion manifest of one export folder.
+
+    `source_folder` is the folder the RAWs are converted from; source paths
+    are stored relative to it and output paths relative to `export_folder`,
+    so the whole tree can be moved or mounted elsewhere without invalidating it.
+    """
+
+    def __init__(self, source_folder, export_folder, entries=None):
+        self.source_folder = source_folder
+        self.export_folder = export_folder
+        self.path = os.path.join(export_folder, MANIFEST_FILENAME)
+        self.log_path = os.path.join(export_folder, LOG_FILENAME)
+        self.entries = entries if entries is not None else {}
+        self._unsaved = [] # Source keys recorded since the last save()
+        self._logged = False # Whether the log has records not compacted into the manifest yet
+
+    @classmethod
+    def load(cls, source_folder, export_folder):
+        """Loads the manifest of `export_folder`, or starts an empty one.
+
+        Raises ValueError if the manifest exists but can't be read (the
+        caller can then start over with an empty one).
+        """
+        manifest = cls(source_folder, export_folder)
+        try:
+            with open(manifest.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"version": MANIFEST_VERSION, "entries": {}}
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Could not read conversion manifest '{manifest.path}': {e}") from e
+        if data.get("version") == MANIFEST_VERSION and isinstance(data.get("entries"), dict):
+            manifest.entries = data["entries"]
+        elif data.get("version") == 1 and isinstance(data.get("entries"), dict):
+            # Version 1 entries had a single output
+            try:
+                manifest.entries = {
+                    source: {"size": entry["size"], "mtime_ns": entry["mtime_ns"], "settings": entry["settings"],
+                             "outputs": [[entry["output"], entry["output_size"], entry["checksum"]]]}
+                    for source, entry in data["entries"].items()
+                }
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Could not read conversion manifest '{manifest.path}': {e}") from e
+        manifest._replay_log()
+        return manifest
+
+    def _replay_log(self):
+        """Applies the records of the log left by an earlier run that wasn't compacted."""
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            raise ValueError(f"Could not read conversion manifest log '{self.log_path}': {e}") from e
+        for line_number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+                source = record.pop("source")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                if line_number == len(lines):
+                    break # Cut off by a crash while it was being written
+                raise ValueError(f"Conversion manifest log '{self.log_path}' is damaged at line {line_number}.")
+            self.entries[source] = record
+        self._logged = True
+
+    def _source_key(self, source_path):
+        return os.path.relpath(source_path, self.source_folder).replace(os.sep, "/")
+
+    def output_key(self, output_file):
+        """Returns how an output path is stored: relative to the export folder, with '/' separators."""
+        return os.path.relpath(output_file, self.export_folder).replace(os.sep, "/")
+
+    def output_for(self, source_path, size, mtime_ns, settings, output_sizes):
+        """Returns the first recorded output of an unchanged source, or None if it must be converted.
+
+        `output_sizes` maps output paths (relative to the export folder, with
+        '/' separators) to the sizes found on disk, from a single scan of the
+        export folder.
+        """
+        entry = self.entries.get(self._source_key(source_path))
+        if entry is None or entry["size"] != size or entry["mtime_ns"] != mtime_ns or entry["settings"] != settings:
+            return None
+        if any(output_sizes.get(output) != output_size for output, output_size, _ in entry["outputs"]):
+            return None
+        return os.path.join(self.export_folder, *entry["outputs"][0][0].split("/"))
+
+    def record(self, source_path, size, mtime_ns, settings, outputs):
+        """Records a finished conversion, saving it every SAVE_INTERVAL records.
+
+        `outputs` holds an (output_file, output_size, checksum) tuple per output.
+        """
+        source_key = self._source_key(source_path)
+        self.entries[source_key] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "settings": settings,
+            "outputs": [[self.output_key(output_file), output_size, checksum]
+                        for output_file, output_size, checksum in outputs],
+        }
+        self._unsaved.append(source_key)
+        if len(self._unsaved) >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """Appends the records since the last save to the log; the cost only depends on their number."""
+        if not self._unsaved:
+            return
+        lines = "".join(json.dumps({"source": source_key, **self.entries[source_key]}, separators=(",", ":")) + "\n"
+                        for source_key in dict.fromkeys(self._unsaved))
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self._unsaved = []
+        self._logged = True
+
+    def compact(self):
+        """Atomically writes the whole manifest and removes the log; called once at the end of a job."""
+        if not self._unsaved and not self._logged:
+            return
+        temp_file = temporary_path(self.path)
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, separators=(",", ":"))
+        os.replace(temp_file, self.path)
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self._unsaved = []
+        self._logged = False
+
+
+def scan_outputs(export_folder):
+    """Scans an export folder once.
+
+    Returns ({relative output path: size}, [leftover temporary files]).
+    Only temporary files last written before this process started count as
+    leftovers (see is_stale_temporary_file()); others are ignored.
+    """
+    from photo_tool.discovery import scan_files
+
+    output_sizes = {}
+    leftovers = []
+    if not os.path.isdir(export_folder):
+        return output_sizes, leftovers
+    for entry in scan_files(export_folder, recursive=True, excluded_dirs=()):
+        if is_temporary_file(entry.name):
+            if is_stale_temporary_file(entry.name, entry.mtime_ns):
+                leftovers.append(entry.path)
+        elif entry.name not in (MANIFEST_FILENAME, LOG_FILENAME):
+            output_sizes[os.path.relpath(entry.path, export_folder).replace(os.sep, "/")] = entry.size
+    return output_sizes, leftovers
@@ -0,0 +1,155 @@
+"""Persistent cache of EXIF capture metadata, stored in SQLite.
+
+Entries are keyed by absolute path and validated against the file's size and
+mtime_ns, so a file that changed on disk is simply treated as a miss and read
+again. The cache holds at most `max_entries` rows; when it grows past that the
+least recently used rows are evicted.
+"""
+
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_FILENAME = "metadata_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+
+# SQLite limits the number of host parameters in a single statement
+_QUERY_CHUNK_SIZE = 500
+
+
+class MetadataCache:
+    """SQLite-backed cache of (date_original, date_digitized, orientation) per file.
+
+    Dates are stored as the raw EXIF strings ('YYYY:MM:DD HH:MM:SS') or None.
+    Files without any EXIF metadata are cached too, so they aren't re-read
+    on every run.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS exif_metadata ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " date_original TEXT,"
+            " date_digitized TEXT,"
+            " orientation INTEGER,"
+            " last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS exif_metadata_last_used ON exif_metadata (last_used)")
+        self._connection.commit()
+
+    @classmethod
+    def open_default(cls, config_dir, max_entries=DEFAULT_MAX_ENTRIES):
+        """Opens (creating if needed) the cache file inside the user config folder."""
+        os.makedirs(config_dir, exist_ok=True)
+        return cls(os.path.join(config_dir, DEFAULT_CACHE_FILENAME), max_entries)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_many(self, keys):
+        """Looks up metadata for many files at once.
+
+        `keys` is an iterable of (path, size, mtime_ns) tuples. Returns a dict
+        mapping each path that has a valid entry to its
+        (date_original, date_digitized, orientation) tuple. Entries whose size
+        or mtime no longer match are ignored and count as misses.
+        """
+        keys = [(os.path.abspath(path), size, mtime_ns) for path, size, mtime_ns in keys]
+        results = {}
+        for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + _QUERY_CHUNK_SIZE]
+            wanted = {path: (size, mtime_ns) for path, size, mtime_ns in chunk}
+            placeholders = ",".join("?" * len(wanted))
+            rows = self._connection.execute(
+                f"SELECT path, size, mtime_ns, date_original, date_digitized, orientation"
+                f" FROM exif_metadata WHERE path IN ({placeholders})",
+                list(wanted),
+            )
+            for path, size, mtime_ns, date_original, date_digitized, orientation in rows:
+                if wanted[path] == (size, mtime_ns):
+                    results[path] = (date_original, date_digitized, orientation)
+
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+        if results:
+            now = time.time_ns()
+            self._connection.executemany("UPDATE exif_metadata SET last_used = ? WHERE path = ?",
+                                         [(now, path) for path in results])
+            self._connection.commit()
+        return results
+
+    def put_many(self, entries):
+        """Stores metadata for many files at once.
+
+        `entries` is an iterable of
+        (path, size, mtime_ns, date_original, date_digitized, orientation) tuples.
+        """
+        now = time.time_ns()
+        rows = [(os.path.abspath(path), size, mtime_ns, date_original, date_digitized, orientation, now)
+                for path, size, mtime_ns, date_original, date_digitized, orientation in entries]
+        if not rows:
+            return
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO exif_metadata"
+            " (path, size, mtime_ns, date_original, date_digitized, orientation, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._evict()
+        self._connection.commit()
+
+    def move_many(self, moves):
+        """Re-keys entries for renamed files.
+
+        `moves` is an iterable of (old_path, new_path) pairs. Renaming keeps a
+        file's size and mtime, so its cached metadata stays valid.
+        """
+        moves = {os.path.abspath(old_path): os.path.abspath(new_path) for old_path, new_path in moves}
+        if not moves:
+            return
+        # Read everything first so chains like a -> b, b -> c don't clobber each other
+        rows = []
+        old_paths = list(moves)
+        for start in range(0, len(old_paths), _QUERY_CHUNK_SIZE):
+            chunk = old_paths[start:start + _QUERY_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(self._connection.execute(
+                f"SELECT path, size, mtime_ns, date_original, date_digitized, orientation, last_used"
+                f" FROM exif_metadata WHERE path IN ({placeholders})",
+                chunk,
+            ))
+        self._connection.executemany("DELETE FROM exif_metadata WHERE path = ?",
+                                     [(path,) for path in set(moves) | set(moves.values())])
+        self._connection.executemany(
+            "INSERT INTO exif_metadata"
+            " (path, size, mtime_ns, date_original, date_digitized, orientation, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(moves[row[0]],) + tuple(row[1:]) for row in rows],
+        )
+        self._connection.commit()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM exif_metadata").fetchone()[0]
+
+    def _evict(self):
+        """Deletes the least recently used entries beyond `max_entries`."""
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM exif_metadata WHERE path IN"
+                " (SELECT path FROM exif_metadata ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
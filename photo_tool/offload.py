@@ -0,0 +1,279 @@
+"""Card offload: copy, verify and rename files in one streaming pass.
+
+Importing a card used to take three passes over every byte: copying the
+card with another tool, renaming the copy, then converting it. An offload
+reads each file from the card once, writes it straight to its final
+'{base}_{NN}' name in the destination (numbered by the usual sort options,
+see core.plan_renames), and hashes the bytes while they pass through, so
+the copy can be verified without reading the card again. RAW files can be
+handed to the conversion together with their content while it is still in
+memory, so converting them doesn't read them again either.
+
+Files are written to a temporary name, flushed to disk and only then
+renamed into place, so an unplugged drive or a crash never leaves a
+truncated file under a final name. With verification on, the written file
+is dropped from the page cache and read back, and its hash must match the
+one taken during the copy. Files whose target already exists with the same
+size and modification time count as copied before, so an interrupted
+offload can simply be run again.
+
+Copies run on a few threads per device: cards and USB readers slow down
+when read in parallel, while SSDs and RAIDs as destinations keep up with
+several writers. Both limits can be set per job.
+"""
+
+import collections
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from photo_tool.discovery import FileEntry
+
+# Concurrent copies reading from one device (cards seek badly) and writing to one device
+DEFAULT_READS_PER_DEVICE = 1
+DEFAULT_WRITES_PER_DEVICE = 2
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class OffloadedFile(FileEntry):
+    """A copied file, with its content (`data`) if it is kept in memory for the conversion."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, path, name, size, mtime_ns, ctime, data=None):
+        super().__init__(path, name, size, mtime_ns, ctime)
+        self.data = data
+
+
+def _drop_cache(fd):
+    # Without this, reading back a file just written would only read the page cache
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _file_checksum(path):
+    """Returns the 'algorithm:hexdigest' of a file as it is on disk."""
+    from photo_tool.contentindex import new_hash
+
+    algorithm, digest = new_hash()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        _drop_cache(fd)
+        buffer = bytearray(COPY_BUFFER_SIZE)
+        with open(fd, "rb", buffering=0, closefd=False) as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                digest.update(memoryview(buffer)[:count])
+    finally:
+        os.close(fd)
+    return f"{algorithm}:{digest.hexdigest()}"
+
+
+def copy_file(source, target, verify=True, keep_data=False, trace=None):
+    """Copies `source` to `target`, hashing the content as it is read.
+
+    The copy goes to a temporary file that is fsynced, given the source's
+    modification time and then renamed to `target`; with `verify`, it is
+    read back from disk first and must have the same hash. Returns a
+    (checksum, data) pair, where data is the file's content if `keep_data`
+    and None otherwise. Raises OSError if the copy fails or doesn't verify.
+
+    The bytes go through user space (in COPY_BUFFER_SIZE chunks) rather
+    than copy_file_range() or sendfile(), as they have to be hashed anyway.
+    """
+    from photo_tool.contentindex import new_hash
+    from photo_tool.instrument import JobTrace
+    from photo_tool.manifest import temporary_path
+
+    trace = trace or JobTrace("offload", enabled=False)
+    temp_file = temporary_path(target)
+    algorithm, digest = new_hash()
+    data = None
+    try:
+        with open(source, "rb", buffering=0) as src:
+            source_stat = os.fstat(src.fileno())
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                with trace.stage("copy"):
+                    if keep_data:
+                        data = src.read()
+                        digest.update(data)
+                        _write_all(fd, data)
+                    else:
+                        buffer = bytearray(COPY_BUFFER_SIZE)
+                        while True:
+                            count = src.readinto(buffer)
+                            if not count:
+                                break
+                            chunk = memoryview(buffer)[:count]
+                            digest.update(chunk)
+                            _write_all(fd, chunk)
+                with trace.stage("sync"):
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        os.utime(temp_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        checksum = f"{algorithm}:{digest.hexdigest()}"
+        if verify:
+            with trace.stage("verify"):
+                written_checksum = _file_checksum(temp_file)
+            if written_checksum != checksum:
+                raise OSError(f"The copy of '{source}' doesn't match the original (checksum {written_checksum}, "
+                              f"expected {checksum})")
+        os.replace(temp_file, target)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass # Never created
+        raise
+    return checksum, data
+
+
+def plan_offload(files, destination_folder, new_base_name, sort_method, log=None, use_cache=True, file_info=None):
+    """Returns the (source_path, target_path) pairs of an offload, in sorted order.
+
+    Files are numbered as core.plan_renames() would number them, and all
+    go directly into `destination_folder`, also those from subfolders.
+    """
+    from photo_tool.core import plan_renames
+
+    plan = plan_renames(files, new_base_name, sort_method, log, use_cache, file_info)
+    return [(source_path, os.path.join(destination_folder, os.path.basename(target_path)))
+            for source_path, target_path in plan]
+
+
+def split_copied(plan, file_info=None):
+    """Splits `plan` into the moves still to copy and those whose target is already a copy of the source.
+
+    A target counts as a copy if it has the source's size and modification
+    time (which copy_file() keeps), i.e. it was copied by an earlier,
+    possibly interrupted, offload.
+    """
+    to_copy = []
+    copied = []
+    for source_path, target_path in plan:
+        entry = file_info.get(source_path) if file_info else None
+        try:
+            target_stat = os.stat(target_path)
+            if entry is None:
+                entry = FileEntry.from_path(source_path)
+        except OSError:
+            to_copy.append((source_path, target_path))
+            continue
+        if target_stat.st_size == entry.size and target_stat.st_mtime_ns == entry.mtime_ns:
+            copied.append((source_path, target_path))
+        else:
+            to_copy.append((source_path, target_path))
+    return to_copy, copied
+
+
+def remove_leftovers(destination_folder):
+    """Removes temporary files left in `destination_folder` by an interrupted offload. Returns how many.
+
+    Temporary files written since this process started may belong to another
+    offload to the same folder that is still running, and are kept.
+    """
+    from photo_tool.manifest import is_stale_temporary_file, is_temporary_file
+
+    removed = 0
+    leftovers = []
+    try:
+        with os.scandir(destination_folder) as iterator:
+            for dir_entry in iterator:
+                if is_temporary_file(dir_entry.name):
+                    try:
+                        if is_stale_temporary_file(dir_entry.name, dir_entry.stat().st_mtime_ns):
+                            leftovers.append(dir_entry.path)
+                    except OSError:
+                        pass # Committed or removed meanwhile
+    except OSError:
+        return 0
+    for leftover in leftovers:
+        try:
+            os.remove(leftover)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _device(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None # Reported when the copy fails
+
+
+def run_offload(plan, on_copied, reads_per_device=DEFAULT_READS_PER_DEVICE, writes_per_device=DEFAULT_WRITES_PER_DEVICE,
+                verify=True, keep_data=None, trace=None, cancel_event=None):
+    """Copies the (source_path, target_path) moves of `plan` and blocks until all are done.
+
+    Every source device gets `reads_per_device` copy threads, which take its
+    files in plan order; at most `writes_per_device` copies write to any one
+    destination device at a time. `keep_data(source_path, size)` says whether
+    a file's content should be kept in memory. As each copy finishes,
+    `on_copied(source_path, target_path, result, error)` is called on the
+    copying thread, with result an OffloadedFile (error None) or None and
+    the OSError. Once `cancel_event` is set, the remaining files are left
+    out (neither callback nor count). Returns a (copied_count, failed_count) pair.
+    """
+    from photo_tool.instrument import JobTrace
+
+    trace = trace or JobTrace("offload", enabled=False)
+    folder_devices = {}
+
+    def device_of(path):
+        folder = os.path.dirname(path)
+        if folder not in folder_devices:
+            folder_devices[folder] = _device(folder)
+        return folder_devices[folder]
+
+    by_source_device = collections.defaultdict(list)
+    for source_path, target_path in plan:
+        by_source_device[device_of(source_path)].append((source_path, target_path))
+    write_slots = {device_of(target_path): threading.BoundedSemaphore(writes_per_device) for _, target_path in plan}
+
+    counts = {"copied": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def copy_one(source_path, target_path, write_slot):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        try:
+            size = os.path.getsize(source_path)
+            with write_slot:
+                _, data = copy_file(source_path, target_path, verify,
+                                    keep_data is not None and keep_data(source_path, size), trace)
+            target_stat = os.stat(target_path)
+            result = OffloadedFile(target_path, os.path.basename(target_path), target_stat.st_size,
+                                   target_stat.st_mtime_ns, target_stat.st_ctime, data)
+            error = None
+        except OSError as e:
+            result, error = None, e
+        with counts_lock:
+            counts["failed" if error else "copied"] += 1
+        on_copied(source_path, target_path, result, error)
+
+    with contextlib.ExitStack() as stack:
+        futures = []
+        for moves in by_source_device.values():
+            pool = stack.enter_context(ThreadPoolExecutor(max_workers=max(1, reads_per_device),
+                                                          thread_name_prefix="offload"))
+            for source_path, target_path in moves:
+                futures.append(pool.submit(copy_one, source_path, target_path, write_slots[device_of(target_path)]))
+    for future in futures:
+        future.result() # Re-raises errors in on_copied
+    return counts["copied"], counts["failed"]
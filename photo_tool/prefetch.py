@@ -0,0 +1,121 @@
+"""Read-ahead stage that overlaps file reads with conversion work.
+
+Without it, each RAW file is read by LibRaw only when a worker starts on
+it, so on slow storage (SD cards, USB readers, SMB shares) the workers sit
+idle while the file is read. Prefetcher reads the next files of a job
+stream into memory on background threads while the current ones are being
+converted, and hands each job on together with its file's content.
+
+Read-ahead is bounded both by a number of files and by a byte cap. The
+cap covers a file's content until the consumer calls release() for it,
+i.e. also while it sits in a conversion worker's queue, not just until it
+is handed on. A single file larger than the cap is still read, but only
+when nothing else is held.
+"""
+
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PREFETCH_FILES = 4
+DEFAULT_PREFETCH_MB = 256
+# Several reads in flight help on network shares; more only add seeking on cards
+READ_THREADS = 2
+
+
+def _read_file(path, trace):
+    """Returns the content of a file, or None if it can't be read (the converter then reports the error)."""
+    with trace.stage("read"):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+class Prefetcher:
+    """Wraps an iterable of (path, ...) jobs and yields each job with the file's content appended.
+
+    Jobs are yielded in their original order, as (path, ..., data) tuples.
+    Jobs of three items already carry their data and are passed on as they are.
+    A job of None means no file is ready upstream yet: the files already
+    being read are handed on without waiting for more, or None is passed on
+    if there are none.
+    `size_of(path)` returns a file's size for the byte cap if it is already
+    known, or None to stat the file; reads are timed as "read" stages in `trace`.
+
+    The consumer calls release(path) once it no longer holds a yielded
+    file's content. While the cap is used up by content not released yet,
+    None is yielded instead of waiting, so a consumer like
+    core.RawConversionEngine can finish (and release) files in the meantime.
+    """
+
+    def __init__(self, jobs, max_files=DEFAULT_PREFETCH_FILES, max_bytes=DEFAULT_PREFETCH_MB * 1024 ** 2,
+                 size_of=None, trace=None, read_threads=READ_THREADS):
+        from photo_tool.instrument import JobTrace
+
+        self.jobs = jobs
+        self.max_files = max(1, max_files)
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.trace = trace or JobTrace("prefetch", enabled=False)
+        self.read_threads = read_threads
+        self.buffered_bytes = 0 # Read or being read, and not released yet
+        self._held = {} # path: bytes of yielded content until release()
+
+    def _file_size(self, path):
+        size = self.size_of(path) if self.size_of else None
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+        return size
+
+    def __iter__(self):
+        jobs = iter(self.jobs)
+        pending = collections.deque() # (job, future, size), in job order
+        waiting = None # Next job, held back until it fits under the byte cap
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.read_threads) as pool:
+            while True:
+                while len(pending) < self.max_files:
+                    if waiting is None:
+                        if exhausted:
+                            break
+                        try:
+                            job = next(jobs)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if job is None:
+                            break # Nothing ready upstream; hand on what is already being read
+                        waiting = (job, self._file_size(job[0]) if len(job) < 3 else 0)
+                    job, size = waiting
+                    if len(job) > 2:
+                        pending.append((job, None, 0))
+                        waiting = None
+                        continue
+                    if self.buffered_bytes and self.buffered_bytes + size > self.max_bytes:
+                        break
+                    self.buffered_bytes += size
+                    pending.append((job, pool.submit(_read_file, job[0], self.trace), size))
+                    waiting = None
+
+                if not pending:
+                    if exhausted and waiting is None:
+                        break
+                    yield None # Over the cap until the consumer releases something, or nothing ready upstream
+                    continue
+
+                job, future, size = pending.popleft()
+                if future is None:
+                    yield tuple(job)
+                    continue
+                data = future.result()
+                self._held[job[0]] = self._held.get(job[0], 0) + size
+                yield tuple(job) + (data,)
+
+    def release(self, path):
+        """Gives the byte cap back the content of a yielded file, once the consumer is done with it."""
+        self.buffered_bytes -= self._held.pop(path, 0)
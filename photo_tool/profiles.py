@@ -0,0 +1,163 @@
+"""Named export profiles: output size, JPEG encoder settings and subfolder.
+
+A conversion can write several outputs per RAW file, one per profile (e.g. a
+full-size JPG plus 2048 px web and 400 px proofing versions). All of them
+are made from a single decode of the embedded preview (or a single RAW
+development): when every requested size is at most half the preview's,
+the preview is decoded in JPEG draft mode, which scales it down by 1/2,
+1/4 or 1/8 inside the DCT instead of decoding every pixel, and each output
+is then resized from that one image.
+
+Besides the built-in profiles, users can define their own in
+'export_profiles.json' in the config folder:
+
+    {"print": {"max_edge": 3000, "quality": 92, "subfolder": "print"}}
+"""
+
+import io
+import json
+import os
+
+PROFILES_FILENAME = "export_profiles.json"
+
+DEFAULT_QUALITY = 95
+
+
+class ExportProfile:
+    """One output per RAW file.
+
+    max_edge: longest edge in pixels, or None for the full size (never enlarged).
+    quality, progressive, optimize: JPEG encoder settings. optimize=False
+        skips Pillow's extra pass computing optimal Huffman tables, which
+        makes encoding noticeably faster for slightly larger files.
+    subfolder: where the outputs go inside 'exported_jpg' ('' for the export folder itself).
+    """
+
+    def __init__(self, name, max_edge=None, quality=DEFAULT_QUALITY, progressive=False, optimize=True, subfolder=""):
+        self.name = name
+        self.max_edge = max_edge
+        self.quality = quality
+        self.progressive = progressive
+        self.optimize = optimize
+        self.subfolder = subfolder
+
+    @classmethod
+    def from_dict(cls, name, data):
+        """Builds a profile from its JSON form; raises ValueError if a setting is invalid."""
+        unknown = set(data) - {"max_edge", "quality", "progressive", "optimize", "subfolder"}
+        if unknown:
+            raise ValueError(f"Export profile '{name}' has unknown setting(s): {', '.join(sorted(unknown))}")
+        max_edge = data.get("max_edge")
+        quality = data.get("quality", DEFAULT_QUALITY)
+        subfolder = data.get("subfolder", name)
+        if max_edge is not None and (not isinstance(max_edge, int) or max_edge < 1):
+            raise ValueError(f"Export profile '{name}': max_edge must be a positive whole number or null")
+        if not isinstance(quality, int) or not 1 <= quality <= 100:
+            raise ValueError(f"Export profile '{name}': quality must be a whole number from 1 to 100")
+        if not isinstance(subfolder, str) or os.path.isabs(subfolder) or os.pardir in subfolder.replace("\\", "/").split("/"):
+            raise ValueError(f"Export profile '{name}': subfolder must be a folder name inside the export folder")
+        return cls(name, max_edge, quality, bool(data.get("progressive", False)), bool(data.get("optimize", True)),
+                   subfolder)
+
+    def settings(self):
+        """Returns the settings that affect the output, as recorded in the conversion manifest."""
+        return {"max_edge": self.max_edge, "quality": self.quality, "progressive": self.progressive,
+                "optimize": self.optimize, "subfolder": self.subfolder}
+
+    def target_size(self, size):
+        """Returns the (width, height) an image of `size` is exported at."""
+        width, height = size
+        if self.max_edge is None or max(width, height) <= self.max_edge:
+            return size
+        scale = self.max_edge / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def __repr__(self):
+        return f"ExportProfile({self.name!r}, max_edge={self.max_edge}, quality={self.quality})"
+
+
+PROFILE_FULL = ExportProfile("full")
+
+BUILTIN_PROFILES = {
+    profile.name: profile for profile in (
+        PROFILE_FULL,
+        # Full size without the Huffman optimization pass
+        ExportProfile("fast", optimize=False),
+        ExportProfile("web", max_edge=2048, quality=85, progressive=True, subfolder="web_2048"),
+        ExportProfile("proof", max_edge=400, quality=80, subfolder="proof_400"),
+    )
+}
+
+
+def load_profiles(config_dir):
+    """Returns {name: ExportProfile}: the built-in profiles plus those in the config folder's profile file.
+
+    Raises ValueError if the profile file exists but is invalid.
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    path = os.path.join(config_dir, PROFILES_FILENAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return profiles
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read export profiles '{path}': {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError(f"Could not read export profiles '{path}': expected an object of named profiles")
+    for name, settings in data.items():
+        if not isinstance(settings, dict):
+            raise ValueError(f"Export profile '{name}' in '{path}' must be an object")
+        profiles[name] = ExportProfile.from_dict(name, settings)
+    return profiles
+
+
+def check_profiles(profiles):
+    """Raises ValueError if `profiles` is empty or two of them would write to the same folder."""
+    if not profiles:
+        raise ValueError("Select at least one export profile.")
+    folders = {}
+    for profile in profiles:
+        folder = os.path.normpath(profile.subfolder or os.curdir)
+        if folder in folders:
+            raise ValueError(f"Export profiles '{folders[folder]}' and '{profile.name}' would write to the same folder.")
+        folders[folder] = profile.name
+
+
+def draft_size(image_size, profiles):
+    """Returns the size to pass to Image.draft() for `profiles`, or None to decode at full size.
+
+    Draft mode only pays off (and JPEG scaling only starts) when every
+    output is at most half the preview's size.
+    """
+    width, height = image_size
+    largest = (0, 0)
+    for profile in profiles:
+        target = profile.target_size(image_size)
+        if target[0] * 2 > width or target[1] * 2 > height:
+            return None
+        largest = max(largest, target)
+    return largest
+
+
+def save_jpeg(image, profile, output_file, recorder):
+    """Resizes a decoded, upright image for `profile` and writes it as a JPEG.
+
+    `recorder` (see photo_tool.instrument) times the resize, encode and write stages.
+    """
+    from PIL import Image
+    from photo_tool.manifest import write_output
+
+    target = profile.target_size(image.size)
+    if target != image.size:
+        with recorder.stage("resize"):
+            # reducing_gap first shrinks by whole factors with a box filter, which is much faster
+            image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    # Encoded in memory first, so encoding and writing are timed separately
+    with recorder.stage("encode"):
+        encoded = io.BytesIO()
+        image.save(encoded, "jpeg", quality=profile.quality, optimize=profile.optimize, progressive=profile.progressive)
+    with recorder.stage("write"):
+        write_output(output_file, encoded.getbuffer())
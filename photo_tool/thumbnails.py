@@ -0,0 +1,126 @@
+"""Small preview thumbnails, decoded lazily on a thread pool and kept in a bounded LRU cache.
+
+Used by the GUI's rename preview, which only asks for the thumbnails of the
+rows currently on screen; requests for rows that scrolled away before their
+turn came are cancelled, so scrolling through a 20,000-file folder decodes
+only what is actually looked at. RAW files are thumbnailed from their
+embedded JPG preview, and JPEGs are decoded in draft mode (scaled down in
+the decoder), so no full-size image is ever decoded.
+"""
+
+import collections
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THUMBNAIL_SIZE = (64, 64)
+DEFAULT_CACHE_MB = 64
+# Decoding releases the GIL in Pillow and LibRaw, and most of the time goes to reading files
+LOADER_THREADS = 4
+
+
+def load_thumbnail(path, size=DEFAULT_THUMBNAIL_SIZE):
+    """Returns an upright RGB PIL image of at most `size`, or None if the file has no usable image."""
+    from PIL import Image, ImageOps
+    from photo_tool.core import is_raw_file
+
+    try:
+        if is_raw_file(path):
+            import rawpy
+
+            with rawpy.imread(path) as raw:
+                embedded_image = raw.extract_thumb()
+            if embedded_image.format != rawpy.ThumbFormat.JPEG:
+                return None
+            image = Image.open(io.BytesIO(embedded_image.data))
+        else:
+            image = Image.open(path)
+        with image:
+            image.draft("RGB", size)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(size)
+            return image.convert("RGB")
+    except Exception: # Anything that can't be opened simply has no thumbnail
+        return None
+
+
+class ThumbnailCache:
+    """Thread-safe LRU cache of thumbnails, bounded by their total pixel memory."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self._images = collections.OrderedDict() # path: (image or None, bytes)
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._images
+
+    def get(self, path):
+        """Returns the cached thumbnail (None for files without one); raises KeyError if not cached."""
+        with self._lock:
+            image, _ = self._images[path]
+            self._images.move_to_end(path)
+            return image
+
+    def put(self, path, image):
+        size = image.width * image.height * len(image.getbands()) if image is not None else 0
+        with self._lock:
+            if path in self._images:
+                self.bytes_used -= self._images.pop(path)[1]
+            self._images[path] = (image, size)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes and len(self._images) > 1:
+                self.bytes_used -= self._images.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.bytes_used = 0
+
+
+class ThumbnailLoader:
+    """Loads thumbnails into a ThumbnailCache in the background.
+
+    `on_loaded(path)` is called from a loader thread after a thumbnail has
+    been cached; GUI callers must hand it over to their main thread.
+    """
+
+    def __init__(self, cache=None, size=DEFAULT_THUMBNAIL_SIZE, on_loaded=None, max_workers=LOADER_THREADS):
+        self.cache = cache or ThumbnailCache()
+        self.size = size
+        self.on_loaded = on_loaded
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnails")
+        self._pending = {} # path: future
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        image = load_thumbnail(path, self.size)
+        self.cache.put(path, image)
+        with self._lock:
+            self._pending.pop(path, None)
+        if self.on_loaded:
+            self.on_loaded(path)
+
+    def request(self, paths):
+        """Queues the thumbnails of `paths` that aren't cached yet, in order.
+
+        Queued requests for other paths that haven't started yet are
+        cancelled, so only what is currently wanted gets decoded.
+        """
+        wanted = set(paths)
+        with self._lock:
+            for path, future in list(self._pending.items()):
+                if path not in wanted and future.cancel():
+                    del self._pending[path]
+            for path in paths:
+                if path not in self._pending and path not in self.cache:
+                    self._pending[path] = self._pool.submit(self._load, path)
+
+    def close(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._pool.shutdown(wait=False)
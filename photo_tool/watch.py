@@ -0,0 +1,539 @@
+"""Hot-folder mode: convert (and optionally rename) RAW files as they arrive.
+
+watch_folder() monitors a folder, with inotify on Linux and by rescanning it
+with os.scandir elsewhere (or on network shares, where inotify doesn't see
+changes made by other machines). A new file is only handled once its size
+and modification time have stayed the same for `settle_seconds`, so files
+still being copied from a card or written by a tethering program aren't
+read half-finished. RAWs are then renamed (if a base name is given,
+numbered on from the highest number already in the folder) and fed to the
+same core.RawConversionEngine as a regular conversion, with the same
+manifest, export folder and output files.
+
+It is meant to run unattended for days, so everything it keeps grows only
+with the folder, not with the running time: remembered files, latency
+samples and trace events are capped, and the worker processes are replaced
+after WORKER_MAX_TASKS conversions so memory leaked by LibRaw is given back.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import heapq
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+
+from photo_tool import core
+from photo_tool.contentindex import DUPLICATES_OFF, WRITE_BATCH_SIZE
+from photo_tool.discovery import DEFAULT_EXCLUDED_DIRS, FileEntry, scan_files
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_STATS_INTERVAL = 300.0
+# How often the loop checks for settled files while some are pending and nothing is converting
+BUSY_TICK = 0.1
+# Numbering width used when the folder has no numbered files yet
+RENAME_NUMBER_DIGITS = 4
+# Files handled recently, so repeated events (and our own renames) don't queue them twice
+RECENT_FILES = 10_000
+# Stems renamed recently, so a RAW+JPG pair gets the same number
+RECENT_STEMS = 1_000
+LATENCY_SAMPLES = 1_000
+# Replace each worker process after this many conversions (Python 3.11+)
+WORKER_MAX_TASKS = 500
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII") # wd, mask, cookie, name length
+_INOTIFY_READ_SIZE = 64 * 1024
+
+
+def _watched_dir_name(name, excluded_dirs):
+    return not name.startswith(".") and name.lower() not in excluded_dirs
+
+
+class InotifyWatcher:
+    """Reports created, written and moved-in files through Linux inotify.
+
+    Raises OSError if inotify isn't available or the folder can't be watched.
+    """
+
+    name = "inotify"
+
+    def __init__(self, folder, recursive=False, excluded_dirs=DEFAULT_EXCLUDED_DIRS):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self.folder = folder
+        self.recursive = recursive
+        self.excluded_dirs = {name.lower() for name in excluded_dirs}
+        self.overflowed = False
+        self._folders = {} # watch descriptor: folder
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "Could not start inotify")
+        try:
+            self._add_watch(folder)
+            if recursive:
+                self._add_subfolders(folder)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, folder):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), folder)
+        self._folders[wd] = folder
+
+    def _add_subfolders(self, folder):
+        pending_folders = [folder]
+        while pending_folders:
+            try:
+                with os.scandir(pending_folders.pop()) as iterator:
+                    for dir_entry in iterator:
+                        if dir_entry.is_dir(follow_symlinks=False) and _watched_dir_name(dir_entry.name, self.excluded_dirs):
+                            self._add_watch(dir_entry.path)
+                            pending_folders.append(dir_entry.path)
+            except OSError:
+                pass # Vanished or unreadable; nothing to watch there
+
+    def poll(self, timeout):
+        """Waits up to `timeout` seconds and returns the set of paths of files that changed.
+
+        Sets `overflowed` when the kernel dropped events; the caller then rescans.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        changed = set()
+        if not readable:
+            return changed
+        try:
+            data = os.read(self._fd, _INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, name_length = _INOTIFY_EVENT.unpack_from(data, offset)
+            name_start = offset + _INOTIFY_EVENT.size
+            name = os.fsdecode(data[name_start:name_start + name_length].split(b"\0", 1)[0])
+            offset = name_start + name_length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED: # The folder was deleted or unmounted
+                self._folders.pop(wd, None)
+                continue
+            folder = self._folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if not mask & IN_ISDIR:
+                changed.add(path)
+            elif self.recursive and _watched_dir_name(name, self.excluded_dirs):
+                try:
+                    self._add_watch(path)
+                    self._add_subfolders(path)
+                except OSError:
+                    continue
+                # Files can land in a new folder before its watch exists
+                changed.update(entry.path for entry in scan_files(path, True, excluded_dirs=self.excluded_dirs,
+                                                                  on_error=lambda e: None))
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """Reports new and changed files by rescanning the folder every `interval` seconds."""
+
+    name = "polling"
+
+    def __init__(self, folder, recursive=False, interval=DEFAULT_POLL_INTERVAL, excluded_dirs=DEFAULT_EXCLUDED_DIRS):
+        self.folder = folder
+        self.recursive = recursive
+        self.interval = interval
+        self.excluded_dirs = excluded_dirs
+        self.overflowed = False
+        self._snapshot = self._scan()
+        self._scanned = time.monotonic()
+
+    def _scan(self):
+        return {entry.path: (entry.size, entry.mtime_ns)
+                for entry in scan_files(self.folder, self.recursive, excluded_dirs=self.excluded_dirs,
+                                        on_error=lambda e: None)}
+
+    def poll(self, timeout):
+        """Waits up to `timeout` seconds and returns the set of paths of files that are new or changed."""
+        wait_seconds = min(timeout, max(0.0, self._scanned + self.interval - time.monotonic()))
+        time.sleep(wait_seconds)
+        if time.monotonic() - self._scanned < self.interval:
+            return set()
+        snapshot = self._scan()
+        self._scanned = time.monotonic()
+        changed = {path for path, stat in snapshot.items() if self._snapshot.get(path) != stat}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(folder, recursive=False, poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """Returns an InotifyWatcher where possible, otherwise a PollingWatcher."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder, recursive)
+        except (OSError, AttributeError): # AttributeError: no usable libc
+            pass
+    return PollingWatcher(folder, recursive, poll_interval)
+
+
+class _Debouncer:
+    """Holds arriving files until their size and mtime have stopped changing.
+
+    A file is only stat'ed when it arrives and then when its quiet period
+    runs out, not on every tick: a heap orders the pending files by that
+    deadline, and an event for a file already pending pushes its deadline
+    back instead of stat'ing it again.
+    """
+
+    def __init__(self, settle_seconds):
+        self.settle_seconds = settle_seconds
+        self.pending = {} # path: [size, mtime_ns, deadline, first seen]
+        self._deadlines = [] # (deadline, path); entries whose deadline has since moved are skipped
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _schedule(self, path, deadline):
+        self.pending[path][2] = deadline
+        heapq.heappush(self._deadlines, (deadline, path))
+
+    def add(self, path, now):
+        if path not in self.pending:
+            self.pending[path] = [None, None, None, now]
+            self._schedule(path, now) # Stat'ed on the next call to settled()
+        elif self.pending[path][0] is not None:
+            self._schedule(path, now + self.settle_seconds) # Written again; wait for it to go quiet
+
+    def settled(self, now):
+        """Returns (FileEntry, first seen) for every file that has settled, in arrival order."""
+        ready = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, path = heapq.heappop(self._deadlines)
+            state = self.pending.get(path)
+            if state is None or state[2] != deadline:
+                continue
+            size, mtime_ns, _, first_seen = state
+            try:
+                stat_result = os.stat(path)
+            except OSError: # Moved away or deleted again
+                del self.pending[path]
+                continue
+            if stat_result.st_size and (stat_result.st_size, stat_result.st_mtime_ns) == (size, mtime_ns):
+                del self.pending[path]
+                entry = FileEntry(path, os.path.basename(path), stat_result.st_size, stat_result.st_mtime_ns,
+                                  stat_result.st_ctime)
+                ready.append((entry, first_seen))
+            else:
+                state[0], state[1] = stat_result.st_size, stat_result.st_mtime_ns
+                self._schedule(path, now + self.settle_seconds)
+        ready.sort(key=lambda item: (item[1], item[0].name))
+        return ready
+
+
+class WatchStats:
+    """Counters, queue depth and arrival-to-output latency of a watch."""
+
+    def __init__(self):
+        self.converted = 0
+        self.failed = 0
+        self.skipped = 0
+        self.renamed = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def set_queue_depth(self, depth):
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def latency_percentile(self, percent):
+        """Returns a percentile of the last LATENCY_SAMPLES latencies in seconds, or None."""
+        if not self.latencies:
+            return None
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def summary_line(self):
+        line = (f"Watch: {self.converted} converted, {self.failed} failed, {self.skipped} up to date, "
+                f"{self.renamed} renamed; queue {self.queue_depth} (max {self.max_queue_depth})")
+        if self.latencies:
+            line += (f"; latency from arrival to output p50 {self.latency_percentile(50):.1f} s, "
+                     f"p95 {self.latency_percentile(95):.1f} s")
+        return line + "."
+
+
+class _RenameNumbering:
+    """Hands out '{base}_{NNNN}' names, continuing from the highest number in the folder."""
+
+    def __init__(self, folder, base_name, recursive):
+        self.base_name = base_name
+        pattern = re.compile(re.escape(base_name) + r"_(\d+)$", re.IGNORECASE)
+        highest = 0
+        digits = RENAME_NUMBER_DIGITS
+        for entry in scan_files(folder, recursive, on_error=lambda e: None):
+            match = pattern.match(os.path.splitext(entry.name)[0])
+            if match and int(match.group(1)) >= highest:
+                highest = int(match.group(1))
+                digits = len(match.group(1))
+        self.next_number = highest + 1
+        self.digits = digits
+        self._stem_numbers = collections.OrderedDict() # (folder, lowercase stem): number
+
+    def rename(self, entry, log):
+        """Renames a settled file; returns its new FileEntry, or the old one if renaming failed."""
+        directory, filename = os.path.split(entry.path)
+        stem, extension = os.path.splitext(filename)
+        key = (directory, stem.lower())
+        number = self._stem_numbers.get(key)
+        while True:
+            if number is None:
+                number = self.next_number
+                self.next_number += 1
+            new_filename = f"{self.base_name}_{str(number).zfill(self.digits)}{extension}"
+            new_path = os.path.join(directory, new_filename)
+            if not os.path.exists(new_path):
+                break
+            number = None # Taken (e.g. a file that arrived with this name)
+        try:
+            os.rename(entry.path, new_path)
+        except OSError as e:
+            log(f"Error renaming '{filename}': {e}")
+            return entry
+        self._stem_numbers[key] = number
+        self._stem_numbers.move_to_end(key)
+        if len(self._stem_numbers) > RECENT_STEMS:
+            self._stem_numbers.popitem(last=False)
+        log(f"Renamed: '{filename}' to '{new_filename}'", detail=True)
+        return FileEntry(new_path, new_filename, entry.size, entry.mtime_ns, entry.ctime)
+
+
+def _no_log(message, detail=False):
+    pass
+
+
+def _no_progress(stage, done, total):
+    pass
+
+
+def watch_folder(folder, options=None, worker_count=1, recursive=False, rename_base=None, stop_event=None, log=None,
+                 progress=None, trace=None, settle_seconds=DEFAULT_SETTLE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+                 stats_interval=DEFAULT_STATS_INTERVAL, process_existing=False, polling=False):
+    """Converts RAW files arriving in `folder` until `stop_event` (a threading.Event) is set.
+
+    Outputs go to the folder's 'exported_jpg' subfolder, as with
+    core.convert_raw_files. With `rename_base`, arriving files (all types,
+    so RAW+JPG pairs keep matching names) are renamed to
+    '{rename_base}_{NNNN}{ext}' in arrival order before being converted.
+    Files already in the folder are left alone unless `process_existing`.
+    `polling` forces the scandir watcher (needed for network shares).
+    `progress("convert", done, None)` is called after each conversion and a
+    statistics line is logged every `stats_interval` seconds.
+    Returns the WatchStats.
+    """
+    from photo_tool.instrument import JobTrace
+    from photo_tool.manifest import ConversionManifest, is_temporary_file, scan_outputs
+
+    log = log or _no_log
+    progress = progress or _no_progress
+    options = options or core.ConversionOptions()
+    stop_event = stop_event or threading.Event()
+    trace = trace or JobTrace("watch", enabled=False)
+    worker_count = max(1, worker_count)
+
+    export_folder = os.path.join(folder, core.EXPORT_FOLDER_NAME)
+    os.makedirs(export_folder, exist_ok=True)
+    try:
+        manifest = ConversionManifest.load(folder, export_folder)
+    except ValueError as e:
+        log(f"Warning: {e}. All files will be converted again.")
+        manifest = ConversionManifest(folder, export_folder)
+    output_sizes, leftovers = scan_outputs(export_folder)
+    for leftover in leftovers:
+        try:
+            os.remove(leftover)
+        except OSError:
+            pass
+    settings = options.settings()
+    content_index = core.open_content_index(log) if options.duplicates != DUPLICATES_OFF else None
+    index_entries = [] # Converted files not yet recorded in the content index
+
+    numbering = _RenameNumbering(folder, rename_base, recursive) if rename_base else None
+    watcher = open_watcher(folder, recursive, poll_interval, polling)
+    started = time.time()
+    debouncer = _Debouncer(settle_seconds)
+    stats = WatchStats()
+    recent = collections.OrderedDict() # path: (size, mtime_ns) of files already queued or skipped
+    queue = collections.deque() # (FileEntry, first seen), waiting for the engine to take them
+    submitted = {} # path: (FileEntry, first seen) of files handed to the engine and not finished yet
+
+    def wanted(path):
+        name = os.path.basename(path)
+        if name.startswith(".") or is_temporary_file(name):
+            return False
+        return core.is_raw_file(name) or numbering is not None
+
+    def remember(entry):
+        recent[entry.path] = (entry.size, entry.mtime_ns)
+        recent.move_to_end(entry.path)
+        if len(recent) > RECENT_FILES:
+            recent.popitem(last=False)
+
+    def admit(entry, first_seen):
+        if recent.get(entry.path) == (entry.size, entry.mtime_ns):
+            return
+        if core.is_raw_file(entry.name) and manifest.output_for(entry.path, entry.size, entry.mtime_ns, settings,
+                                                                output_sizes) is not None:
+            log(f"Skipping '{entry.name}' (up to date).", detail=True)
+            stats.skipped += 1
+            remember(entry)
+            return
+        if numbering is not None:
+            renamed = numbering.rename(entry, log)
+            if renamed is not entry:
+                stats.renamed += 1
+                entry = renamed
+        remember(entry)
+        if not core.is_raw_file(entry.name):
+            return
+        if content_index is not None:
+            output_files = core.export_paths(entry.path, folder, export_folder, options)
+            _, handled = core.handle_duplicate(content_index, entry.path, entry, output_files, options, settings,
+                                               manifest, log)
+            if handled:
+                for output_file in output_files:
+                    if os.path.exists(output_file):
+                        output_sizes[manifest.output_key(output_file)] = os.path.getsize(output_file)
+                stats.skipped += 1
+                return
+        queue.append((entry, first_seen))
+
+    def save_index_entries():
+        try:
+            content_index.put_many(index_entries)
+        except Exception as e:
+            log(f"Warning: Could not update the content index: {e}")
+        index_entries.clear()
+
+    def finish(raw_file_path, success, messages, info):
+        entry, first_seen = submitted.pop(raw_file_path)
+        for message in messages:
+            log(message)
+        trace.add_events(info.get("stages", ()), pid=info.get("pid"), file=entry.name)
+        trace.file_done(entry.size, info.get("output_size", 0))
+        if success:
+            manifest.record(entry.path, entry.size, entry.mtime_ns, settings, info["outputs"])
+            for output_file, output_size, _ in info["outputs"]:
+                output_sizes[manifest.output_key(output_file)] = output_size
+            if content_index is not None and "sample_key" in info:
+                index_entries.append((entry.path, entry.size, entry.mtime_ns, info["sample_key"], info.get("content_hash"),
+                                      settings, info["outputs"]))
+                if len(index_entries) >= WRITE_BATCH_SIZE:
+                    save_index_entries()
+            stats.converted += 1
+            stats.latencies.append(time.monotonic() - first_seen)
+            log(f"Converted '{entry.name}' to '{os.path.basename(info['output_file'])}'", detail=True)
+        else:
+            stats.failed += 1
+        progress("convert", stats.converted + stats.failed, None)
+
+    log(f"Watching '{folder}' for new RAW files ({watcher.name}); outputs go to '{export_folder}'.")
+    if process_existing:
+        now = time.monotonic()
+        for entry in scan_files(folder, recursive, on_error=lambda e: log(f"Warning: {e}")):
+            if wanted(entry.path):
+                debouncer.add(entry.path, now)
+
+    last_stats = time.monotonic()
+    last_stats_line = None
+
+    def jobs():
+        # Hands settled RAWs to the engine one at a time, and None while there is nothing to convert
+        nonlocal last_stats, last_stats_line
+        while not stop_event.is_set():
+            # While conversions run, the engine does the waiting (see core.ENGINE_IDLE_WAIT_SECONDS)
+            changed = watcher.poll(0 if queue or submitted else BUSY_TICK if len(debouncer) else min(poll_interval, 1.0))
+            now = time.monotonic()
+            if watcher.overflowed:
+                watcher.overflowed = False
+                log("Warning: Too many file events at once; rescanning the folder.")
+                # Only files that appeared since the watch started; copies keep their old mtime, not their ctime
+                changed.update(entry.path for entry in scan_files(folder, recursive, on_error=lambda e: None)
+                               if entry.ctime >= started)
+            for path in changed:
+                if wanted(path):
+                    debouncer.add(path, now)
+            for entry, first_seen in debouncer.settled(now):
+                admit(entry, first_seen)
+            stats.set_queue_depth(len(queue) + len(submitted))
+
+            if now - last_stats >= stats_interval:
+                last_stats = now
+                stats_line = stats.summary_line()
+                if stats_line != last_stats_line: # Stay quiet while idle
+                    log(stats_line)
+                    last_stats_line = stats_line
+                try:
+                    manifest.save()
+                except OSError as e:
+                    log(f"Warning: Could not save the conversion manifest: {e}")
+                if index_entries:
+                    save_index_entries()
+
+            if not queue:
+                yield None
+                continue
+            entry, first_seen = queue.popleft()
+            output_files = core.export_paths(entry.path, folder, export_folder, options)
+            for output_file in output_files:
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            submitted[entry.path] = (entry, first_seen)
+            yield entry.path, output_files
+
+    engine = core.RawConversionEngine(max_workers=worker_count, options=options, record_stages=trace.enabled,
+                                      max_tasks_per_child=WORKER_MAX_TASKS)
+    try:
+        # Once stop_event is set, the conversions already running are finished and recorded
+        for raw_file_path, _, success, messages, info in engine.run(jobs()):
+            finish(raw_file_path, success, messages, info)
+    finally:
+        if queue:
+            log(f"Stopping; {len(queue)} queued file(s) were not converted.")
+        watcher.close()
+        if content_index is not None:
+            save_index_entries()
+            content_index.close()
+        try:
+            manifest.compact()
+        except OSError as e:
+            log(f"Warning: Could not save the conversion manifest: {e}")
+        log(stats.summary_line())
+    return stats
@@ -1,16 +1,198 @@
 import customtkinter as ctk
+import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
-import math
-import exifread
-import datetime
-import rawpy
-import io
-from PIL import Image, ExifTags
+import queue
 import threading
 import subprocess # For opening folders
 import sys # For platform check
 
+from photo_tool import contentindex, core, develop, jobs, prefetch, profiles, watch
+from photo_tool.discovery import scan_ahead, scan_files
+from photo_tool.instrument import JobTrace, default_trace_folder
+from photo_tool.logqueue import LogQueue
+from photo_tool.thumbnails import ThumbnailLoader
+
+LOG_FLUSH_INTERVAL_MS = 100 # How often queued log lines are appended to the status box
+LOG_MAX_LINES = 2000 # Only the most recent lines are kept in the status box
+
+# Labels of the "JPG output" option menu and the conversion output modes they select
+OUTPUT_MODE_LABELS = {
+    "Re-encode (rotate pixels)": core.OUTPUT_REENCODE,
+    "Passthrough (no re-encode, faster)": core.OUTPUT_PASSTHROUGH,
+}
+
+# Labels of the "Source" option menu and the conversion sources they select
+SOURCE_LABELS = {
+    "Embedded preview (fast)": core.SOURCE_PREVIEW,
+    "Full RAW development": core.SOURCE_DEVELOP,
+}
+
+BIT_DEPTH_LABELS = {
+    "8-bit JPG": 8,
+    "16-bit TIFF": 16,
+}
+
+# Labels of the "Duplicates" option menu and the duplicate modes they select
+DUPLICATE_LABELS = {
+    "Report, convert anyway": contentindex.DUPLICATES_REPORT,
+    "Skip": contentindex.DUPLICATES_SKIP,
+    "Link existing outputs": contentindex.DUPLICATES_LINK,
+    "Don't check": contentindex.DUPLICATES_OFF,
+}
+
+# Labels of the "Priority" option menu for new jobs and the job priorities they select
+PRIORITY_LABELS = {
+    "Normal": jobs.PRIORITY_NORMAL,
+    "Urgent": jobs.PRIORITY_URGENT,
+    "Low": jobs.PRIORITY_LOW,
+}
+PRIORITY_NAMES = {priority: label for label, priority in PRIORITY_LABELS.items()}
+# Jobs that rename files; undo has to wait for them, and an interrupted one isn't run again
+RENAMING_JOB_KINDS = ("rename", "combined", "journal")
+JOB_LIST_ROWS = 3 # Waiting jobs visible without scrolling
+
+PREVIEW_ROW_HEIGHT = 72 # Fits a 64 px thumbnail
+PREVIEW_OVERSCAN_ROWS = 5 # Thumbnails are requested this many rows beyond the visible ones
+PREVIEW_POLL_INTERVAL_MS = 50 # How often loaded thumbnails are picked up
+PREVIEW_WHEEL_ROWS = 3 # Rows scrolled per mouse wheel step
+
+
+class RenamePreviewWindow:
+    """Shows planned renames (old name, new name, thumbnail) in their sort order.
+
+    The list is virtualized: only as many rows as fit in the window exist as
+    canvas items, and scrolling fills the same items with other files.
+    Thumbnails of the rows on screen are loaded in the background by a
+    ThumbnailLoader, whose LRU cache bounds the memory they use.
+    """
+
+    def __init__(self, master, plan, title):
+        from PIL import ImageTk
+
+        self._photo_image = ImageTk.PhotoImage
+        self.plan = plan
+        self.first_row = 0.0 # Scroll position, in rows
+        self.rows = [] # Canvas items of each visible row and the file they show
+        self.loaded_paths = queue.SimpleQueue()
+        self.loader = ThumbnailLoader(on_loaded=self.loaded_paths.put)
+
+        self.window = ctk.CTkToplevel(master)
+        self.window.title(title)
+        self.window.geometry("720x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        dark = ctk.get_appearance_mode() == "Dark"
+        self.text_color = "gray90" if dark else "gray10"
+        self.dim_text_color = "gray60" if dark else "gray40"
+        frame = ctk.CTkFrame(self.window, corner_radius=10)
+        frame.pack(fill="both", expand=True, padx=15, pady=15)
+        self.canvas = tk.Canvas(frame, highlightthickness=0, bg="gray17" if dark else "gray95")
+        self.scrollbar = ctk.CTkScrollbar(frame, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self._build_rows())
+        self.canvas.bind("<MouseWheel>", lambda event: self._scroll_rows(-PREVIEW_WHEEL_ROWS if event.delta > 0 else PREVIEW_WHEEL_ROWS))
+        self.canvas.bind("<Button-4>", lambda event: self._scroll_rows(-PREVIEW_WHEEL_ROWS)) # X11
+        self.canvas.bind("<Button-5>", lambda event: self._scroll_rows(PREVIEW_WHEEL_ROWS))
+        self.window.after(PREVIEW_POLL_INTERVAL_MS, self._poll_loaded)
+
+    def _visible_row_count(self):
+        return max(1, self.canvas.winfo_height() // PREVIEW_ROW_HEIGHT)
+
+    def _build_rows(self):
+        """Creates canvas items for as many rows as fit (plus a partly visible one)."""
+        needed = self.canvas.winfo_height() // PREVIEW_ROW_HEIGHT + 2
+        while len(self.rows) < needed:
+            self.rows.append({
+                "image": self.canvas.create_image(8, 0, anchor="nw"),
+                "new_name": self.canvas.create_text(84, 0, anchor="nw", fill=self.text_color, font=("Inter", 13, "bold")),
+                "old_name": self.canvas.create_text(84, 0, anchor="nw", fill=self.dim_text_color, font=("Inter", 11)),
+                "path": None,
+                "photo": None,
+            })
+        while len(self.rows) > needed:
+            row = self.rows.pop()
+            self.canvas.delete(row["image"], row["new_name"], row["old_name"])
+        self._scroll_to(self.first_row)
+
+    def _scroll_to(self, first_row):
+        max_first_row = max(0, len(self.plan) - self._visible_row_count())
+        self.first_row = min(max(0.0, first_row), max_first_row)
+        self._redraw()
+
+    def _scroll_rows(self, rows):
+        self._scroll_to(self.first_row + rows)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * len(self.plan))
+        elif action == "scroll":
+            step = self._visible_row_count() if unit == "pages" else 1
+            self._scroll_rows(int(amount) * step)
+
+    def _redraw(self):
+        """Fills the row items with the files at the current scroll position."""
+        first = int(self.first_row)
+        offset = (self.first_row - first) * PREVIEW_ROW_HEIGHT
+        for slot, row in enumerate(self.rows):
+            index = first + slot
+            if index >= len(self.plan):
+                for item in (row["image"], row["new_name"], row["old_name"]):
+                    self.canvas.itemconfigure(item, state="hidden")
+                row["path"] = None
+                continue
+            old_path, new_path = self.plan[index]
+            top = slot * PREVIEW_ROW_HEIGHT - offset
+            if row["path"] != old_path:
+                row["path"] = old_path
+                row["photo"] = None
+                self.canvas.itemconfigure(row["new_name"], state="normal", text=f"{index + 1}.  {os.path.basename(new_path)}")
+                self.canvas.itemconfigure(row["old_name"], state="normal", text=f"was {old_path}")
+            self._show_thumbnail(row)
+            self.canvas.coords(row["image"], 8, top + 4)
+            self.canvas.coords(row["new_name"], 84, top + 14)
+            self.canvas.coords(row["old_name"], 84, top + 38)
+
+        total = max(1, len(self.plan))
+        self.scrollbar.set(self.first_row / total, min(1.0, (self.first_row + self._visible_row_count()) / total))
+        wanted = self.plan[max(0, first - PREVIEW_OVERSCAN_ROWS):first + len(self.rows) + PREVIEW_OVERSCAN_ROWS]
+        self.loader.request([old_path for old_path, _ in wanted])
+
+    def _show_thumbnail(self, row):
+        if row["photo"] is not None:
+            return
+        try:
+            image = self.loader.cache.get(row["path"])
+        except KeyError: # Not loaded yet
+            image = None
+        if image is None:
+            self.canvas.itemconfigure(row["image"], state="hidden")
+            return
+        # Only the visible rows hold Tk images; the cache keeps the decoded thumbnails
+        row["photo"] = self._photo_image(image)
+        self.canvas.itemconfigure(row["image"], image=row["photo"], state="normal")
+
+    def _poll_loaded(self):
+        """Shows thumbnails that finished loading. Runs on the main thread."""
+        if not self.window.winfo_exists():
+            return
+        loaded = set()
+        while True:
+            try:
+                loaded.add(self.loaded_paths.get_nowait())
+            except queue.Empty:
+                break
+        for row in self.rows:
+            if row["path"] in loaded:
+                self._show_thumbnail(row)
+        self.window.after(PREVIEW_POLL_INTERVAL_MS, self._poll_loaded)
+
+    def close(self):
+        self.loader.close()
+        self.window.destroy()
+
 class FileToolApp:
     def __init__(self, master):
         ctk.set_appearance_mode("System")
@@ -18,13 +200,28 @@ class FileToolApp:
 
         self.master = master
         master.title("Photo Tool - Rename and Convert")
-        master.geometry("800x750") # Increased size for larger fonts
+        master.geometry("800x880") # Increased size for larger fonts and the job queue
         master.resizable(True, True)
 
         self.rename_selected_files = []
         self.rename_selected_folder = ""
+        # Files found by the last scan of rename_selected_folder ({path: FileEntry}), reused by the rename job
+        self.rename_folder_entries = {}
+        self.rename_folder_scan_key = None
         self.raw_conversion_folder = ""
         self.last_operation_folder = "" # To store the folder for 'Open Folder' button
+        self.current_trace = None # JobTrace of the running (or last) job, for the throughput readout
+        self.watch_stop_event = None # Set to stop the running folder watch
+        self.watch_thread = None
+        self.closing = False # Set when the window is closed; finishing jobs then don't open dialogs
+        self.job_list_version = None # JobQueue.version the job list was last drawn for
+        self.job_list_ids = [] # Job ids of the job list's rows
+        try:
+            self.export_profiles = profiles.load_profiles(core.user_config_dir())
+            profiles_error = None
+        except ValueError as e:
+            self.export_profiles = dict(profiles.BUILTIN_PROFILES)
+            profiles_error = e
 
         self.tab_view = ctk.CTkTabview(master, corner_radius=10)
         self.tab_view.pack(expand=True, fill="both", padx=20, pady=20)
@@ -35,8 +232,29 @@ class FileToolApp:
         self._create_rename_tab_ui(self.rename_tab)
         self._create_raw_to_jpg_tab_ui(self.raw_to_jpg_tab)
 
-        status_label = ctk.CTkLabel(master, text="Operation Status", font=("Inter", 13, "bold")) # Increased font
-        status_label.pack(pady=(15, 5), padx=25, anchor="w") # Increased padding
+        self.log_queue = LogQueue(max_lines=LOG_MAX_LINES)
+        # Jobs run one at a time on the queue's thread; it is started once interrupted work has been dealt with
+        self.job_queue = jobs.JobQueue.open_default(core.user_config_dir(), self._run_job, self.log_message)
+        self._create_job_queue_ui(master)
+
+        status_header = ctk.CTkFrame(master, fg_color="transparent")
+        status_header.pack(pady=(15, 5), padx=25, fill="x") # Increased padding
+
+        status_label = ctk.CTkLabel(status_header, text="Operation Status", font=("Inter", 13, "bold")) # Increased font
+        status_label.pack(side="left")
+
+        self.throughput_label = ctk.CTkLabel(status_header, text="", font=("Inter", 12))
+        self.throughput_label.pack(side="left", padx=(15, 0))
+
+        self.trace_checkbox = ctk.CTkCheckBox(status_header, text="Performance trace", font=("Inter", 12))
+        self.trace_checkbox.select()
+        self.trace_checkbox.pack(side="right", padx=(10, 0))
+
+        self.save_log_checkbox = ctk.CTkCheckBox(status_header, text="Save full log to file", command=self._toggle_log_file, font=("Inter", 12))
+        self.save_log_checkbox.pack(side="right", padx=(10, 0))
+
+        self.show_details_checkbox = ctk.CTkCheckBox(status_header, text="Show per-file messages", command=self._toggle_log_details, font=("Inter", 12))
+        self.show_details_checkbox.pack(side="right", padx=(10, 0))
 
         status_frame = ctk.CTkFrame(master, corner_radius=10, fg_color=("gray85", "gray25"))
         status_frame.pack(pady=(0, 20), padx=25, fill="both", expand=True)
@@ -44,17 +262,88 @@ class FileToolApp:
         self.status_text = ctk.CTkTextbox(status_frame, height=100, state="disabled", wrap="word", corner_radius=8, font=("Inter", 12)) # Increased font
         self.status_text.pack(fill="both", expand=True, padx=10, pady=10)
 
-    def log_message(self, message):
-        """Logs a message to the status text box in a thread-safe way."""
-        self.master.after(0, lambda: self._update_log_text(message))
-
-    def _update_log_text(self, message):
+        self.master.after(LOG_FLUSH_INTERVAL_MS, self._flush_log_queue)
+        if profiles_error:
+            self.log_message(f"Warning: {profiles_error}. Only the built-in export profiles are available.")
+        self.master.after(0, self._check_interrupted_renames)
+
+    def log_message(self, message, detail=False):
+        """Logs a message to the status text box in a thread-safe way.
+
+        Messages are queued and appended in batches by _flush_log_queue. Per-file
+        messages (detail=True) are collapsed into a progress summary unless
+        "Show per-file messages" is checked.
+        """
+        self.log_queue.put(message, detail)
+
+    def _flush_log_queue(self):
+        """Appends all queued log lines to the text box in one insert. Runs on the main thread."""
+        lines = self.log_queue.drain()
+        if lines:
+            self._update_log_text("\n".join(lines))
+        self._update_job_display()
+        trace = self.current_trace
+        if trace is not None and trace.enabled and trace.files:
+            files_per_second, mb_per_second = trace.throughput()
+            self.throughput_label.configure(text=f"{files_per_second:.1f} files/s · {mb_per_second:.1f} MB/s")
+        self.master.after(LOG_FLUSH_INTERVAL_MS, self._flush_log_queue)
+
+    def _update_log_text(self, text):
         """Internal method to update the text box from the main thread."""
         self.status_text.configure(state="normal")
-        self.status_text.insert(ctk.END, message + "\n")
+        self.status_text.insert(ctk.END, text + "\n")
+        # Keep the text box bounded to the last LOG_MAX_LINES lines
+        line_count = int(self.status_text.index("end-1c").split(".")[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            self.status_text.delete("1.0", f"{line_count - LOG_MAX_LINES + 1}.0")
         self.status_text.see(ctk.END)
         self.status_text.configure(state="disabled")
 
+    def _start_trace(self, job_name, enabled=None):
+        """Creates the JobTrace for a new job; by default disabled if "Performance trace" is unchecked.
+
+        Also called on the job queue's thread, with `enabled` as it was when the job was queued.
+        """
+        if enabled is None:
+            enabled = self.trace_checkbox.get() == 1
+        self.current_trace = JobTrace(job_name, enabled=enabled)
+        self._call_on_main(lambda: self.throughput_label.configure(text=""))
+        return self.current_trace
+
+    def _finish_trace(self, trace):
+        """Saves a finished job's Chrome trace to the traces folder. Runs in the job's thread."""
+        if trace is None or not trace.enabled:
+            return
+        try:
+            path = trace.save(default_trace_folder(core.user_config_dir()))
+        except OSError as e:
+            self.log_message(f"Warning: Could not save the performance trace: {e}")
+            return
+        files_per_second, mb_per_second = trace.throughput()
+        self.log_message(f"Throughput: {files_per_second:.1f} files/s, {mb_per_second:.1f} MB/s. Performance trace saved to: {path}")
+
+    def _toggle_log_details(self):
+        """Switches between showing every per-file message and a periodic progress summary."""
+        self.log_queue.set_collapse_details(self.show_details_checkbox.get() != 1)
+
+    def _toggle_log_file(self):
+        """Starts or stops streaming the full log to a file."""
+        if self.save_log_checkbox.get() == 1:
+            log_path = filedialog.asksaveasfilename(title="Save full log to", defaultextension=".log", filetypes=(("Log files", "*.log"), ("All files", "*.*")))
+            if not log_path:
+                self.save_log_checkbox.deselect()
+                return
+            try:
+                self.log_queue.set_log_file(log_path)
+            except OSError as e:
+                self.save_log_checkbox.deselect()
+                messagebox.showerror("Error", f"Could not open log file: {e}")
+                return
+            self.log_message(f"Writing full log to: {log_path}")
+        else:
+            self.log_queue.set_log_file(None)
+            self.log_message("Stopped writing log to file.")
+
     def _open_folder_in_explorer(self, path):
         """Opens the specified folder in the default file explorer."""
         if not path or not os.path.exists(path):
@@ -75,6 +364,148 @@ class FileToolApp:
             self.log_message(f"Error opening folder: {e}")
 
 
+    def _call_on_main(self, callback):
+        """Runs `callback` on the Tk main thread; dropped once the window is being closed."""
+        if not self.closing:
+            self.master.after(0, callback)
+
+    # --- Job queue ---
+    def _create_job_queue_ui(self, master):
+        job_frame = ctk.CTkFrame(master, corner_radius=10)
+        job_frame.pack(pady=(0, 5), padx=25, fill="x")
+        job_frame.grid_columnconfigure(0, weight=1)
+
+        self.job_status_label = ctk.CTkLabel(job_frame, text="No job running.", anchor="w", font=("Inter", 12))
+        self.job_status_label.grid(row=0, column=0, padx=(10, 10), pady=(8, 0), sticky="ew")
+        self.job_progress_bar = ctk.CTkProgressBar(job_frame)
+        self.job_progress_bar.set(0)
+        self.job_progress_bar.grid(row=1, column=0, padx=(10, 10), pady=(4, 8), sticky="ew")
+        self.cancel_job_button = ctk.CTkButton(job_frame, text="Cancel Job", command=self._cancel_running_job, width=120, font=("Inter", 13), state="disabled")
+        self.cancel_job_button.grid(row=0, column=1, rowspan=2, padx=(0, 10), pady=(8, 8))
+
+        self.job_listbox = tk.Listbox(job_frame, height=JOB_LIST_ROWS, activestyle="none", exportselection=False, font=("Inter", 11))
+        self.job_listbox.grid(row=2, column=0, padx=(10, 10), pady=(0, 10), sticky="ew")
+        job_buttons = ctk.CTkFrame(job_frame, fg_color="transparent")
+        job_buttons.grid(row=2, column=1, padx=(0, 10), pady=(0, 10), sticky="n")
+        ctk.CTkButton(job_buttons, text="Run Next", command=self._move_selected_job_to_front, width=120, font=("Inter", 12)).pack(pady=(0, 4))
+        ctk.CTkButton(job_buttons, text="Remove", command=self._remove_selected_job, width=120, font=("Inter", 12)).pack(pady=(0, 4))
+        self.job_priority_menu = ctk.CTkOptionMenu(job_buttons, values=list(PRIORITY_LABELS), width=120, font=("Inter", 12))
+        self.job_priority_menu.set("Normal")
+        self.job_priority_menu.pack()
+
+    def _submit_job(self, kind, title, params, extras=None):
+        """Adds a job to the queue with the priority selected for new jobs."""
+        priority = PRIORITY_LABELS[self.job_priority_menu.get()]
+        self.job_queue.submit(kind, title, params, priority, extras)
+        self.log_message(f"Queued ({self.job_priority_menu.get().lower()} priority): {title}")
+
+    def _run_job(self, job):
+        """Runs a queued job; called on the job queue's thread."""
+        self.log_message(f"\n--- Starting job: {job.title} ---")
+        trace = self._start_trace(job.kind, job.params["trace"])
+        options = None
+        if job.params.get("options") is not None:
+            options = core.ConversionOptions.from_dict(job.params["options"], self.export_profiles)
+
+        def progress(stage, done, total):
+            job.report_progress(stage, done, total)
+            self.log_queue.progress(stage, done, total)
+
+        if job.kind == "journal":
+            self._run_journal_task(job, progress)
+        elif job.kind in RENAMING_JOB_KINDS:
+            self._run_combined_or_rename_task(job, options, trace, progress)
+        elif job.kind == "convert":
+            self._run_raw_conversion_task(job, options, trace, progress)
+        elif job.kind == "offload":
+            self._run_offload_task(job, options, trace, progress)
+        else:
+            raise ValueError(f"Unknown job kind '{job.kind}'")
+
+    def _update_job_display(self):
+        """Shows the running job's progress and ETA, and the waiting jobs. Runs on the main thread."""
+        running, waiting = self.job_queue.snapshot()
+        if running is None:
+            self.job_status_label.configure(text="No job running." if not waiting else f"{len(waiting)} job(s) waiting.")
+            self.job_progress_bar.set(0)
+            self.cancel_job_button.configure(state="disabled")
+        else:
+            stage, done, total, files_per_second, eta = running.progress.snapshot()
+            parts = [running.title]
+            if running.cancel_event.is_set():
+                parts.append("canceling after the files in progress...")
+            elif stage is not None:
+                parts.append(f"{stage}: {done}/{total} files" if total is not None else f"{stage}: {done} files")
+                if files_per_second:
+                    parts.append(f"{files_per_second:.1f} files/s")
+                if eta is not None:
+                    parts.append(f"ETA {jobs.format_eta(eta)}")
+            self.job_status_label.configure(text=" · ".join(parts))
+            self.job_progress_bar.set(min(1.0, done / total) if total else 0)
+            self.cancel_job_button.configure(state="disabled" if running.cancel_event.is_set() else "normal")
+
+        if self.job_queue.version != self.job_list_version:
+            self.job_list_version = self.job_queue.version
+            self.job_list_ids = [job.id for job in waiting]
+            self.job_listbox.delete(0, tk.END)
+            for job in waiting:
+                self.job_listbox.insert(tk.END, f"[{PRIORITY_NAMES.get(job.priority, job.priority)}] {job.title}")
+
+    def _selected_job_id(self):
+        selection = self.job_listbox.curselection()
+        if not selection or selection[0] >= len(self.job_list_ids):
+            messagebox.showinfo("Information", "Please select a waiting job first.")
+            return None
+        return self.job_list_ids[selection[0]]
+
+    def _cancel_running_job(self):
+        running, _ = self.job_queue.snapshot()
+        if running is not None:
+            self.job_queue.cancel(running.id)
+            self.log_message(f"Canceling '{running.title}' after the files in progress...")
+
+    def _move_selected_job_to_front(self):
+        job_id = self._selected_job_id()
+        if job_id is not None:
+            self.job_queue.move_to_front(job_id)
+
+    def _remove_selected_job(self):
+        job_id = self._selected_job_id()
+        if job_id is not None:
+            job = self.job_queue.cancel(job_id)
+            if job is not None:
+                self.log_message(f"Removed from the queue: {job.title}")
+
+    def _restore_job_queue(self):
+        """Offers to run the jobs that were still queued when the application was closed, then starts the queue."""
+        for job in self.job_queue.restored_jobs:
+            if job.kind == "journal":
+                # Its journal is still there: an interrupted job was just offered again, a completed one can be undone again
+                self.job_queue.cancel(job.id)
+                self.log_message(f"Warning: The job '{job.title}' is not run again.")
+            elif job.started and job.kind in RENAMING_JOB_KINDS:
+                # Its renames were finished or rolled back from the rename journal instead
+                self.job_queue.cancel(job.id)
+                self.log_message(f"Warning: The job '{job.title}' was interrupted and is not run again. "
+                                 f"Convert its folder on the RAW tab if its conversion didn't finish.")
+        waiting = [job for job in self.job_queue.restored_jobs if job.state == jobs.STATE_QUEUED]
+        if waiting:
+            titles = "\n".join(job.title for job in waiting[:10]) + ("\n..." if len(waiting) > 10 else "")
+            if messagebox.askyesno("Queued Jobs", f"{len(waiting)} job(s) were still queued when Photo Tool was closed:\n\n{titles}\n\n"
+                                                  "Run them now? (No removes them from the queue.)"):
+                self.log_message(f"Running {len(waiting)} job(s) restored from the last session.")
+            else:
+                # Only the restored jobs; resumes and rollbacks just queued by _check_interrupted_renames stay
+                for job in waiting:
+                    self.job_queue.cancel(job.id)
+        self.job_queue.start()
+
+    def shutdown(self):
+        """Stops the folder watch and the running job, keeping waiting jobs for the next start; called when the window is closed."""
+        self.closing = True
+        self.job_queue.shutdown()
+        self.stop_watching()
+
     # --- UI for "Rename Files" Tab ---
     def _create_rename_tab_ui(self, tab):
         # Path label
@@ -95,6 +526,20 @@ class FileToolApp:
         self.rename_select_folder_button = ctk.CTkButton(button_frame, text="Select Folder", command=self._select_rename_folder, corner_radius=8, width=150, font=("Inter", 13))
         self.rename_select_folder_button.grid(row=0, column=1, padx=15)
 
+        self.offload_button = ctk.CTkButton(button_frame, text="Offload Card...", command=self._offload_card, corner_radius=8, width=150, font=("Inter", 13))
+        self.offload_button.grid(row=0, column=2, padx=15)
+
+        # Folder scan options
+        scan_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        scan_frame.pack(pady=(0, 10), padx=20, fill="x")
+        self.rename_recursive_checkbox = ctk.CTkCheckBox(scan_frame, text="Include subfolders", command=self._refresh_rename_folder_count, font=("Inter", 13))
+        self.rename_recursive_checkbox.grid(row=0, column=0, padx=(0, 20))
+        ctk.CTkLabel(scan_frame, text="Only files matching:", font=("Inter", 13)).grid(row=0, column=1, padx=(0, 10))
+        self.rename_pattern_entry = ctk.CTkEntry(scan_frame, placeholder_text="E.g. *.arw IMG_*", width=180, corner_radius=8, font=("Inter", 13))
+        self.rename_pattern_entry.grid(row=0, column=2)
+        self.rename_pattern_entry.bind("<Return>", lambda event: self._refresh_rename_folder_count())
+        self.rename_pattern_entry.bind("<FocusOut>", lambda event: self._refresh_rename_folder_count())
+
         # New Name Input Section
         ctk.CTkLabel(tab, text="Enter the new base name for the files:", font=("Inter", 13)).pack(pady=(10, 5), padx=20, fill="x")
         self.new_name_entry = ctk.CTkEntry(tab, placeholder_text="E.g. MyPhotos", corner_radius=8, height=38, font=("Inter", 13))
@@ -102,9 +547,9 @@ class FileToolApp:
 
         # Sorting Option
         ctk.CTkLabel(tab, text="Sorting Options:", font=("Inter", 13)).pack(pady=(10, 5), padx=20, anchor="w")
-        self.sort_options = ["Alphabetically", "Creation Date", "Date Taken (EXIF)"]
+        self.sort_options = list(core.SORT_METHODS)
         self.sort_option_menu = ctk.CTkOptionMenu(tab, values=self.sort_options, font=("Inter", 13))
-        self.sort_option_menu.set("Alphabetically")
+        self.sort_option_menu.set(core.SORT_ALPHABETICALLY)
         self.sort_option_menu.pack(pady=(0, 10), padx=20, anchor="w")
 
         # New: Combined Process Checkbox
@@ -112,9 +557,15 @@ class FileToolApp:
         self.combine_process_checkbox.pack(pady=(10, 5), padx=20, anchor="w")
         ctk.CTkLabel(tab, text="If checked, the selected RAW files will first be renamed according to the options above, and then converted to JPG in the 'exported_jpg' subfolder.", wraplength=550, font=("Inter", 11)).pack(pady=(0, 20), padx=20, anchor="w")
 
-        # Rename Button
-        self.rename_button = ctk.CTkButton(tab, text="Rename Files", command=self._rename_files_threaded, corner_radius=10, height=50, font=("Inter", 16, "bold"))
-        self.rename_button.pack(pady=10)
+        # Rename and preview buttons
+        rename_button_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        rename_button_frame.pack(pady=10)
+        self.preview_button = ctk.CTkButton(rename_button_frame, text="Preview Order", command=self._preview_renames, corner_radius=10, height=50, font=("Inter", 14))
+        self.preview_button.grid(row=0, column=0, padx=(0, 15))
+        self.rename_button = ctk.CTkButton(rename_button_frame, text="Rename Files", command=self._rename_files_threaded, corner_radius=10, height=50, font=("Inter", 16, "bold"))
+        self.rename_button.grid(row=0, column=1)
+        self.undo_rename_button = ctk.CTkButton(rename_button_frame, text="Undo Last Rename", command=self._undo_last_rename, corner_radius=10, height=50, font=("Inter", 14))
+        self.undo_rename_button.grid(row=0, column=2, padx=(15, 0))
 
     def _select_rename_files(self):
         """Opens a dialog to select multiple files for renaming."""
@@ -132,6 +583,39 @@ class FileToolApp:
             self.rename_files_count_label.configure(text="0 files selected.")
             self.log_message("File selection for renaming canceled.")
 
+    def _rename_scan_key(self):
+        """Returns what a scan of the selected rename folder depends on.
+
+        Includes the folder's modification time, so files added or removed
+        since the last scan trigger a new one.
+        """
+        patterns = tuple(self.rename_pattern_entry.get().split())
+        return (self.rename_selected_folder, self.rename_recursive_checkbox.get() == 1, patterns,
+                os.stat(self.rename_selected_folder).st_mtime_ns)
+
+    def _scan_rename_folder(self):
+        """Returns the {path: FileEntry} files of the selected rename folder, scanning it only if needed."""
+        scan_key = self._rename_scan_key()
+        if scan_key != self.rename_folder_scan_key:
+            folder, recursive, patterns, _ = scan_key
+            entries = scan_files(folder, recursive, patterns=patterns or None,
+                                 on_error=lambda e: self.log_message(f"Warning: {e}"))
+            self.rename_folder_entries = {entry.path: entry for entry in entries}
+            self.rename_folder_scan_key = scan_key
+        return self.rename_folder_entries
+
+    def _refresh_rename_folder_count(self):
+        """Updates the file count label for the selected rename folder."""
+        if not self.rename_selected_folder:
+            return
+        try:
+            num_files = len(self._scan_rename_folder())
+            self.rename_files_count_label.configure(text=f"{num_files} files in folder.")
+            self.log_message(f"Selected folder: {self.rename_selected_folder} for renaming. Number of files: {num_files}.")
+        except OSError as e:
+            self.rename_files_count_label.configure(text="Error reading file count.")
+            self.log_message(f"Error reading file count in folder: {e}.")
+
     def _select_rename_folder(self):
         """Opens a dialog to select a folder for renaming."""
         folder_path = filedialog.askdirectory(title="Select folder to rename")
@@ -139,205 +623,327 @@ class FileToolApp:
             self.rename_selected_folder = folder_path
             self.rename_selected_files = []
             self.rename_path_label.configure(text=f"Selected folder: {self.rename_selected_folder}")
-            # Count files in the folder for display
-            try:
-                num_files = sum(1 for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f)))
-                self.rename_files_count_label.configure(text=f"{num_files} files in folder.")
-                self.log_message(f"Selected folder: {self.rename_selected_folder} for renaming. Number of files: {num_files}.")
-            except Exception as e:
-                self.rename_files_count_label.configure(text="Error reading file count.")
-                self.log_message(f"Error reading file count in folder: {e}.")
+            self._refresh_rename_folder_count()
         else:
             self.rename_path_label.configure(text="No files/folder selected.")
             self.rename_files_count_label.configure(text="0 files selected.")
             self.log_message("Folder selection for renaming canceled.")
 
-    def _get_exif_date(self, filepath):
-        """Extracts the 'DateTimeOriginal' from a file's EXIF data."""
-        try:
-            with open(filepath, 'rb') as f:
-                tags = exifread.process_file(f, stop_tag='DateTimeOriginal')
-                if 'EXIF DateTimeOriginal' in tags:
-                    date_str = str(tags['EXIF DateTimeOriginal'])
-                    return datetime.datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                elif 'EXIF DateTimeDigitized' in tags:
-                    date_str = str(tags['EXIF DateTimeDigitized'])
-                    return datetime.datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-        except Exception:
-            pass
-        return None
-
-    def _rename_files_task(self, files_to_rename, new_base_name, sort_method, is_part_of_combined_process=False):
+    def _rename_files_task(self, files_to_rename, new_base_name, sort_method, is_part_of_combined_process=False, file_info=None, trace=None, progress=None):
         """The actual file renaming logic, run in a separate thread."""
         if not files_to_rename:
             self.log_message("No files to rename.")
             if not is_part_of_combined_process:
-                self.master.after(0, lambda: messagebox.showinfo("Information", "No files to rename in the selected location."))
+                self._call_on_main(lambda: messagebox.showinfo("Information", "No files to rename in the selected location."))
             return (0, 0, "no_files", []) # Return status for combined process
 
         # The last_operation_folder is set here for the rename part.
         # For combined process, it will be overwritten by the JPG export folder.
-        current_operation_folder = os.path.dirname(files_to_rename[0]) if files_to_rename else ""
         if not is_part_of_combined_process:
-            self.last_operation_folder = current_operation_folder
-
-        if sort_method == "Date Taken (EXIF)":
-            self.log_message("Sorting files by date taken (EXIF)...")
-            files_with_dates = []
-            for f_path in files_to_rename:
-                exif_date = self._get_exif_date(f_path)
-                if exif_date:
-                    files_with_dates.append((exif_date, f_path))
-                else:
-                    try:
-                        creation_time = os.path.getctime(f_path)
-                        files_with_dates.append((datetime.datetime.fromtimestamp(creation_time), f_path))
-                        self.log_message(f"No EXIF date for '{os.path.basename(f_path)}', using creation date.")
-                    except OSError:
-                        files_with_dates.append((datetime.datetime.min, f_path))
-                        self.log_message(f"No EXIF date and error reading creation date for '{os.path.basename(f_path)}'.")
-
-            files_with_dates.sort(key=lambda x: (x[0], x[1]))
-            files_to_rename = [f_path for date, f_path in files_with_dates]
-            self.log_message("Files sorted by date taken (EXIF).")
-
-        elif sort_method == "Creation Date":
-            try:
-                files_to_rename.sort(key=lambda f: os.path.getctime(f))
-                self.log_message("Files sorted by creation date.")
-            except OSError as e:
-                self.log_message(f"Error while sorting files by creation date: {e}. Continuing with alphabetical sort.")
-                files_to_rename.sort()
-        else: # "Alphabetically"
-            files_to_rename.sort()
-            self.log_message("Files sorted alphabetically.")
-
-        total_files = len(files_to_rename)
-        num_digits = max(2, len(str(total_files)))
-
-        self.log_message(f"Starting to rename {total_files} files...")
-        renamed_count = 0
-        failed_count = 0
-        renamed_paths = [] # To return new paths for combined process
-
-        for i, old_path in enumerate(files_to_rename):
-            directory, old_filename = os.path.split(old_path)
-            _, file_extension = os.path.splitext(old_filename)
+            self.last_operation_folder = os.path.dirname(files_to_rename[0])
 
-            counter = str(i + 1).zfill(num_digits)
-            new_filename = f"{new_base_name}_{counter}{file_extension}"
-            new_path = os.path.join(directory, new_filename)
+        return core.rename_files(files_to_rename, new_base_name, sort_method, log=self.log_message, progress=progress or self.log_queue.progress, file_info=file_info, trace=trace, stop_event=self.job_queue.stop_event)
 
-            try:
-                os.rename(old_path, new_path)
-                self.log_message(f"Renamed: '{old_filename}' to '{new_filename}'")
-                renamed_count += 1
-                renamed_paths.append(new_path)
-            except OSError as e:
-                self.log_message(f"Error renaming '{old_filename}': {e}")
-                failed_count += 1
-                renamed_paths.append(old_path) # Keep old path if rename failed
-            except Exception as e:
-                self.log_message(f"Unexpected error renaming '{old_filename}': {e}")
-                failed_count += 1
-                renamed_paths.append(old_path) # Keep old path if rename failed
-
-        self.log_message("--- Renaming finished ---")
-        self.log_message(f"Successfully renamed {renamed_count} files.")
-        if failed_count > 0:
-            self.log_message(f"Failed to rename {failed_count} files.")
-        
-        return (renamed_count, failed_count, "completed", renamed_paths)
 
+    def _get_rename_selection(self):
+        """Returns the (new_base_name, files, file_info, output_dir_base) selected on the rename tab.
 
-    def _rename_files_threaded(self):
-        """Starts the file renaming process in a new thread."""
+        Shows what is missing and returns None if nothing can be renamed.
+        """
         new_base_name = self.new_name_entry.get().strip()
         if not new_base_name:
             messagebox.showerror("Error", "Please enter a new base name.")
             self.log_message("Error: No base name entered.")
-            return
+            return None
 
         files_to_process = []
+        file_info = None
+        output_dir_base = None
         if self.rename_selected_files:
             files_to_process = list(self.rename_selected_files)
         elif self.rename_selected_folder:
             try:
-                files_to_process = [os.path.join(self.rename_selected_folder, f) for f in os.listdir(self.rename_selected_folder) if os.path.isfile(os.path.join(self.rename_selected_folder, f))]
+                file_info = self._scan_rename_folder()
+                files_to_process = list(file_info)
+                output_dir_base = self.rename_selected_folder
             except OSError as e:
                 messagebox.showerror("Error", f"Could not read folder: {e}")
                 self.log_message(f"Error reading folder: {e}")
-                return
+                return None
         else:
             messagebox.showwarning("Warning", "Please select files or a folder.")
             self.log_message("Warning: No files or folder selected.")
-            return
+            return None
 
         if not files_to_process:
             messagebox.showinfo("Information", "No files to rename in the selected location.")
             self.log_message("No files to rename.")
-            return
-        
-        # Disable button during operation
-        self.rename_button.configure(state="disabled")
-        self.log_message("Starting background operation...")
+            return None
+        return new_base_name, files_to_process, file_info, output_dir_base
 
+    def _preview_renames(self):
+        """Computes the rename order in the background and shows it in a preview window."""
+        selection = self._get_rename_selection()
+        if selection is None:
+            return
+        new_base_name, files_to_process, file_info, _ = selection
         sort_method = self.sort_option_menu.get()
-        combined_process = self.combine_process_checkbox.get() == 1
+        self.preview_button.configure(state="disabled")
+        self.log_message(f"Computing the rename order of {len(files_to_process)} files...")
 
-        # Start a new thread for the combined or rename-only task
-        processing_thread = threading.Thread(target=self._run_combined_or_rename_task, args=(files_to_process, new_base_name, sort_method, combined_process))
-        processing_thread.start()
+        def plan_task():
+            try:
+                plan = core.plan_renames(files_to_process, new_base_name, sort_method, log=self.log_message, file_info=file_info)
+            except Exception as e:
+                self.log_message(f"Error computing the rename order: {e}")
+                plan = None
 
-    def _run_combined_or_rename_task(self, files_to_process, new_base_name, sort_method, combined_process):
-        """Handles either renaming only or combined rename+convert."""
-        renamed_count, rename_failed_count, rename_status_str, renamed_paths = \
-            self._rename_files_task(files_to_process, new_base_name, sort_method, is_part_of_combined_process=combined_process)
+            def show():
+                self.preview_button.configure(state="normal")
+                if plan:
+                    RenamePreviewWindow(self.master, plan, f"Rename preview: {len(plan)} files, {sort_method}")
+            self._call_on_main(show)
+        threading.Thread(target=plan_task, daemon=True).start()
 
-        if rename_status_str == "no_files":
-            self.master.after(0, lambda: self.rename_button.configure(state="normal"))
+    def _rename_files_threaded(self):
+        """Queues the renaming (or the combined rename and convert) as a job."""
+        selection = self._get_rename_selection()
+        if selection is None:
             return
+        new_base_name, files_to_process, file_info, output_dir_base = selection
 
+        sort_method = self.sort_option_menu.get()
+        combined_process = self.combine_process_checkbox.get() == 1
+        worker_count = 1
+        options = None
         if combined_process:
-            self.log_message("\n--- Starting combined process: Rename RAW + Convert to JPG ---")
-            
-            # Filter for RAW files among the renamed paths for conversion
-            raw_files_for_conversion = [f_path for f_path in renamed_paths if f_path.lower().endswith(self.supported_raw_formats)]
-
-            if not raw_files_for_conversion:
-                self.log_message("No RAW files to convert after renaming. Ending combined process.")
-                self.master.after(0, lambda: messagebox.showinfo("Information", "No RAW files to convert after renaming."))
-                self.master.after(0, lambda: self.rename_button.configure(state="normal"))
+            worker_count = self._get_worker_count()
+            options = self._get_conversion_options() if worker_count is not None else None
+            if options is None:
                 return
 
-            self.log_message("\nStep 2/2: Converting newly named RAW files to JPG...")
-            
-            # The base directory for JPG export will be the directory of the first renamed file
-            output_dir_base = os.path.dirname(raw_files_for_conversion[0])
-            processed_count, skipped_count, failed_count = self._perform_raw_conversion_task(raw_files_for_conversion, output_dir_base)
+        params = {"new_base_name": new_base_name, "sort_method": sort_method, "worker_count": worker_count,
+                  "options": options.to_dict() if options else None, "output_dir_base": output_dir_base,
+                  "trace": self.trace_checkbox.get() == 1}
+        extras = None
+        if file_info is None:
+            params["files"] = files_to_process
+        else:
+            # The folder is saved with the job; the scan is only reused if the folder is unchanged when the job starts
+            folder, recursive, patterns, mtime_ns = self.rename_folder_scan_key
+            params.update(folder=folder, recursive=recursive, patterns=list(patterns))
+            extras = {"file_info": file_info, "folder_mtime_ns": mtime_ns}
+        location = output_dir_base or os.path.dirname(files_to_process[0])
+        action = "Rename and convert" if combined_process else "Rename"
+        self._submit_job("combined" if combined_process else "rename",
+                         f"{action} {len(files_to_process)} files in '{location}' to '{new_base_name}_NN'", params, extras)
+
+    def _job_rename_files(self, job):
+        """Returns the (files, file_info) of a rename job, scanning its folder again if it changed since the job was queued."""
+        params = job.params
+        if params.get("files") is not None:
+            return list(params["files"]), None
+        file_info = job.extras.get("file_info")
+        if file_info is None or os.stat(params["folder"]).st_mtime_ns != job.extras.get("folder_mtime_ns"):
+            entries = scan_files(params["folder"], params["recursive"], patterns=params["patterns"] or None,
+                                 on_error=lambda e: self.log_message(f"Warning: {e}"))
+            file_info = {entry.path: entry for entry in entries}
+        return list(file_info), file_info
+
+    def _run_combined_or_rename_task(self, job, options, trace, progress):
+        """Handles either renaming only or combined rename+convert."""
+        params = job.params
+        new_base_name = params["new_base_name"]
+        sort_method = params["sort_method"]
+        files_to_process, file_info = self._job_rename_files(job)
+        # The files are renamed, so the cached scan of the folder is out of date
+        self.rename_folder_scan_key = None
+        if job.kind == "combined":
+            renamed_count, rename_failed_count, processed_count, skipped_count, failed_count, jpg_folder = \
+                core.rename_and_convert(files_to_process, new_base_name, sort_method, params["worker_count"], log=self.log_message, progress=progress,
+                                        options=options, file_info=file_info, output_dir_base=params["output_dir_base"], trace=trace,
+                                        cancel_event=job.cancel_event, stop_event=self.job_queue.stop_event)
+            self._finish_trace(trace)
+
+            if jpg_folder is None:
+                if rename_failed_count and not renamed_count:
+                    self._call_on_main(lambda: messagebox.showerror("Renaming Canceled", "No files were renamed. See the status log for details."))
+                elif renamed_count or rename_failed_count:
+                    self._call_on_main(lambda: messagebox.showinfo("Information", "No RAW files to convert after renaming."))
+                return
 
-            self.last_operation_folder = os.path.join(output_dir_base, 'exported_jpg') # Update folder for combined process
+            self.last_operation_folder = jpg_folder # Update folder for combined process
 
             final_msg_title = "Combined Process Finished"
             final_msg = f"Renaming: {renamed_count} successful, {rename_failed_count} failed.\n" \
                         f"RAW to JPG Conversion: {processed_count} processed, {skipped_count} skipped, {failed_count} failed."
-            
-            if rename_failed_count > 0 or failed_count > 0:
+            if trace is not None and trace.first_output_seconds is not None:
+                final_msg += f"\nFirst JPG after {trace.first_output_seconds:.1f} s."
+
+            if job.cancel_event.is_set():
+                final_msg_title = "Combined Process Canceled"
+            elif rename_failed_count > 0 or failed_count > 0:
                 final_msg_title = "Combined Process Finished with Errors"
-                
-            self.master.after(0, lambda: self._show_completion_dialog(final_msg_title, final_msg, self.last_operation_folder))
+
+            folder = self.last_operation_folder
+            self._call_on_main(lambda: self._show_completion_dialog(final_msg_title, final_msg, folder))
 
         else: # Only rename
-            self.master.after(0, lambda: self.rename_button.configure(state="normal")) # Re-enable button
+            renamed_count, rename_failed_count, rename_status_str, _ = \
+                self._rename_files_task(files_to_process, new_base_name, sort_method, file_info=file_info, trace=trace, progress=progress)
+            self._finish_trace(trace)
+
+            if rename_status_str in ("no_files", "conflict"):
+                if rename_status_str == "conflict":
+                    self._call_on_main(lambda: messagebox.showerror("Renaming Canceled", "Some of the new names are already taken, so no files were renamed. See the status log for details."))
+                return
+
             msg = f"Successfully renamed {renamed_count} files."
+            folder = self.last_operation_folder
             if rename_failed_count > 0:
                 msg += f"\nFailed to rename {rename_failed_count} files."
-                self.master.after(0, lambda: self._show_completion_dialog("Finished with Errors", msg, self.last_operation_folder))
+                self._call_on_main(lambda: self._show_completion_dialog("Finished with Errors", msg, folder))
             else:
-                self.master.after(0, lambda: self._show_completion_dialog("Finished", msg, self.last_operation_folder))
-        
-        self.master.after(0, lambda: self.rename_button.configure(state="normal")) # Ensure button is re-enabled
+                self._call_on_main(lambda: self._show_completion_dialog("Finished", msg, folder))
+
+    def _check_interrupted_renames(self):
+        """Offers to resume or roll back rename jobs that were interrupted, e.g. by a crash, then restores the job queue.
+
+        The resumes and rollbacks are queued ahead of the restored jobs, so
+        nothing else touches their folders while their files are being moved.
+        """
+        try:
+            interrupted = core.interrupted_rename_jobs()
+        except OSError as e:
+            self.log_message(f"Warning: Could not check for interrupted rename jobs: {e}")
+            interrupted = []
+        for journal in interrupted:
+            answer = messagebox.askyesnocancel(
+                "Interrupted Rename",
+                f"A rename job of {len(journal.moves)} files from {journal.created} was interrupted "
+                f"({journal.phase_done[2]} files done).\n\n"
+                "Yes: finish renaming\nNo: put all files back under their old names\nCancel: decide later")
+            if answer is None:
+                continue
+            if answer:
+                job = self._submit_journal_job("resume", journal, f"Finish rename job from {journal.created}", "Rename Resumed",
+                                               jobs.PRIORITY_URGENT)
+            else:
+                job = self._submit_journal_job("revert", journal, f"Roll back rename job from {journal.created}", "Rename Rolled Back",
+                                               jobs.PRIORITY_URGENT)
+            self.job_queue.move_to_front(job.id)
+        self._restore_job_queue()
+
+    def _undo_last_rename(self):
+        if self.job_queue.has_jobs(RENAMING_JOB_KINDS):
+            messagebox.showwarning("Warning", "Please wait until the queued rename jobs have finished, or remove them from the queue.")
+            return
+        journal = core.last_rename_job()
+        if journal is None:
+            messagebox.showinfo("Information", "There is no rename job to undo.")
+            return
+        folders = sorted({os.path.dirname(old_path) for old_path, _ in journal.moves})
+        if not messagebox.askyesno("Undo Last Rename",
+                                   f"Restore the old names of the {len(journal.moves)} files renamed on {journal.created} in "
+                                   f"'{folders[0]}'{' and other folders' if len(folders) > 1 else ''}?"):
+            return
+        self._submit_journal_job("revert", journal, f"Undo rename job from {journal.created}", "Undo Finished",
+                                 PRIORITY_LABELS[self.job_priority_menu.get()])
+
+    def _submit_journal_job(self, action, journal, title, done_title, priority):
+        """Queues core.resume_rename_job ("resume") or core.revert_rename_job ("revert") for a RenameJournal."""
+        params = {"action": action, "journal": journal.path, "done_title": done_title, "trace": False}
+        job = self.job_queue.submit("journal", title, params, priority, {"journal": journal})
+        self.log_message(f"Queued: {title}")
+        return job
+
+    def _run_journal_task(self, job, progress):
+        """Finishes, rolls back or undoes a rename job from its journal. Runs on the job queue's thread."""
+        journal = job.extras["journal"]
+        action = core.resume_rename_job if job.params["action"] == "resume" else core.revert_rename_job
+        title = job.params["done_title"]
+        # The file names change, so the cached scan of the folder is out of date
+        self.rename_folder_scan_key = None
+        try:
+            done_count, failed_count = action(journal, log=self.log_message, progress=progress, stop_event=self.job_queue.stop_event)
+            msg = f"{done_count} files renamed, {failed_count} failed."
+        except (OSError, ValueError) as e:
+            self.log_message(f"Error: {e}")
+            failed_count, msg = 1, str(e)
+        folder = os.path.dirname(journal.moves[0][0]) if journal.moves else None
+        self._call_on_main(lambda: self._show_completion_dialog(f"{title} with Errors" if failed_count else title, msg, folder))
+
+    def _offload_card(self):
+        """Queues a copy of a card (or any folder, with subfolders) to another folder under the new names.
+
+        Uses the base name, sort order and file pattern of the rename tab; with
+        "Combine processes" checked, the RAW files are converted as they are copied.
+        """
+        new_base_name = self.new_name_entry.get().strip()
+        if not new_base_name:
+            messagebox.showerror("Error", "Please enter a new base name.")
+            self.log_message("Error: No base name entered.")
+            return
+        source_folder = filedialog.askdirectory(title="Select the card or folder to offload")
+        if not source_folder:
+            self.log_message("Offload canceled.")
+            return
+        destination_folder = filedialog.askdirectory(title="Select the folder to copy the files to")
+        if not destination_folder:
+            self.log_message("Offload canceled.")
+            return
+        if os.path.abspath(destination_folder) == os.path.abspath(source_folder):
+            messagebox.showerror("Error", "Please select a destination folder other than the card.")
+            return
 
+        convert = self.combine_process_checkbox.get() == 1
+        worker_count = 1
+        options = None
+        if convert:
+            worker_count = self._get_worker_count()
+            options = self._get_conversion_options() if worker_count is not None else None
+            if options is None:
+                return
+
+        params = {"source_folder": source_folder, "destination_folder": destination_folder, "new_base_name": new_base_name,
+                  "sort_method": self.sort_option_menu.get(), "patterns": self.rename_pattern_entry.get().split(),
+                  "convert": convert, "worker_count": worker_count, "options": options.to_dict() if options else None,
+                  "trace": self.trace_checkbox.get() == 1}
+        self._submit_job("offload", f"Offload '{source_folder}' to '{destination_folder}'", params)
+
+    def _run_offload_task(self, job, options, trace, progress):
+        """Scans the card and runs the offload, in a separate thread."""
+        params = job.params
+        destination_folder = params["destination_folder"]
+        try:
+            file_info = {entry.path: entry for entry in scan_files(
+                params["source_folder"], True, patterns=params["patterns"] or None, on_error=lambda e: self.log_message(f"Warning: {e}"))}
+            copied_count, already_count, copy_failed_count, processed_count, skipped_count, failed_count, jpg_folder = \
+                core.offload_files(list(file_info), destination_folder, params["new_base_name"], params["sort_method"], params["worker_count"],
+                                   log=self.log_message, progress=progress, options=options, file_info=file_info,
+                                   convert=params["convert"], trace=trace, cancel_event=job.cancel_event)
+        except OSError as e:
+            self.log_message(f"Error: {e}")
+            self._finish_trace(trace)
+            self._call_on_main(lambda: messagebox.showerror("Offload Failed", str(e)))
+            return
+        self._finish_trace(trace)
+
+        if copy_failed_count and not copied_count and not already_count:
+            self._call_on_main(lambda: messagebox.showerror("Offload Canceled", "No files were copied. See the status log for details."))
+            return
+        self.last_operation_folder = jpg_folder or destination_folder
+        final_msg = f"Offload: {copied_count} copied, {already_count} already there, {copy_failed_count} failed."
+        if jpg_folder is not None:
+            final_msg += f"\nRAW to JPG Conversion: {processed_count} processed, {skipped_count} skipped, {failed_count} failed."
+        if job.cancel_event.is_set():
+            final_msg_title = "Offload Canceled"
+        elif copy_failed_count or failed_count:
+            final_msg_title = "Offload Finished with Errors"
+        else:
+            final_msg_title = "Offload Finished"
+        folder = self.last_operation_folder
+        self._call_on_main(lambda: self._show_completion_dialog(final_msg_title, final_msg, folder))
 
     # --- UI for "Convert RAW to JPG" Tab ---
     def _create_raw_to_jpg_tab_ui(self, tab):
@@ -350,10 +956,89 @@ class FileToolApp:
         self.select_raw_folder_button = ctk.CTkButton(tab, text="Select Folder with RAW Files", command=self._select_raw_folder_for_conversion, corner_radius=8, width=200, font=("Inter", 13))
         self.select_raw_folder_button.pack(pady=10)
 
+        self.raw_recursive_checkbox = ctk.CTkCheckBox(tab, text="Include subfolders (e.g. DCIM/100CANON, DCIM/101CANON)", font=("Inter", 13))
+        self.raw_recursive_checkbox.pack(pady=(0, 10), padx=20, anchor="w")
+
+        # Number of worker processes used for conversion (also used by the combined process)
+        worker_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        worker_frame.pack(pady=(5, 0), padx=20, anchor="w")
+        self.conversion_settings_frame = worker_frame
+        ctk.CTkLabel(worker_frame, text="Worker processes:", font=("Inter", 13)).grid(row=0, column=0, padx=(0, 10))
+        self.worker_count_entry = ctk.CTkEntry(worker_frame, width=70, corner_radius=8, font=("Inter", 13))
+        self.worker_count_entry.insert(0, str(os.cpu_count() or 1))
+        self.worker_count_entry.grid(row=0, column=1)
+
+        ctk.CTkLabel(worker_frame, text="JPG output:", font=("Inter", 13)).grid(row=0, column=2, padx=(25, 10))
+        self.output_mode_menu = ctk.CTkOptionMenu(worker_frame, values=list(OUTPUT_MODE_LABELS), font=("Inter", 13))
+        self.output_mode_menu.set("Re-encode (rotate pixels)")
+        self.output_mode_menu.grid(row=0, column=3)
+
+        # Source: embedded preview or full RAW development
+        ctk.CTkLabel(worker_frame, text="Source:", font=("Inter", 13)).grid(row=1, column=0, padx=(0, 10), pady=(10, 0), sticky="w")
+        self.source_menu = ctk.CTkOptionMenu(worker_frame, values=list(SOURCE_LABELS), command=self._on_source_changed, font=("Inter", 13))
+        self.source_menu.set("Embedded preview (fast)")
+        self.source_menu.grid(row=1, column=1, columnspan=3, pady=(10, 0), sticky="w")
+
+        # Read-ahead overlaps reading files (e.g. from a card or network share) with converting
+        ctk.CTkLabel(worker_frame, text="Read-ahead files:", font=("Inter", 13)).grid(row=2, column=0, padx=(0, 10), pady=(10, 0), sticky="w")
+        self.prefetch_files_entry = ctk.CTkEntry(worker_frame, width=70, corner_radius=8, font=("Inter", 13))
+        self.prefetch_files_entry.insert(0, str(prefetch.DEFAULT_PREFETCH_FILES))
+        self.prefetch_files_entry.grid(row=2, column=1, pady=(10, 0))
+        ctk.CTkLabel(worker_frame, text="Read-ahead memory (MB):", font=("Inter", 13)).grid(row=2, column=2, padx=(25, 10), pady=(10, 0))
+        self.prefetch_mb_entry = ctk.CTkEntry(worker_frame, width=70, corner_radius=8, font=("Inter", 13))
+        self.prefetch_mb_entry.insert(0, str(prefetch.DEFAULT_PREFETCH_MB))
+        self.prefetch_mb_entry.grid(row=2, column=3, pady=(10, 0), sticky="w")
+
+        # One output per checked profile, all made from a single decode
+        ctk.CTkLabel(worker_frame, text="Export profiles:", font=("Inter", 13)).grid(row=3, column=0, padx=(0, 10), pady=(10, 0), sticky="w")
+        profiles_frame = ctk.CTkFrame(worker_frame, fg_color="transparent")
+        profiles_frame.grid(row=3, column=1, columnspan=3, pady=(10, 0), sticky="w")
+        self.profile_checkboxes = {}
+        for column, (name, profile) in enumerate(self.export_profiles.items()):
+            label = name if profile.max_edge is None else f"{name} ({profile.max_edge} px)"
+            checkbox = ctk.CTkCheckBox(profiles_frame, text=label, font=("Inter", 12))
+            if name == profiles.PROFILE_FULL.name:
+                checkbox.select()
+            checkbox.grid(row=0, column=column, padx=(0, 10))
+            self.profile_checkboxes[name] = checkbox
+
+        # Files whose content was converted before, e.g. from a card imported twice
+        ctk.CTkLabel(worker_frame, text="Duplicates:", font=("Inter", 13)).grid(row=4, column=0, padx=(0, 10), pady=(10, 0), sticky="w")
+        self.duplicates_menu = ctk.CTkOptionMenu(worker_frame, values=list(DUPLICATE_LABELS), font=("Inter", 13))
+        self.duplicates_menu.set("Report, convert anyway")
+        self.duplicates_menu.grid(row=4, column=1, columnspan=3, pady=(10, 0), sticky="w")
+
+        self.develop_frame = ctk.CTkFrame(tab, corner_radius=8)
+        self.develop_half_size_checkbox = ctk.CTkCheckBox(self.develop_frame, text="Half size (faster)", font=("Inter", 12))
+        self.develop_half_size_checkbox.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+        ctk.CTkLabel(self.develop_frame, text="Bit depth:", font=("Inter", 12)).grid(row=0, column=1, padx=(10, 5), pady=(10, 5))
+        self.develop_bit_depth_menu = ctk.CTkOptionMenu(self.develop_frame, values=list(BIT_DEPTH_LABELS), width=120, font=("Inter", 12))
+        self.develop_bit_depth_menu.grid(row=0, column=2, padx=(0, 10), pady=(10, 5))
+        ctk.CTkLabel(self.develop_frame, text="White balance:", font=("Inter", 12)).grid(row=1, column=0, padx=10, pady=5, sticky="w")
+        self.develop_white_balance_menu = ctk.CTkOptionMenu(self.develop_frame, values=list(develop.WHITE_BALANCE_MODES), width=120, font=("Inter", 12))
+        self.develop_white_balance_menu.grid(row=1, column=0, padx=(110, 0), pady=5, sticky="w")
+        ctk.CTkLabel(self.develop_frame, text="Demosaic:", font=("Inter", 12)).grid(row=1, column=1, padx=(10, 5), pady=5)
+        self.develop_demosaic_menu = ctk.CTkOptionMenu(self.develop_frame, values=list(develop.DEMOSAIC_ALGORITHMS), width=120, font=("Inter", 12))
+        self.develop_demosaic_menu.grid(row=1, column=2, padx=(0, 10), pady=5)
+        ctk.CTkLabel(self.develop_frame, text="Memory budget (MB, empty = half of RAM):", font=("Inter", 12)).grid(row=2, column=0, columnspan=2, padx=10, pady=(5, 10), sticky="w")
+        self.develop_memory_budget_entry = ctk.CTkEntry(self.develop_frame, width=120, corner_radius=8, font=("Inter", 12))
+        self.develop_memory_budget_entry.grid(row=2, column=2, padx=(0, 10), pady=(5, 10))
+        # Only shown when "Full RAW development" is selected
+        self.develop_frame_pack_options = dict(pady=(10, 0), padx=20, anchor="w")
+
         ctk.CTkLabel(tab, text="Use the 'Rename Files' tab to combine renaming with RAW to JPG conversion.", wraplength=550, font=("Inter", 11, "italic")).pack(pady=(10, 20), padx=20, anchor="w")
 
         self.start_raw_conversion_button = ctk.CTkButton(tab, text="Start Conversion (RAW to JPG only)", command=self._start_raw_conversion_threaded, corner_radius=10, height=50, font=("Inter", 16, "bold"), state="disabled")
-        self.start_raw_conversion_button.pack(pady=20)
+        self.start_raw_conversion_button.pack(pady=(20, 10))
+
+        # Hot folder: convert (and optionally rename) RAW files as they arrive
+        watch_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        watch_frame.pack(pady=(0, 20), padx=20)
+        ctk.CTkLabel(watch_frame, text="Rename arriving files to (optional):", font=("Inter", 13)).grid(row=0, column=0, padx=(0, 10))
+        self.watch_rename_entry = ctk.CTkEntry(watch_frame, width=140, corner_radius=8, font=("Inter", 13))
+        self.watch_rename_entry.grid(row=0, column=1, padx=(0, 15))
+        self.watch_button = ctk.CTkButton(watch_frame, text="Start Watching Folder", command=self._toggle_watch, corner_radius=8, width=180, font=("Inter", 13), state="disabled")
+        self.watch_button.grid(row=0, column=2)
 
     def _select_raw_folder_for_conversion(self):
         """Opens a dialog to select a folder containing RAW files for conversion."""
@@ -363,120 +1048,183 @@ class FileToolApp:
             self.raw_folder_label.configure(text=f"Selected RAW folder: {self.raw_conversion_folder}")
             self.log_message(f"Selected RAW folder for conversion: {self.raw_conversion_folder}")
             self.start_raw_conversion_button.configure(state="normal") # Enable button
+            self.watch_button.configure(state="normal")
         else:
             self.raw_folder_label.configure(text="No RAW folder selected.")
             self.log_message("RAW folder selection canceled.")
             self.start_raw_conversion_button.configure(state="disabled") # Disable button
+            if self.watch_stop_event is None:
+                self.watch_button.configure(state="disabled")
 
-    def _rotate_image_based_on_exif(self, image):
-        """Rotates a PIL Image object based on its EXIF Orientation tag."""
+    def _get_worker_count(self):
+        """Returns the number of conversion worker processes from the RAW tab, or None if invalid."""
+        value = self.worker_count_entry.get().strip()
         try:
-            exif = image.getexif()
-            if exif:
-                orientation_tag_id = 274 # Hex 0x0112, corresponds to Orientation
-                if orientation_tag_id in exif:
-                    orientation = exif[orientation_tag_id]
-                    if orientation == 3:
-                        image = image.rotate(180, expand=True)
-                    elif orientation == 6:
-                        image = image.rotate(270, expand=True)
-                    elif orientation == 8:
-                        image = image.rotate(90, expand=True)
-        except Exception as e:
-            self.log_message(f"Warning: Error processing EXIF data for rotation: {e}")
-        return image
+            worker_count = int(value) if value else (os.cpu_count() or 1)
+            if worker_count < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "The number of worker processes must be a positive whole number.")
+            self.log_message(f"Error: Invalid number of worker processes: '{value}'.")
+            return None
+        return worker_count
+
+    def _on_source_changed(self, source_label):
+        """Shows the development options only when full RAW development is selected."""
+        if SOURCE_LABELS[source_label] == core.SOURCE_DEVELOP:
+            self.develop_frame.pack(after=self.conversion_settings_frame, **self.develop_frame_pack_options)
+        else:
+            self.develop_frame.pack_forget()
 
-    def _process_single_raw_image(self, raw_file_path, output_file):
-        """Processes a single RAW file, extracts the thumbnail, rotates it, and saves as JPG."""
+    def _get_conversion_options(self):
+        """Returns the ConversionOptions selected on the RAW tab, or None if they are invalid."""
+        memory_budget_value = self.develop_memory_budget_entry.get().strip()
+        memory_budget_mb = None
+        if memory_budget_value:
+            try:
+                memory_budget_mb = int(memory_budget_value)
+                if memory_budget_mb < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "The memory budget must be a positive whole number of megabytes.")
+                self.log_message(f"Error: Invalid memory budget: '{memory_budget_value}'.")
+                return None
+
+        prefetch_values = []
+        for entry, description in ((self.prefetch_files_entry, "number of read-ahead files"),
+                                   (self.prefetch_mb_entry, "read-ahead memory")):
+            value = entry.get().strip()
+            try:
+                number = int(value)
+                if number < 0:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", f"The {description} must be a whole number (0 turns read-ahead off).")
+                self.log_message(f"Error: Invalid {description}: '{value}'.")
+                return None
+            prefetch_values.append(number)
+
+        selected_profiles = [self.export_profiles[name] for name, checkbox in self.profile_checkboxes.items() if checkbox.get() == 1]
         try:
-            with rawpy.imread(raw_file_path) as raw:
-                # Extract the embedded thumbnail, which is usually a JPG
-                embedded_image = raw.extract_thumb()
-                if embedded_image.format == rawpy.ThumbFormat.JPEG:
-                    img = Image.open(io.BytesIO(embedded_image.data))
-                    img = self._rotate_image_based_on_exif(img)
-                    img.save(output_file, "jpeg", quality=95, optimize=True)
-                    self.log_message(f"Saved and rotated JPG preview: '{os.path.basename(output_file)}'")
-                    return True
-                else:
-                    self.log_message(f"Warning: Embedded JPG image not found in RAW file: '{os.path.basename(raw_file_path)}'")
-                    return False
-        except rawpy.LibRawFileException as e:
-            self.log_message(f"LibRaw error while processing '{os.path.basename(raw_file_path)}': {e}")
-            return False
-        except Exception as e:
-            self.log_message(f"Unexpected error while processing '{os.path.basename(raw_file_path)}': {e}")
-            return False
+            profiles.check_profiles(selected_profiles)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            self.log_message(f"Error: {e}")
+            return None
+
+        return core.ConversionOptions(
+            output_mode=OUTPUT_MODE_LABELS[self.output_mode_menu.get()],
+            source=SOURCE_LABELS[self.source_menu.get()],
+            half_size=self.develop_half_size_checkbox.get() == 1,
+            output_bps=BIT_DEPTH_LABELS[self.develop_bit_depth_menu.get()],
+            white_balance=self.develop_white_balance_menu.get(),
+            demosaic=self.develop_demosaic_menu.get(),
+            memory_budget_mb=memory_budget_mb,
+            prefetch_files=prefetch_values[0],
+            prefetch_mb=prefetch_values[1],
+            profiles=selected_profiles,
+            duplicates=DUPLICATE_LABELS[self.duplicates_menu.get()],
+        )
 
     def _start_raw_conversion_threaded(self):
-        """Starts the RAW to JPG conversion process in a new thread."""
+        """Queues the RAW to JPG conversion of the selected folder as a job."""
         if not self.raw_conversion_folder or not os.path.isdir(self.raw_conversion_folder):
             messagebox.showerror("Error", "Please select a valid RAW folder.")
             self.log_message("Error: No valid RAW folder selected.")
             return
 
-        self.start_raw_conversion_button.configure(state="disabled")
-        self.log_message("Starting RAW to JPG conversion in the background...")
+        worker_count = self._get_worker_count()
+        if worker_count is None:
+            return
+        options = self._get_conversion_options()
+        if options is None:
+            return
 
-        conversion_thread = threading.Thread(target=self._run_raw_conversion_task)
-        conversion_thread.start()
+        params = {"folder": self.raw_conversion_folder, "recursive": self.raw_recursive_checkbox.get() == 1,
+                  "worker_count": worker_count, "options": options.to_dict(), "trace": self.trace_checkbox.get() == 1}
+        self._submit_job("convert", f"Convert RAW files in '{self.raw_conversion_folder}'", params)
 
-    def _run_raw_conversion_task(self):
+    def _run_raw_conversion_task(self, job, options, trace, progress):
         """The actual RAW to JPG conversion logic, run in a separate thread."""
-        raws_dir = self.raw_conversion_folder
-        
-        files_to_process_for_conversion = [os.path.join(raws_dir, f) for f in os.listdir(raws_dir) if os.path.isfile(os.path.join(raws_dir, f)) and f.lower().endswith(self.supported_raw_formats)]
+        raws_dir = job.params["folder"]
+        recursive = job.params["recursive"]
+
+        # Discovered lazily, so the first files are converting while the rest are still being found;
+        # the listing runs ahead of the conversion to give the ETA its total early
+        files_to_process_for_conversion = scan_ahead(
+            scan_files(raws_dir, recursive, extensions=core.SUPPORTED_RAW_FORMATS, on_error=lambda e: self.log_message(f"Warning: {e}")),
+            lambda count: job.progress.set_total("convert", count))
         self.log_message(f"Starting standard RAW to JPG conversion in '{raws_dir}'...")
 
-        processed_count, skipped_count, failed_count = self._perform_raw_conversion_task(files_to_process_for_conversion, raws_dir)
+        processed_count, skipped_count, failed_count = core.convert_raw_files(files_to_process_for_conversion, raws_dir, job.params["worker_count"], log=self.log_message, progress=progress, options=options, trace=trace,
+                                                                              cancel_event=job.cancel_event)
+        self._finish_trace(trace)
 
-        self.last_operation_folder = os.path.join(raws_dir, 'exported_jpg') # Update last operation folder
+        self.last_operation_folder = os.path.join(raws_dir, core.EXPORT_FOLDER_NAME) # Update last operation folder
+        folder = self.last_operation_folder
 
         # Show final message box on the main thread
-        if failed_count > 0:
-            self.master.after(0, lambda: self._show_completion_dialog("Finished with Errors", f"Conversion finished with {failed_count} errors.", self.last_operation_folder))
+        if job.cancel_event.is_set():
+            self._call_on_main(lambda: self._show_completion_dialog("Conversion Canceled", f"Conversion canceled: {processed_count} processed, {skipped_count} skipped, {failed_count} failed.", folder))
+        elif failed_count > 0:
+            self._call_on_main(lambda: self._show_completion_dialog("Finished with Errors", f"Conversion finished with {failed_count} errors.", folder))
         else:
-            self.master.after(0, lambda: self._show_completion_dialog("Finished", "All RAW files were processed successfully.", self.last_operation_folder))
-
-        self.master.after(0, lambda: self.start_raw_conversion_button.configure(state="normal")) # Re-enable button
+            self._call_on_main(lambda: self._show_completion_dialog("Finished", "All RAW files were processed successfully.", folder))
 
 
-    def _perform_raw_conversion_task(self, files_to_convert, output_dir_base):
-        """Core logic for RAW to JPG conversion, can be called by combined process or direct conversion."""
-        processed_count = 0
-        skipped_count = 0
-        failed_count = 0
-        final_jpg_folder = os.path.join(output_dir_base, 'exported_jpg')
-
-        if not os.path.exists(final_jpg_folder):
-            os.makedirs(final_jpg_folder)
-            self.log_message(f"Created JPG output folder: {final_jpg_folder}")
-        
-        if not files_to_convert:
-            self.log_message("No RAW files to process.")
-            return (0, 0, 0) # Return counts
-
-        for raw_file_path in files_to_convert:
-            filename = os.path.basename(raw_file_path)
-            output_file = os.path.join(final_jpg_folder, os.path.splitext(filename)[0] + '.jpg')
-
-            if os.path.exists(output_file):
-                self.log_message(f"Skipping '{os.path.basename(output_file)}' (already exists).")
-                skipped_count += 1
-            else:
-                if self._process_single_raw_image(raw_file_path, output_file):
-                    processed_count += 1
-                else:
-                    failed_count += 1
-        
-        return (processed_count, skipped_count, failed_count)
+    def _toggle_watch(self):
+        """Starts watching the selected RAW folder, or stops the running watch."""
+        if self.watch_stop_event is not None:
+            self.watch_stop_event.set()
+            self.watch_button.configure(state="disabled", text="Stopping...")
+            self.log_message("Stopping the folder watch after the conversions in progress...")
+            return
 
+        if not self.raw_conversion_folder or not os.path.isdir(self.raw_conversion_folder):
+            messagebox.showerror("Error", "Please select a valid RAW folder.")
+            self.log_message("Error: No valid RAW folder selected.")
+            return
+        worker_count = self._get_worker_count()
+        if worker_count is None:
+            return
+        options = self._get_conversion_options()
+        if options is None:
+            return
 
-    # Expanded list of common RAW formats (class attribute)
-    supported_raw_formats = (
-        '.arw', '.cr2', '.cr3', '.nef', '.dng', '.orf', '.raf', '.pef',
-        '.rw2', '.srw', '.kdc', '.dcr', '.mrw', '.3fr'
-    )
+        self.watch_stop_event = threading.Event()
+        self.watch_button.configure(text="Stop Watching")
+        self.start_raw_conversion_button.configure(state="disabled")
+        self.select_raw_folder_button.configure(state="disabled")
+        recursive = self.raw_recursive_checkbox.get() == 1
+        rename_base = self.watch_rename_entry.get().strip() or None
+        trace = self._start_trace("watch")
+        self.watch_thread = threading.Thread(target=self._run_watch_task, args=(worker_count, options, recursive, rename_base, trace))
+        self.watch_thread.start()
+
+    def _run_watch_task(self, worker_count, options, recursive, rename_base, trace):
+        """Runs the folder watch until it is stopped, in a separate thread."""
+        raws_dir = self.raw_conversion_folder
+        try:
+            watch.watch_folder(raws_dir, options, worker_count, recursive, rename_base, self.watch_stop_event,
+                               log=self.log_message, progress=self.log_queue.progress, trace=trace)
+        except OSError as e:
+            self.log_message(f"Error: The folder watch stopped: {e}")
+        self._finish_trace(trace)
+        self.last_operation_folder = os.path.join(raws_dir, core.EXPORT_FOLDER_NAME)
+
+        def reset_buttons():
+            self.watch_stop_event = None
+            self.watch_button.configure(state="normal", text="Start Watching Folder")
+            self.start_raw_conversion_button.configure(state="normal")
+            self.select_raw_folder_button.configure(state="normal")
+        self._call_on_main(reset_buttons)
+
+    def stop_watching(self):
+        """Stops a running folder watch and waits for it; called when the window is closed."""
+        if self.watch_stop_event is not None:
+            self.watch_stop_event.set()
+        if self.watch_thread is not None:
+            self.watch_thread.join()
 
     def _show_completion_dialog(self, title, message, folder_path=None):
         """Shows a custom completion dialog with an 'Open Folder' button."""
@@ -484,7 +1232,7 @@ class FileToolApp:
         dialog.title(title)
         dialog.geometry("380x200") # Increased size for better readability
         dialog.transient(self.master) # Make it appear on top of the main window
-        dialog.grab_set() # Make it modal
+        # Not modal, so more jobs can be queued and the queue keeps going while it is open
 
         ctk.CTkLabel(dialog, text=message, wraplength=340, justify="center", font=("Inter", 13)).pack(pady=15)
         
@@ -495,10 +1243,10 @@ class FileToolApp:
         close_btn = ctk.CTkButton(dialog, text="Close", command=dialog.destroy, font=("Inter", 13))
         close_btn.pack(pady=5)
 
-        self.master.wait_window(dialog) # Wait for dialog to close
-
 
 if __name__ == "__main__":
     root = ctk.CTk()
     app = FileToolApp(root)
     root.mainloop()
+    app.shutdown()
+    app.log_queue.close()
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    # Keep caches, journals and traces out of the real config folder
+    config_dir = tmp_path / "config"
+    monkeypatch.setenv("PHOTO_TOOL_CONFIG_DIR", str(config_dir))
+    return config_dir
@@ -0,0 +1,73 @@
+"""Hand-built TIFF and JPEG bytes with just the EXIF fields the parsers look at."""
+
+import struct
+
+TAG_MAKE = 0x010F
+TAG_ORIENTATION = 0x0112
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+
+TYPE_ASCII = 2
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+# Compressed data stand-in: the byte-level tools must copy it unchanged, never decode it
+SCAN_DATA = b"\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00" + bytes(range(64)) + b"\xff\xd9"
+
+
+def _ifd(order, offset, entries, next_ifd=0):
+    """Lays out an IFD at `offset` (from the TIFF start) followed by its out-of-line values.
+
+    `entries` holds (tag, type, value) with value a bytes string for ASCII and an int otherwise.
+    """
+    entries = sorted(entries)
+    data_offset = offset + 2 + len(entries) * 12 + 4
+    table = struct.pack(order + "H", len(entries))
+    data = b""
+    for tag, field_type, value in entries:
+        if field_type == TYPE_ASCII:
+            if len(value) <= 4:
+                field = value.ljust(4, b"\0")
+            else:
+                field = struct.pack(order + "I", data_offset + len(data))
+                data += value + b"\0" * (len(value) % 2)
+            table += struct.pack(order + "HHI", tag, field_type, len(value)) + field
+        elif field_type == TYPE_SHORT:
+            table += struct.pack(order + "HHIHH", tag, field_type, 1, value, 0)
+        else:
+            table += struct.pack(order + "HHII", tag, field_type, 1, value)
+    return table + struct.pack(order + "I", next_ifd) + data
+
+
+def make_tiff(order="<", orientation=None, date_original=None, date_digitized=None, exif_ifd=True, make=None):
+    """Returns a TIFF block whose IFD0 holds the orientation (and Make) and links to an EXIF IFD with the dates."""
+    magic = b"II*\0" if order == "<" else b"MM\0*"
+    ifd0_entries = []
+    if orientation is not None:
+        ifd0_entries.append((TAG_ORIENTATION, TYPE_SHORT, orientation))
+    if make is not None:
+        ifd0_entries.append((TAG_MAKE, TYPE_ASCII, make))
+    exif_entries = []
+    if date_original is not None:
+        exif_entries.append((TAG_DATETIME_ORIGINAL, TYPE_ASCII, date_original.encode() + b"\0"))
+    if date_digitized is not None:
+        exif_entries.append((TAG_DATETIME_DIGITIZED, TYPE_ASCII, date_digitized.encode() + b"\0"))
+    if not exif_ifd:
+        return magic + struct.pack(order + "I", 8) + _ifd(order, 8, ifd0_entries)
+
+    # The EXIF IFD pointer's value depends on IFD0's length, which doesn't
+    ifd0_length = len(_ifd(order, 8, ifd0_entries + [(TAG_EXIF_IFD, TYPE_LONG, 0)]))
+    exif_offset = 8 + ifd0_length
+    ifd0 = _ifd(order, 8, ifd0_entries + [(TAG_EXIF_IFD, TYPE_LONG, exif_offset)])
+    return magic + struct.pack(order + "I", 8) + ifd0 + _ifd(order, exif_offset, exif_entries)
+
+
+def make_jpeg(tiff=None):
+    """Returns a JPEG with a JFIF APP0 segment, an APP1 'Exif' segment holding `tiff` (if given) and SCAN_DATA."""
+    app0_payload = b"JFIF\0\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    data = b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", len(app0_payload) + 2) + app0_payload
+    if tiff is not None:
+        app1_payload = b"Exif\0\0" + tiff
+        data += b"\xff\xe1" + struct.pack(">H", len(app1_payload) + 2) + app1_payload
+    return data + SCAN_DATA
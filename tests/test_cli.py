@@ -0,0 +1,20 @@
+"""Command-line entry point."""
+
+import pytest
+
+from photo_tool import cli
+
+
+@pytest.mark.parametrize("argv", [["undo"], ["resume"], ["resume", "--roll-back"]])
+def test_undo_and_resume_save_no_trace(config_dir, capsys, argv):
+    assert cli.main(argv) == 0
+    assert "Throughput" not in capsys.readouterr().out
+    assert not (config_dir / "traces").exists()
+
+
+def test_convert_saves_trace(config_dir, tmp_path, capsys):
+    folder = tmp_path / "empty"
+    folder.mkdir()
+    assert cli.main(["convert", str(folder)]) == 0
+    assert "Throughput" in capsys.readouterr().out
+    assert list((config_dir / "traces").iterdir())
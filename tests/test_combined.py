@@ -0,0 +1,105 @@
+"""Combined rename + convert: RAW files are converted as soon as they have their final name."""
+
+import os
+import threading
+
+import pytest
+
+from photo_tool import core
+from photo_tool.core import EXPORT_FOLDER_NAME, METHOD_PASSTHROUGH, SORT_ALPHABETICALLY, rename_and_convert
+
+# Long enough for a slow machine, short enough that a regression fails instead of hanging
+HANDOVER_TIMEOUT_SECONDS = 10
+
+
+@pytest.fixture
+def shoot(tmp_path):
+    folder = tmp_path / "shoot"
+    folder.mkdir()
+    for name in ("IMG_1.CR2", "IMG_1.JPG", "IMG_2.CR2", "IMG_3.CR2"):
+        (folder / name).write_bytes(b"raw " + name.encode())
+    return folder
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """Replaces the conversion with one that copies the RAW file; lists the RAW files converted."""
+    converted_files = []
+
+    def fake_convert(raw_file_path, output_files, options=None, record_stages=False, data=None):
+        if data is None:
+            with open(raw_file_path, "rb") as f:
+                data = f.read()
+        outputs = []
+        for output_file in output_files:
+            with open(output_file, "wb") as f:
+                f.write(data)
+            outputs.append((output_file, len(data), ""))
+        converted_files.append(os.path.basename(raw_file_path))
+        return True, [], {"method": METHOD_PASSTHROUGH, "outputs": outputs, "output_file": outputs[0][0],
+                          "output_size": len(data)}
+
+    monkeypatch.setattr(core, "convert_raw_to_jpg", fake_convert)
+    return converted_files
+
+
+def _files(shoot):
+    return sorted(str(path) for path in shoot.iterdir() if path.is_file())
+
+
+def test_renames_all_files_and_converts_the_raws(shoot, converted):
+    result = rename_and_convert(_files(shoot), "Trip", SORT_ALPHABETICALLY)
+    assert result == (4, 0, 3, 0, 0, str(shoot / EXPORT_FOLDER_NAME))
+    assert sorted(path.name for path in shoot.iterdir() if path.is_file()) == [
+        "Trip_01.CR2", "Trip_02.JPG", "Trip_03.CR2", "Trip_04.CR2"]
+    assert converted == ["Trip_01.CR2", "Trip_03.CR2", "Trip_04.CR2"]
+    assert sorted(path.name for path in (shoot / EXPORT_FOLDER_NAME).glob("*.jpg")) == [
+        "Trip_01.jpg", "Trip_03.jpg", "Trip_04.jpg"]
+    assert (shoot / EXPORT_FOLDER_NAME / "Trip_03.jpg").read_bytes() == b"raw IMG_2.CR2"
+
+
+def test_first_raw_is_converted_before_the_rename_finishes(shoot, converted):
+    first_converted = threading.Event()
+    handed_over_in_time = []
+
+    def progress(stage, done, total):
+        if stage == "rename" and done == 2:
+            # The first RAW was handed over after its rename; hold the remaining renames until it is converted
+            handed_over_in_time.append(first_converted.wait(HANDOVER_TIMEOUT_SECONDS))
+        elif stage == "convert" and done == 1:
+            first_converted.set()
+
+    rename_and_convert(_files(shoot), "Trip", SORT_ALPHABETICALLY, progress=progress)
+    assert handed_over_in_time == [True]
+    assert len(converted) == 3
+
+
+def test_cancel_stops_the_conversion_but_not_the_renames(shoot, converted):
+    cancel_event = threading.Event()
+
+    def progress(stage, done, total):
+        if stage == "rename" and done == 1:
+            cancel_event.set()
+
+    renamed_count, rename_failed_count, processed_count, _, _, _ = rename_and_convert(
+        _files(shoot), "Trip", SORT_ALPHABETICALLY, progress=progress, cancel_event=cancel_event)
+    assert (renamed_count, rename_failed_count, processed_count) == (4, 0, 0)
+    assert converted == []
+    assert not any(path.name.startswith("IMG_") for path in shoot.iterdir())
+
+
+def test_without_raw_files_only_renames(shoot, converted):
+    for path in shoot.glob("*.CR2"):
+        path.unlink()
+    assert rename_and_convert(_files(shoot), "Trip", SORT_ALPHABETICALLY) == (1, 0, 0, 0, 0, None)
+    assert converted == []
+    assert not (shoot / EXPORT_FOLDER_NAME).exists()
+
+
+def test_up_to_date_outputs_are_skipped_on_a_second_run(shoot, converted):
+    rename_and_convert(_files(shoot), "Trip", SORT_ALPHABETICALLY)
+    converted.clear()
+    # Renaming to the same names again keeps the files, so the manifest still matches
+    result = rename_and_convert(_files(shoot), "Trip", SORT_ALPHABETICALLY)
+    assert result[2:5] == (0, 3, 0)
+    assert converted == []
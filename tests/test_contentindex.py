@@ -0,0 +1,177 @@
+"""Content index: duplicate detection by size, sample key and full hash; lazy hashing; trimming."""
+
+import itertools
+import os
+
+import pytest
+
+from photo_tool import contentindex
+from photo_tool.contentindex import (DUPLICATE_MODES, SAMPLE_SIZE, ContentIndex, content_hash, needs_content_hash,
+                                     sample_key)
+
+SETTINGS = {"profiles": ["full"]}
+RAW_DATA = bytes(range(256)) * 1024 # 256 KiB, so the sample key only covers the ends
+
+
+@pytest.fixture(autouse=True)
+def _ticking_clock(monkeypatch):
+    # Every put/find gets a later last_used, even within the clock's resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(contentindex.time, "time_ns", lambda: next(ticks))
+
+
+@pytest.fixture
+def index(tmp_path):
+    with ContentIndex(str(tmp_path / "index.sqlite3")) as content_index:
+        yield content_index
+
+
+def _write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def _convert(index, path, settings=SETTINGS, digest=None):
+    """Records `path` as converted, with one output next to it."""
+    output_file = _write(path.with_suffix(".jpg"), b"jpeg " + path.name.encode())
+    stat_result = os.stat(path)
+    outputs = [(output_file, os.path.getsize(output_file), "")]
+    index.put_many([(str(path), stat_result.st_size, stat_result.st_mtime_ns, sample_key(str(path)), digest,
+                     settings, outputs)])
+    return outputs
+
+
+def _find(index, path, settings=SETTINGS):
+    return index.find_duplicate(str(path), os.path.getsize(path), settings)
+
+
+def test_sample_key_and_hash_are_the_same_from_disk_and_memory(tmp_path):
+    path = _write(tmp_path / "a.CR2", RAW_DATA)
+    assert sample_key(path) == sample_key(path, RAW_DATA)
+    assert content_hash(path) == content_hash(path, RAW_DATA)
+    short = _write(tmp_path / "b.CR2", b"short")
+    assert sample_key(short) == sample_key(short, b"short")
+
+
+def test_renamed_copy_is_found(index, tmp_path):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    outputs = _convert(index, original)
+    copy = tmp_path / "Shoot_0001.CR2"
+    _write(copy, RAW_DATA)
+    original_path, found_outputs, sample, digest = _find(index, copy)
+    assert (original_path, found_outputs) == (str(original), outputs)
+    assert (sample, digest) == (sample_key(str(copy)), content_hash(str(copy)))
+
+
+def test_file_is_not_its_own_duplicate(index, tmp_path):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    _convert(index, original)
+    assert _find(index, original) is None
+
+
+def test_file_of_unindexed_size_is_not_read(index, tmp_path, monkeypatch):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    _convert(index, original)
+    other = tmp_path / "IMG_2.CR2"
+    _write(other, RAW_DATA + b"x")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file was read")
+
+    monkeypatch.setattr(contentindex, "sample_key", fail)
+    monkeypatch.setattr(contentindex, "content_hash", fail)
+    assert _find(index, other) is None
+
+
+def test_same_ends_but_different_middle_is_not_a_duplicate(index, tmp_path):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    _convert(index, original)
+    middle = len(RAW_DATA) // 2
+    assert middle > SAMPLE_SIZE
+    other = tmp_path / "IMG_2.CR2"
+    _write(other, RAW_DATA[:middle] + b"\xff" + RAW_DATA[middle + 1:])
+    assert sample_key(str(other)) == sample_key(str(original))
+    assert _find(index, other) is None
+
+
+def test_different_settings_or_missing_outputs_do_not_count(index, tmp_path):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    outputs = _convert(index, original)
+    copy = tmp_path / "copy.CR2"
+    _write(copy, RAW_DATA)
+    assert _find(index, copy, settings={"profiles": ["web"]}) is None
+    os.remove(outputs[0][0])
+    assert _find(index, copy) is None
+
+
+def test_original_is_hashed_once_when_first_needed(index, tmp_path, monkeypatch):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    _convert(index, original) # Not hashed in full
+    copy = tmp_path / "copy.CR2"
+    _write(copy, RAW_DATA)
+    hashed = []
+    real_content_hash = contentindex.content_hash
+
+    def counting_content_hash(path, data=None):
+        hashed.append(path)
+        return real_content_hash(path, data)
+
+    monkeypatch.setattr(contentindex, "content_hash", counting_content_hash)
+    assert _find(index, copy) is not None
+    assert sorted(hashed) == sorted([str(original), str(copy)])
+    hashed.clear()
+    assert _find(index, copy) is not None
+    assert hashed == [str(copy)] # The original's hash was stored
+
+
+def test_changed_original_is_not_hashed_or_matched(index, tmp_path):
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    _convert(index, original)
+    stat_result = os.stat(original)
+    os.utime(original, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9))
+    copy = tmp_path / "copy.CR2"
+    _write(copy, RAW_DATA)
+    assert _find(index, copy) is None
+
+
+def test_least_recently_used_entries_are_trimmed(tmp_path):
+    with ContentIndex(str(tmp_path / "index.sqlite3"), max_entries=2) as index:
+        paths = []
+        for i, content in enumerate((b"a" * 10, b"b" * 20, b"c" * 30)):
+            path = tmp_path / f"IMG_{i}.CR2"
+            _write(path, content)
+            _convert(index, path)
+            paths.append(path)
+        assert len(index) == 2
+        copy = tmp_path / "copy.CR2"
+        _write(copy, b"a" * 10)
+        assert _find(index, copy) is None # The oldest entry is gone
+        _write(copy, b"b" * 20)
+        assert _find(index, copy)[0] == str(paths[1])
+
+        # Converting a file again replaces its entry instead of adding one
+        _convert(index, paths[2])
+        assert len(index) == 2
+
+
+def test_entries_persist(tmp_path):
+    db_path = str(tmp_path / "index.sqlite3")
+    original = tmp_path / "IMG_1.CR2"
+    _write(original, RAW_DATA)
+    with ContentIndex(db_path) as index:
+        _convert(index, original, digest=content_hash(str(original)))
+    copy = tmp_path / "copy.CR2"
+    _write(copy, RAW_DATA)
+    with ContentIndex(db_path) as index:
+        assert _find(index, copy)[0] == str(original)
+
+
+def test_only_skip_and_link_hash_up_front():
+    assert [mode for mode in DUPLICATE_MODES if needs_content_hash(mode)] == ["skip", "link"]
@@ -0,0 +1,78 @@
+"""Streaming file discovery, and listing ahead of the consumer."""
+
+import os
+
+import pytest
+
+from photo_tool.discovery import FileEntry, scan_ahead, scan_files
+
+
+@pytest.fixture
+def card(tmp_path):
+    """A card-like tree: DCIM/100CANON and DCIM/101CANON, a hidden folder and an old export folder."""
+    files = {
+        "readme.txt": b"x",
+        "DCIM/100CANON/IMG_0001.CR2": b"raw1",
+        "DCIM/100CANON/IMG_0001.JPG": b"jpg",
+        "DCIM/101CANON/img_0002.cr2": b"raw22",
+        "DCIM/.thumbnails/IMG_0001.CR2": b"hidden",
+        "exported_jpg/IMG_0001.jpg": b"output",
+    }
+    for relative_path, content in files.items():
+        path = tmp_path.joinpath(*relative_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return tmp_path
+
+
+def _relative(root, entries):
+    return sorted(os.path.relpath(entry.path, root).replace(os.sep, "/") for entry in entries)
+
+
+def test_top_level_only(card):
+    assert _relative(card, scan_files(str(card))) == ["readme.txt"]
+
+
+def test_recursive_skips_hidden_and_excluded_folders(card):
+    assert _relative(card, scan_files(str(card), recursive=True)) == [
+        "DCIM/100CANON/IMG_0001.CR2", "DCIM/100CANON/IMG_0001.JPG", "DCIM/101CANON/img_0002.cr2", "readme.txt"]
+
+
+def test_subfolders_are_visited_in_name_order(card):
+    folders = [os.path.basename(os.path.dirname(entry.path)) for entry in scan_files(str(card), recursive=True)
+               if entry.name.lower().endswith(".cr2")]
+    assert folders == ["100CANON", "101CANON"]
+
+
+def test_extensions_and_patterns_ignore_case(card):
+    raws = scan_files(str(card), recursive=True, extensions=(".CR2",))
+    assert _relative(card, raws) == ["DCIM/100CANON/IMG_0001.CR2", "DCIM/101CANON/img_0002.cr2"]
+    matching = scan_files(str(card), recursive=True, patterns=("IMG_0001.*",))
+    assert _relative(card, matching) == ["DCIM/100CANON/IMG_0001.CR2", "DCIM/100CANON/IMG_0001.JPG"]
+
+
+def test_entries_carry_stat_data(card):
+    path = card / "DCIM" / "101CANON" / "img_0002.cr2"
+    entry, = scan_files(str(path.parent))
+    stat_result = os.stat(path)
+    assert (entry.name, entry.size, entry.mtime_ns) == ("img_0002.cr2", 5, stat_result.st_mtime_ns)
+    assert FileEntry.from_path(str(path)).mtime_ns == entry.mtime_ns
+
+
+def test_missing_folder_raises(tmp_path):
+    with pytest.raises(OSError):
+        list(scan_files(str(tmp_path / "missing")))
+
+
+def test_scan_ahead_reports_total_and_yields_everything(card):
+    totals = []
+    entries = list(scan_ahead(scan_files(str(card), recursive=True), totals.append))
+    assert len(entries) == 4
+    assert totals == [4]
+
+
+def test_scan_ahead_reraises_errors(tmp_path):
+    totals = []
+    with pytest.raises(OSError):
+        list(scan_ahead(scan_files(str(tmp_path / "missing")), totals.append))
+    assert totals == []
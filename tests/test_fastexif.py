@@ -0,0 +1,87 @@
+"""Bounded-read capture metadata parsing, on hand-built TIFF and JPEG bytes."""
+
+import struct
+
+import pytest
+
+from exif_fixtures import make_jpeg, make_tiff
+from photo_tool import core
+from photo_tool.fastexif import (HEAD_SIZE, FastPathError, read_capture_metadata,
+                                 read_capture_metadata_from_bytes)
+
+DATE_ORIGINAL = "2024:05:06 07:08:09"
+DATE_DIGITIZED = "2024:05:06 07:08:10"
+
+
+@pytest.mark.parametrize("order", ["<", ">"], ids=["little-endian", "big-endian"])
+def test_tiff(order):
+    data = make_tiff(order, orientation=6, date_original=DATE_ORIGINAL, date_digitized=DATE_DIGITIZED)
+    assert read_capture_metadata_from_bytes(data) == (DATE_ORIGINAL, DATE_DIGITIZED, 6)
+
+
+@pytest.mark.parametrize("order", ["<", ">"], ids=["little-endian", "big-endian"])
+def test_jpeg(order):
+    data = make_jpeg(make_tiff(order, orientation=8, date_original=DATE_ORIGINAL))
+    assert read_capture_metadata_from_bytes(data) == (DATE_ORIGINAL, None, 8)
+
+
+def test_jpeg_without_exif():
+    assert read_capture_metadata_from_bytes(make_jpeg()) == (None, None, None)
+
+
+def test_tiff_without_exif_ifd():
+    # Like RW2 and some DNG/ORF files: IFD0 doesn't link to an EXIF IFD
+    data = make_tiff(orientation=3, exif_ifd=False)
+    assert read_capture_metadata_from_bytes(data) == (None, None, 3)
+
+
+def test_rw2_magic():
+    data = bytearray(make_tiff(orientation=1, date_original=DATE_ORIGINAL))
+    data[2:4] = struct.pack("<H", 0x55)
+    assert read_capture_metadata_from_bytes(bytes(data)) == (DATE_ORIGINAL, None, 1)
+
+
+@pytest.mark.parametrize("data", [
+    b"GIF89a" + b"\0" * 32, # Not a supported format
+    b"II\x2b\x00" + b"\0" * 16, # BigTIFF magic
+    make_tiff(orientation=6, date_original=DATE_ORIGINAL)[:20], # Truncated inside IFD0
+    b"II*\0\x08\0\0\0" + struct.pack("<H", 0xFFFF), # Implausible number of IFD entries
+    b"\xff\xd8\x00\x00", # Corrupt JPEG marker
+], ids=["unknown", "bigtiff", "truncated", "huge-ifd", "corrupt-jpeg"])
+def test_unexpected_data_raises(data):
+    with pytest.raises(FastPathError):
+        read_capture_metadata_from_bytes(data)
+
+
+def test_offsets_past_the_head_are_read_in_a_window(tmp_path):
+    # A JPEG whose EXIF segment comes after a large APP2 segment, so IFD0 lies beyond the head buffer
+    filler = b"\xff\xe2" + struct.pack(">H", 0xFFFF) + b"\0" * (0xFFFF - 2)
+    jpeg = make_jpeg(make_tiff(orientation=6, date_original=DATE_ORIGINAL))
+    data = jpeg[:2] + filler + jpeg[2:]
+    path = tmp_path / "late_exif.jpg"
+    path.write_bytes(data + b"\0" * 1_000_000)
+
+    metadata, reader = read_capture_metadata(str(path))
+    assert metadata == (DATE_ORIGINAL, None, 6)
+    assert HEAD_SIZE < reader.bytes_read < 100_000
+
+
+def test_read_exif_metadata_falls_back_when_fast_path_finds_no_date(tmp_path, monkeypatch):
+    path = tmp_path / "P1000001.RW2"
+    path.write_bytes(make_tiff(orientation=6, exif_ifd=False))
+    calls = []
+
+    def exifread_metadata(filepath):
+        calls.append(filepath)
+        return DATE_ORIGINAL, None, None
+
+    monkeypatch.setattr(core, "read_exif_metadata_exifread", exifread_metadata)
+    assert core.read_exif_metadata(str(path)) == (DATE_ORIGINAL, None, 6)
+    assert calls == [str(path)]
+
+
+def test_read_exif_metadata_uses_fast_path_dates(tmp_path, monkeypatch):
+    path = tmp_path / "IMG_0001.CR2"
+    path.write_bytes(make_tiff(orientation=1, date_original=DATE_ORIGINAL))
+    monkeypatch.setattr(core, "read_exif_metadata_exifread", lambda filepath: pytest.fail("exifread was used"))
+    assert core.read_exif_metadata(str(path)) == (DATE_ORIGINAL, None, 1)
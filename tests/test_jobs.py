@@ -0,0 +1,219 @@
+"""Job progress and ETA, and the job queue."""
+
+import json
+import threading
+import time
+
+import pytest
+
+from photo_tool import jobs
+from photo_tool.jobs import (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_URGENT, STATE_CANCELED, STATE_DONE, STATE_FAILED,
+                             JobProgress, JobQueue)
+
+# Long enough for a slow machine, short enough that a regression fails instead of hanging
+JOB_TIMEOUT_SECONDS = 10
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(jobs.time, "monotonic", fake_clock.monotonic)
+    return fake_clock
+
+
+def test_rate_and_eta(clock):
+    progress = JobProgress()
+    for done in range(0, 11):
+        progress.update("convert", done, 100)
+        clock.now += 0.5
+    stage, done, total, rate, eta = progress.snapshot()
+    assert (stage, done, total) == ("convert", 10, 100)
+    assert rate == pytest.approx(2.0)
+    assert eta == pytest.approx(45.0)
+
+
+def test_interleaved_stages_keep_their_own_rate(clock):
+    # An offload copies and converts at the same time, so both stages report in turn
+    progress = JobProgress()
+    for i in range(20):
+        progress.update("offload", i * 2, 100)
+        if i >= 2:
+            progress.update("convert", i - 2, 100)
+        clock.now += 1.0
+    stage, done, total, rate, eta = progress.snapshot()
+    assert (stage, done, total) == ("convert", 17, 100)
+    assert rate == pytest.approx(1.0)
+    assert eta == pytest.approx(83.0)
+
+    # Further copy reports don't change what is shown
+    progress.update("offload", 40, 100)
+    assert progress.snapshot()[:3] == ("convert", 17, 100)
+
+
+def test_set_total_for_reports_without_one(clock):
+    progress = JobProgress()
+    progress.update("convert", 1, None)
+    progress.set_total("convert", 50)
+    clock.now += 1.0
+    progress.update("convert", 3, None)
+    assert progress.snapshot()[:3] == ("convert", 3, 50)
+    progress.set_total("convert", 60) # A total that is already known stays
+    assert progress.snapshot()[2] == 50
+
+
+def test_no_reports_yet():
+    assert JobProgress().snapshot() == (None, 0, None, None, None)
+
+
+class Runner:
+    """A run_job callback that records the jobs it runs; jobs with a "hold" param wait until released."""
+
+    def __init__(self):
+        self.ran = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.finished = threading.Condition()
+
+    def __call__(self, job):
+        if job.params.get("fail"):
+            raise RuntimeError("disk full")
+        if job.params.get("hold"):
+            self.started.set()
+            while not job.cancel_event.is_set() and not self.release.is_set():
+                job.cancel_event.wait(0.01)
+        with self.finished:
+            self.ran.append(job.title)
+            self.finished.notify_all()
+
+    def wait_for(self, count):
+        with self.finished:
+            assert self.finished.wait_for(lambda: len(self.ran) >= count, JOB_TIMEOUT_SECONDS)
+
+
+def _wait_until_idle(job_queue):
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while job_queue.snapshot() != (None, []):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _titles(job_queue):
+    _, waiting = job_queue.snapshot()
+    return [job.title for job in waiting]
+
+
+def test_urgent_jobs_run_first_then_in_submission_order():
+    runner = Runner()
+    job_queue = JobQueue(None, runner)
+    job_queue.submit("convert", "low", {}, PRIORITY_LOW)
+    job_queue.submit("convert", "first", {})
+    job_queue.submit("convert", "urgent", {}, PRIORITY_URGENT)
+    job_queue.submit("convert", "second", {}, PRIORITY_NORMAL)
+    assert _titles(job_queue) == ["urgent", "first", "second", "low"]
+    job_queue.start()
+    runner.wait_for(4)
+    job_queue.shutdown()
+    assert runner.ran == ["urgent", "first", "second", "low"]
+
+
+def test_move_to_front_goes_ahead_of_urgent_jobs():
+    job_queue = JobQueue(None, Runner())
+    job_queue.submit("convert", "urgent", {}, PRIORITY_URGENT)
+    job_queue.submit("convert", "normal", {})
+    low = job_queue.submit("convert", "low", {}, PRIORITY_LOW)
+    assert job_queue.move_to_front(low.id)
+    assert low.priority == PRIORITY_URGENT
+    assert _titles(job_queue) == ["low", "urgent", "normal"]
+    assert not job_queue.move_to_front(99)
+
+
+def test_cancel_waiting_and_running_jobs():
+    runner = Runner()
+    job_queue = JobQueue(None, runner)
+    running = job_queue.submit("convert", "running", {"hold": True})
+    job_queue.start()
+    assert runner.started.wait(JOB_TIMEOUT_SECONDS)
+    waiting = job_queue.submit("convert", "waiting", {})
+
+    assert job_queue.cancel(waiting.id) is waiting
+    assert waiting.state == STATE_CANCELED
+    assert _titles(job_queue) == []
+
+    assert job_queue.cancel(running.id) is running
+    runner.wait_for(1)
+    job_queue.shutdown()
+    assert running.state == STATE_CANCELED and running.cancel_requested
+    assert runner.ran == ["running"]
+    assert job_queue.cancel(99) is None
+
+
+def test_failed_job_is_logged_and_the_next_one_runs():
+    runner = Runner()
+    messages = []
+    job_queue = JobQueue(None, runner, lambda message, detail=False: messages.append(message))
+    failing = job_queue.submit("convert", "failing", {"fail": True})
+    job_queue.submit("convert", "next", {})
+    job_queue.start()
+    runner.wait_for(1)
+    job_queue.shutdown()
+    assert failing.state == STATE_FAILED
+    assert messages == ["Error: The job 'failing' failed: disk full"]
+    assert runner.ran == ["next"]
+
+
+def test_waiting_jobs_are_restored(tmp_path):
+    path = str(tmp_path / "job_queue.json")
+    job_queue = JobQueue(path, Runner())
+    job_queue.submit("rename", "rename", {"folder": "/photos", "name": "Trip"})
+    low = job_queue.submit("convert", "convert", {"folder": "/photos"}, PRIORITY_LOW)
+    job_queue.move_to_front(low.id)
+
+    restored_queue = JobQueue(path, Runner())
+    assert [(job.id, job.kind, job.params, job.priority, job.started) for job in restored_queue.restored_jobs] == [
+        (2, "convert", {"folder": "/photos"}, PRIORITY_URGENT, False),
+        (1, "rename", {"folder": "/photos", "name": "Trip"}, PRIORITY_NORMAL, False)]
+    assert _titles(restored_queue) == ["convert", "rename"]
+    assert restored_queue.submit("convert", "new", {}).id == 3
+
+
+def test_job_stopped_by_shutdown_is_restored_as_started(tmp_path):
+    path = str(tmp_path / "job_queue.json")
+    runner = Runner()
+    job_queue = JobQueue(path, runner)
+    running = job_queue.submit("convert", "running", {"hold": True})
+    job_queue.start()
+    assert runner.started.wait(JOB_TIMEOUT_SECONDS)
+    job_queue.shutdown()
+    assert running.state == STATE_CANCELED and not running.cancel_requested
+
+    restored, = JobQueue(path, Runner()).restored_jobs
+    assert (restored.title, restored.started) == ("running", True)
+
+
+def test_finished_jobs_are_not_restored(tmp_path):
+    path = str(tmp_path / "job_queue.json")
+    runner = Runner()
+    job_queue = JobQueue(path, runner)
+    done = job_queue.submit("convert", "done", {})
+    job_queue.start()
+    _wait_until_idle(job_queue)
+    job_queue.shutdown()
+    assert done.state == STATE_DONE
+    assert JobQueue(path, Runner()).restored_jobs == []
+
+
+def test_unreadable_queue_file_is_cleared(tmp_path):
+    path = tmp_path / "job_queue.json"
+    path.write_text(json.dumps({"version": 99, "jobs": []}), encoding="utf-8")
+    messages = []
+    job_queue = JobQueue(str(path), Runner(), lambda message, detail=False: messages.append(message))
+    assert job_queue.restored_jobs == []
+    assert len(messages) == 1 and messages[0].startswith("Warning: Could not read the saved job queue")
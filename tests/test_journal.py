@@ -0,0 +1,163 @@
+"""Rename journal: crashes at different points, then resume, undo and rollback."""
+
+import os
+
+import pytest
+
+from photo_tool import core, journal
+from photo_tool.journal import RenameJournal, interrupted_journals, last_undoable_journal
+
+# Renames done by the job below: phase 1 moves the six rotated files to temporary names, phase 2 all eight
+ROTATED = 6
+PLAIN = 2
+
+
+class _Crash(Exception):
+    """Stands in for the process dying: not an OSError, so the journal records nothing more."""
+
+
+def _make_job(folder):
+    """Creates the files of a job with a cycle (img_0 -> img_1 -> ... -> img_0) and two plain renames.
+
+    Returns (moves, contents) where contents maps each old path to the bytes it held.
+    """
+    moves = []
+    for i in range(ROTATED):
+        moves.append((os.path.join(folder, f"img_{i}.jpg"), os.path.join(folder, f"img_{(i + 1) % ROTATED}.jpg")))
+    for i in range(PLAIN):
+        moves.append((os.path.join(folder, f"dsc_{i}.cr2"), os.path.join(folder, f"shoot_{i}.cr2")))
+    contents = {}
+    for old_path, _ in moves:
+        contents[old_path] = f"content of {os.path.basename(old_path)}".encode()
+        with open(old_path, "wb") as f:
+            f.write(contents[old_path])
+    return moves, contents
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _crash_after(monkeypatch, rename_count):
+    """Makes os.rename crash once `rename_count` renames have been done."""
+    real_rename = os.rename
+    done = [0]
+
+    def rename(source, target):
+        if done[0] == rename_count:
+            raise _Crash()
+        done[0] += 1
+        real_rename(source, target)
+
+    monkeypatch.setattr(os, "rename", rename)
+
+
+def _run_until_crash(monkeypatch, journal_folder, moves, rename_count):
+    job = RenameJournal.create(str(journal_folder), moves)
+    with monkeypatch.context() as patch:
+        _crash_after(patch, rename_count)
+        with pytest.raises(_Crash):
+            job.run()
+    return job
+
+
+def _assert_names(folder, expected):
+    """Checks that `folder` holds exactly the {path: content} files of `expected` (no temporary files)."""
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(path) for path in expected)
+    for path, content in expected.items():
+        assert _read(path) == content
+
+
+@pytest.fixture(autouse=True)
+def _small_flush_interval(monkeypatch):
+    # Flush progress every few renames, so resuming relies on both the journal and the disk
+    monkeypatch.setattr(journal, "FLUSH_INTERVAL", 3)
+
+
+CRASH_POINTS = {
+    "during phase 1": 4,
+    "after phase 1": ROTATED,
+    "during phase 2": ROTATED + 5,
+}
+
+
+@pytest.mark.parametrize("rename_count", CRASH_POINTS.values(), ids=CRASH_POINTS.keys())
+def test_resume_then_undo_restores_original_names(tmp_path, monkeypatch, rename_count):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    journal_folder = tmp_path / "journals"
+    moves, contents = _make_job(str(folder))
+    _run_until_crash(monkeypatch, journal_folder, moves, rename_count)
+
+    interrupted = interrupted_journals(str(journal_folder))
+    assert len(interrupted) == 1
+    assert last_undoable_journal(str(journal_folder)) is None
+    renamed_count, failed_count = core.resume_rename_job(interrupted[0], use_cache=False)
+    assert (renamed_count, failed_count) == (len(moves), 0)
+    _assert_names(str(folder), {new_path: contents[old_path] for old_path, new_path in moves})
+
+    completed = last_undoable_journal(str(journal_folder))
+    assert completed is not None
+    assert core.revert_rename_job(completed, use_cache=False) == (len(moves), 0)
+    _assert_names(str(folder), contents)
+    assert interrupted_journals(str(journal_folder)) == []
+    assert RenameJournal.load(completed.path).reverted
+
+
+@pytest.mark.parametrize("rename_count", CRASH_POINTS.values(), ids=CRASH_POINTS.keys())
+def test_rollback_after_crash_restores_original_names(tmp_path, monkeypatch, rename_count):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    journal_folder = tmp_path / "journals"
+    moves, contents = _make_job(str(folder))
+    job = _run_until_crash(monkeypatch, journal_folder, moves, rename_count)
+
+    interrupted = RenameJournal.load(job.path)
+    assert not interrupted.finished
+    _, failed_count = core.revert_rename_job(interrupted, use_cache=False)
+    assert failed_count == 0
+    _assert_names(str(folder), contents)
+    assert interrupted_journals(str(journal_folder)) == []
+    # A rollback can't be undone, and neither can the job it rolled back
+    assert last_undoable_journal(str(journal_folder)) is None
+
+
+def test_crash_while_resuming_can_be_resumed_again(tmp_path, monkeypatch):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    journal_folder = tmp_path / "journals"
+    moves, contents = _make_job(str(folder))
+    job = _run_until_crash(monkeypatch, journal_folder, moves, ROTATED + 1)
+    resumed = RenameJournal.load(job.path)
+    with monkeypatch.context() as patch:
+        _crash_after(patch, 3)
+        with pytest.raises(_Crash):
+            resumed.run()
+
+    resumed = RenameJournal.load(job.path)
+    resumed.run()
+    assert resumed.complete
+    _assert_names(str(folder), {new_path: contents[old_path] for old_path, new_path in moves})
+
+
+def test_stop_event_leaves_job_interrupted(tmp_path):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    moves, contents = _make_job(str(folder))
+    job = RenameJournal.create(str(tmp_path / "journals"), moves)
+
+    class StopAfterPhase1:
+        def __init__(self):
+            self.checks = 0
+
+        def is_set(self):
+            self.checks += 1
+            return self.checks > len(moves) + 2 # Two moves into phase 2
+
+    job.run(stop_event=StopAfterPhase1())
+    assert not job.complete
+    reloaded = RenameJournal.load(job.path)
+    assert reloaded.phase_done == {1: len(moves), 2: 2}
+    reloaded.run()
+    _assert_names(str(folder), {new_path: contents[old_path] for old_path, new_path in moves})
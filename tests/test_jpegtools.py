@@ -0,0 +1,62 @@
+"""Byte-level EXIF Orientation edits, on hand-built JPEGs."""
+
+import io
+
+import pytest
+
+from exif_fixtures import SCAN_DATA, make_jpeg, make_tiff
+from photo_tool.fastexif import read_capture_metadata_from_bytes
+from photo_tool.jpegtools import get_jpeg_orientation, set_jpeg_orientation
+
+DATE_ORIGINAL = "2024:05:06 07:08:09"
+
+
+def test_get_orientation():
+    assert get_jpeg_orientation(make_jpeg(make_tiff(orientation=6))) == 6
+    assert get_jpeg_orientation(make_jpeg()) is None
+    assert get_jpeg_orientation(b"not a jpeg") is None
+
+
+@pytest.mark.parametrize("order", ["<", ">"], ids=["little-endian", "big-endian"])
+def test_patches_existing_orientation_in_place(order):
+    data = make_jpeg(make_tiff(order, orientation=6, date_original=DATE_ORIGINAL))
+    patched = set_jpeg_orientation(data, 1)
+
+    assert len(patched) == len(data)
+    assert sum(old != new for old, new in zip(data, patched)) == 1 # Only the low byte of the value
+    assert read_capture_metadata_from_bytes(patched) == (DATE_ORIGINAL, None, 1)
+
+
+def test_inserts_exif_segment_when_missing():
+    data = make_jpeg()
+    patched = set_jpeg_orientation(data, 8)
+
+    assert patched[:2] == b"\xff\xd8"
+    assert patched.endswith(data[2:]) # Everything after SOI is kept as is
+    assert get_jpeg_orientation(patched) == 8
+
+
+@pytest.mark.parametrize("order", ["<", ">"], ids=["little-endian", "big-endian"])
+def test_adds_orientation_entry_to_existing_exif(order):
+    data = make_jpeg(make_tiff(order, date_original=DATE_ORIGINAL, make=b"Canon"))
+    assert get_jpeg_orientation(data) is None
+    patched = set_jpeg_orientation(data, 3)
+
+    # The old IFD0 and EXIF IFD stay where they were, so the capture date is still found
+    assert read_capture_metadata_from_bytes(patched) == (DATE_ORIGINAL, None, 3)
+    assert patched.endswith(SCAN_DATA)
+    assert patched.startswith(data[:20]) # SOI and APP0
+
+
+def test_pillow_reads_the_edited_orientation():
+    Image = pytest.importorskip("PIL.Image")
+    encoded = io.BytesIO()
+    Image.new("RGB", (16, 8), (200, 10, 10)).save(encoded, "JPEG")
+    data = encoded.getvalue()
+
+    for orientation in (6, 3):
+        data = set_jpeg_orientation(data, orientation)
+        with Image.open(io.BytesIO(data)) as img:
+            assert img.getexif()[0x0112] == orientation
+            assert img.size == (16, 8)
+            img.load()
@@ -0,0 +1,95 @@
+"""Batched, bounded status log."""
+
+import threading
+
+import pytest
+
+from photo_tool import logqueue
+from photo_tool.logqueue import LogQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(logqueue.time, "monotonic", fake_clock.monotonic)
+    return fake_clock
+
+
+def test_drain_returns_lines_in_order_once():
+    log_queue = LogQueue()
+    log_queue.put("one")
+    log_queue.put("two")
+    assert log_queue.drain() == ["one", "two"]
+    assert log_queue.drain() == []
+
+
+def test_only_the_newest_lines_are_kept():
+    log_queue = LogQueue(max_lines=3)
+    for i in range(10):
+        log_queue.put(f"line {i}")
+    assert log_queue.drain() == ["line 7", "line 8", "line 9"]
+
+
+def test_details_are_collapsed_into_a_summary(clock):
+    log_queue = LogQueue(summary_interval=1.0)
+    log_queue.put("Starting...")
+    for i in range(5):
+        log_queue.put(f"Renamed: '{i}'", detail=True)
+    assert log_queue.drain() == ["Starting...", "... 5 more file(s) processed."]
+
+    # At most one summary per interval
+    log_queue.put("Renamed: '5'", detail=True)
+    assert log_queue.drain() == []
+    clock.now += 1.0
+    assert log_queue.drain() == ["... 1 more file(s) processed."]
+
+
+def test_summary_shows_progress(clock):
+    log_queue = LogQueue()
+    log_queue.put("Converted 'a'", detail=True)
+    log_queue.progress("convert", 25, 200)
+    assert log_queue.drain() == ["Progress (convert): 25/200 files (12%)"]
+    log_queue.progress("convert", 30, None)
+    assert log_queue.drain(force_summary=True) == ["Progress (convert): 30 files"]
+
+
+def test_details_are_shown_when_not_collapsed():
+    log_queue = LogQueue(collapse_details=False)
+    log_queue.put("Renamed: 'a'", detail=True)
+    assert log_queue.drain() == ["Renamed: 'a'"]
+
+
+def test_log_file_gets_every_line_on_flush(tmp_path):
+    path = tmp_path / "status.log"
+    log_queue = LogQueue()
+    log_queue.set_log_file(str(path))
+    log_queue.put("Starting...")
+    log_queue.put("Renamed: 'a'", detail=True)
+    log_queue.drain()
+    assert path.read_text(encoding="utf-8") == "Starting...\nRenamed: 'a'\n"
+    log_queue.close()
+
+
+def test_put_from_many_threads():
+    log_queue = LogQueue(max_lines=10_000)
+
+    def worker(name):
+        for i in range(500):
+            log_queue.put(f"{name} {i}")
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lines = log_queue.drain()
+    assert len(lines) == 2000
+    assert [line for line in lines if line.startswith("a ")] == [f"a {i}" for i in range(500)]
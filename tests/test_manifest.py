@@ -0,0 +1,161 @@
+"""Conversion manifest: atomic output commits, stale entries and temporary files, the append-only log."""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from photo_tool import manifest
+from photo_tool.manifest import (LOG_FILENAME, MANIFEST_FILENAME, ConversionManifest, commit_output, discard_output,
+                                 is_stale_temporary_file, scan_outputs, temporary_path, write_output)
+
+SETTINGS = {"source": "preview", "quality": 95}
+
+
+def test_commit_output_moves_temporary_file_into_place(tmp_path):
+    output_file = str(tmp_path / "a.jpg")
+    temp_file = temporary_path(output_file)
+    assert os.path.basename(temp_file) == ".a.jpg.partial"
+
+    write_output(temp_file, b"\xff\xd8", b"image data")
+    assert not os.path.exists(output_file) # Nothing at the final name until the output is complete
+    size, checksum = commit_output(temp_file, output_file)
+
+    content = b"\xff\xd8image data"
+    assert (size, checksum) == (len(content), hashlib.sha256(content).hexdigest())
+    assert not os.path.exists(temp_file)
+    with open(output_file, "rb") as f:
+        assert f.read() == content
+
+
+def test_commit_output_replaces_existing_output(tmp_path):
+    output_file = str(tmp_path / "a.jpg")
+    with open(output_file, "wb") as f:
+        f.write(b"old")
+    temp_file = temporary_path(output_file)
+    write_output(temp_file, b"new")
+    commit_output(temp_file, output_file)
+    with open(output_file, "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_commit_output_hashes_files_written_elsewhere(tmp_path):
+    output_file = str(tmp_path / "a.tif")
+    temp_file = temporary_path(output_file)
+    with open(temp_file, "wb") as f:
+        f.write(b"written by another library")
+    assert commit_output(temp_file, output_file) == (26, hashlib.sha256(b"written by another library").hexdigest())
+
+
+def test_discard_output_forgets_written_checksum(tmp_path):
+    output_file = str(tmp_path / "a.jpg")
+    temp_file = temporary_path(output_file)
+    write_output(temp_file, b"first attempt")
+    discard_output(temp_file)
+    assert not os.path.exists(temp_file)
+    discard_output(temp_file) # Already gone
+
+    # Written again without write_output(): the checksum has to come from the new content
+    with open(temp_file, "wb") as f:
+        f.write(b"second")
+    assert commit_output(temp_file, output_file)[1] == hashlib.sha256(b"second").hexdigest()
+
+
+def _manifest_with_entry(tmp_path):
+    source_folder = tmp_path / "raws"
+    export_folder = source_folder / "exported_jpg"
+    export_folder.mkdir(parents=True)
+    source = str(source_folder / "IMG_1.CR2")
+    output_file = str(export_folder / "IMG_1.jpg")
+    with open(output_file, "wb") as f:
+        f.write(b"x" * 100)
+    conversion_manifest = ConversionManifest(str(source_folder), str(export_folder))
+    conversion_manifest.record(source, 1000, 42, SETTINGS, [(output_file, 100, "checksum")])
+    return conversion_manifest, source, output_file
+
+
+def test_output_for_unchanged_source(tmp_path):
+    conversion_manifest, source, output_file = _manifest_with_entry(tmp_path)
+    output_sizes, _ = scan_outputs(conversion_manifest.export_folder)
+    assert conversion_manifest.output_for(source, 1000, 42, SETTINGS, output_sizes) == output_file
+
+
+@pytest.mark.parametrize("size, mtime_ns, settings", [
+    (1001, 42, SETTINGS), # Source changed size
+    (1000, 43, SETTINGS), # Source touched
+    (1000, 42, {**SETTINGS, "quality": 80}), # Settings changed
+], ids=["size", "mtime", "settings"])
+def test_output_for_changed_source_is_stale(tmp_path, size, mtime_ns, settings):
+    conversion_manifest, source, _ = _manifest_with_entry(tmp_path)
+    output_sizes, _ = scan_outputs(conversion_manifest.export_folder)
+    assert conversion_manifest.output_for(source, size, mtime_ns, settings, output_sizes) is None
+
+
+def test_output_for_missing_or_truncated_output_is_stale(tmp_path):
+    conversion_manifest, source, output_file = _manifest_with_entry(tmp_path)
+    with open(output_file, "wb") as f:
+        f.write(b"x" * 10)
+    output_sizes, _ = scan_outputs(conversion_manifest.export_folder)
+    assert conversion_manifest.output_for(source, 1000, 42, SETTINGS, output_sizes) is None
+    os.remove(output_file)
+    output_sizes, _ = scan_outputs(conversion_manifest.export_folder)
+    assert conversion_manifest.output_for(source, 1000, 42, SETTINGS, output_sizes) is None
+
+
+def test_scan_outputs_only_lists_stale_temporary_files(tmp_path):
+    old_temp = tmp_path / ".old.jpg.partial"
+    new_temp = tmp_path / ".new.jpg.partial"
+    old_temp.write_bytes(b"left by a crash")
+    new_temp.write_bytes(b"still being written")
+    an_hour_ago = time.time() - 3600
+    os.utime(old_temp, (an_hour_ago, an_hour_ago))
+    (tmp_path / "done.jpg").write_bytes(b"12345")
+    (tmp_path / MANIFEST_FILENAME).write_text("{}")
+    (tmp_path / LOG_FILENAME).write_text("")
+
+    output_sizes, leftovers = scan_outputs(str(tmp_path))
+    assert output_sizes == {"done.jpg": 5}
+    assert leftovers == [str(old_temp)]
+    assert not is_stale_temporary_file("done.jpg", 0)
+
+
+def test_records_survive_an_interrupted_run(tmp_path):
+    conversion_manifest, source, output_file = _manifest_with_entry(tmp_path)
+    conversion_manifest.save()
+    with open(conversion_manifest.log_path, "a", encoding="utf-8") as f:
+        f.write('{"source": "IMG_2.CR2", "si') # Cut off by a crash
+    assert not os.path.exists(conversion_manifest.path)
+
+    reloaded = ConversionManifest.load(conversion_manifest.source_folder, conversion_manifest.export_folder)
+    output_sizes, _ = scan_outputs(reloaded.export_folder)
+    assert reloaded.output_for(source, 1000, 42, SETTINGS, output_sizes) == output_file
+    assert list(reloaded.entries) == ["IMG_1.CR2"]
+
+    reloaded.compact()
+    assert os.path.exists(reloaded.path)
+    assert not os.path.exists(reloaded.log_path)
+    compacted = ConversionManifest.load(reloaded.source_folder, reloaded.export_folder)
+    assert compacted.entries == reloaded.entries
+
+
+def test_damaged_log_is_reported(tmp_path):
+    conversion_manifest, _, _ = _manifest_with_entry(tmp_path)
+    conversion_manifest.save()
+    with open(conversion_manifest.log_path, "r+", encoding="utf-8") as f:
+        lines = f.read()
+        f.seek(0)
+        f.write("not json\n" + lines)
+    with pytest.raises(ValueError):
+        ConversionManifest.load(conversion_manifest.source_folder, conversion_manifest.export_folder)
+
+
+def test_save_appends_only_new_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "SAVE_INTERVAL", 2)
+    conversion_manifest, source, output_file = _manifest_with_entry(tmp_path)
+    for i in range(2, 6):
+        conversion_manifest.record(source.replace("IMG_1", f"IMG_{i}"), 1000, 42, SETTINGS,
+                                   [(output_file, 100, "checksum")])
+    conversion_manifest.save()
+    with open(conversion_manifest.log_path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 5
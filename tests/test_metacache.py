@@ -0,0 +1,77 @@
+"""EXIF metadata cache: validation by size and mtime, LRU eviction, renames."""
+
+import itertools
+
+import pytest
+
+from photo_tool import metacache
+from photo_tool.metacache import MetadataCache
+
+DATE = "2024:05:06 07:08:09"
+
+
+@pytest.fixture(autouse=True)
+def _ticking_clock(monkeypatch):
+    # Every put/get gets a later last_used, even within the clock's resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(metacache.time, "time_ns", lambda: next(ticks))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with MetadataCache(str(tmp_path / "cache.sqlite3"), max_entries=3) as metadata_cache:
+        yield metadata_cache
+
+
+def test_hit_for_unchanged_file(cache, tmp_path):
+    path = str(tmp_path / "a.CR2")
+    cache.put_many([(path, 100, 5, DATE, None, 6)])
+    assert cache.get_many([(path, 100, 5)]) == {path: (DATE, None, 6)}
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+@pytest.mark.parametrize("size, mtime_ns", [(101, 5), (100, 6)], ids=["size", "mtime"])
+def test_changed_file_is_a_miss(cache, tmp_path, size, mtime_ns):
+    path = str(tmp_path / "a.CR2")
+    cache.put_many([(path, 100, 5, DATE, None, 6)])
+    assert cache.get_many([(path, size, mtime_ns)]) == {}
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Read again and stored under the new size/mtime
+    cache.put_many([(path, size, mtime_ns, DATE, None, 1)])
+    assert cache.get_many([(path, size, mtime_ns)]) == {path: (DATE, None, 1)}
+    assert len(cache) == 1
+
+
+def test_files_without_exif_are_cached(cache, tmp_path):
+    path = str(tmp_path / "scan.jpg")
+    cache.put_many([(path, 10, 1, None, None, None)])
+    assert cache.get_many([(path, 10, 1)]) == {path: (None, None, None)}
+
+
+def test_least_recently_used_entries_are_evicted(cache, tmp_path):
+    paths = [str(tmp_path / f"{name}.CR2") for name in "abcd"]
+    for path in paths[:3]:
+        cache.put_many([(path, 1, 1, DATE, None, 1)])
+    cache.get_many([(paths[0], 1, 1)]) # a is now used more recently than b and c
+
+    cache.put_many([(paths[3], 1, 1, DATE, None, 1)])
+    assert len(cache) == 3
+    assert set(cache.get_many([(path, 1, 1) for path in paths])) == {paths[0], paths[2], paths[3]}
+
+
+def test_move_many_keeps_entries_of_renamed_files(cache, tmp_path):
+    a, b, c = (str(tmp_path / f"{name}.CR2") for name in "abc")
+    cache.put_many([(a, 1, 1, "A", None, 1), (b, 2, 2, "B", None, 1)])
+    cache.move_many([(a, b), (b, c)]) # A chain: b's entry must not be overwritten before it moves on
+    assert cache.get_many([(b, 1, 1), (c, 2, 2)]) == {b: ("A", None, 1), c: ("B", None, 1)}
+    assert cache.get_many([(a, 1, 1)]) == {}
+
+
+def test_entries_persist(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    path = str(tmp_path / "a.CR2")
+    with MetadataCache(db_path) as metadata_cache:
+        metadata_cache.put_many([(path, 1, 1, DATE, None, 3)])
+    with MetadataCache(db_path) as metadata_cache:
+        assert metadata_cache.get_many([(path, 1, 1)]) == {path: (DATE, None, 3)}
@@ -0,0 +1,143 @@
+"""Card offload: verified copies, resuming an interrupted offload, and streaming conversion of the copies."""
+
+import os
+import threading
+
+import pytest
+
+from photo_tool import core, offload
+from photo_tool.contentindex import content_hash
+from photo_tool.core import EXPORT_FOLDER_NAME, METHOD_PASSTHROUGH, SORT_ALPHABETICALLY, offload_files
+from photo_tool.manifest import TEMP_CLOCK_SLACK_SECONDS, temporary_path
+from photo_tool.offload import copy_file, plan_offload, remove_leftovers, split_copied
+
+# Long enough for a slow machine, short enough that a regression fails instead of hanging
+HANDOVER_TIMEOUT_SECONDS = 10
+
+
+@pytest.fixture
+def card(tmp_path):
+    folder = tmp_path / "card" / "DCIM"
+    folder.mkdir(parents=True)
+    for i, name in enumerate(("IMG_1.CR2", "IMG_1.JPG", "IMG_2.CR2", "IMG_3.CR2")):
+        path = folder / name
+        path.write_bytes(name.encode() * (i + 1))
+        os.utime(path, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000 + i))
+    return folder
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """Replaces the conversion with one that copies the RAW file; lists (RAW file, whether its data came along)."""
+    converted_files = []
+
+    def fake_convert(raw_file_path, output_files, options=None, record_stages=False, data=None):
+        converted_files.append((os.path.basename(raw_file_path), data is not None))
+        if data is None:
+            with open(raw_file_path, "rb") as f:
+                data = f.read()
+        outputs = []
+        for output_file in output_files:
+            with open(output_file, "wb") as f:
+                f.write(data)
+            outputs.append((output_file, len(data), ""))
+        return True, [], {"method": METHOD_PASSTHROUGH, "outputs": outputs, "output_file": outputs[0][0],
+                          "output_size": len(data)}
+
+    monkeypatch.setattr(core, "convert_raw_to_jpg", fake_convert)
+    return converted_files
+
+
+def _files(folder):
+    return sorted(str(path) for path in folder.iterdir() if path.is_file())
+
+
+@pytest.mark.parametrize("keep_data", [False, True])
+def test_copy_keeps_content_and_mtime(card, tmp_path, keep_data):
+    source = card / "IMG_2.CR2"
+    target = tmp_path / "Trip_03.CR2"
+    checksum, data = copy_file(str(source), str(target), keep_data=keep_data)
+    assert target.read_bytes() == source.read_bytes()
+    assert os.stat(target).st_mtime_ns == os.stat(source).st_mtime_ns
+    assert checksum == content_hash(str(source))
+    assert data == (source.read_bytes() if keep_data else None)
+    assert not os.path.exists(temporary_path(str(target)))
+
+
+def test_copy_that_does_not_verify_is_not_kept(card, tmp_path, monkeypatch):
+    monkeypatch.setattr(offload, "_file_checksum", lambda path: "blake2b:corrupted")
+    target = tmp_path / "Trip_01.CR2"
+    with pytest.raises(OSError, match="doesn't match"):
+        copy_file(str(card / "IMG_1.CR2"), str(target))
+    assert os.listdir(tmp_path) == ["card"]
+
+    # Without verification the copy isn't read back
+    copy_file(str(card / "IMG_1.CR2"), str(target), verify=False)
+    assert target.exists()
+
+
+def test_plan_puts_all_files_into_the_destination(card, tmp_path):
+    nested = card / "100CANON"
+    nested.mkdir()
+    (nested / "IMG_4.CR2").write_bytes(b"x")
+    destination = tmp_path / "photos"
+    plan = plan_offload(_files(card) + [str(nested / "IMG_4.CR2")], str(destination), "Trip", SORT_ALPHABETICALLY)
+    assert [(os.path.basename(source), os.path.relpath(target, destination)) for source, target in plan] == [
+        ("IMG_4.CR2", "Trip_01.CR2"), ("IMG_1.CR2", "Trip_02.CR2"), ("IMG_1.JPG", "Trip_03.JPG"),
+        ("IMG_2.CR2", "Trip_04.CR2"), ("IMG_3.CR2", "Trip_05.CR2")]
+
+
+def test_split_copied_only_trusts_same_size_and_mtime(card, tmp_path):
+    plan = plan_offload(_files(card), str(tmp_path), "Trip", SORT_ALPHABETICALLY)
+    (same, _), (other_size, _), (other_mtime, _), (missing, _) = plan
+    for source_path, target_path in plan[:3]:
+        copy_file(source_path, target_path)
+    with open(plan[1][1], "ab") as f:
+        f.write(b"more")
+    os.utime(plan[2][1], ns=(0, 0))
+    to_copy, copied = split_copied(plan)
+    assert [source_path for source_path, _ in copied] == [same]
+    assert [source_path for source_path, _ in to_copy] == [other_size, other_mtime, missing]
+
+
+def test_only_stale_temporary_files_are_removed(tmp_path):
+    stale = tmp_path / ".Trip_01.CR2.partial"
+    recent = tmp_path / ".Trip_02.CR2.partial"
+    other = tmp_path / "Trip_03.CR2"
+    for path in (stale, recent, other):
+        path.write_bytes(b"x")
+    old_ns = os.stat(stale).st_mtime_ns - 2 * TEMP_CLOCK_SLACK_SECONDS * 1_000_000_000
+    os.utime(stale, ns=(old_ns, old_ns))
+    assert remove_leftovers(str(tmp_path)) == 1
+    assert sorted(os.listdir(tmp_path)) == [recent.name, other.name]
+
+
+def test_offload_converts_raws_from_the_copied_bytes(card, tmp_path, converted):
+    destination = tmp_path / "photos"
+    result = offload_files(_files(card), str(destination), "Trip", SORT_ALPHABETICALLY)
+    assert result == (4, 0, 0, 3, 0, 0, str(destination / EXPORT_FOLDER_NAME))
+    assert sorted(converted) == [("Trip_01.CR2", True), ("Trip_03.CR2", True), ("Trip_04.CR2", True)]
+    assert (destination / "Trip_02.JPG").read_bytes() == (card / "IMG_1.JPG").read_bytes()
+    assert _files(card) == sorted(str(card / name) for name in ("IMG_1.CR2", "IMG_1.JPG", "IMG_2.CR2", "IMG_3.CR2"))
+
+    # Run again, e.g. after an interruption: nothing is copied or converted twice
+    converted.clear()
+    result = offload_files(_files(card), str(destination), "Trip", SORT_ALPHABETICALLY)
+    assert result == (0, 4, 0, 0, 3, 0, str(destination / EXPORT_FOLDER_NAME))
+    assert converted == []
+
+
+def test_first_raw_is_converted_while_the_others_are_copied(card, tmp_path, converted):
+    first_converted = threading.Event()
+    handed_over_in_time = []
+
+    def progress(stage, done, total):
+        if stage == "offload" and done == 2:
+            # The first RAW was handed over; hold the remaining copies until it is converted
+            handed_over_in_time.append(first_converted.wait(HANDOVER_TIMEOUT_SECONDS))
+        elif stage == "convert" and done == 1:
+            first_converted.set()
+
+    offload_files(_files(card), str(tmp_path / "photos"), "Trip", SORT_ALPHABETICALLY, progress=progress)
+    assert handed_over_in_time == [True]
+    assert len(converted) == 3
@@ -0,0 +1,89 @@
+"""Read-ahead: job order, and the byte cap held until the consumer releases each file."""
+
+from photo_tool.prefetch import Prefetcher
+
+
+def _make_files(folder, sizes):
+    paths = []
+    for i, size in enumerate(sizes):
+        path = folder / f"IMG_{i}.CR2"
+        path.write_bytes(bytes([i]) * size)
+        paths.append(str(path))
+    return paths
+
+
+def test_yields_jobs_in_order_with_their_content(tmp_path):
+    paths = _make_files(tmp_path, [10, 20, 30])
+    prefetcher = Prefetcher([(path, [path + ".jpg"]) for path in paths], max_files=2, max_bytes=1000)
+    results = []
+    for job in prefetcher:
+        results.append(job)
+        prefetcher.release(job[0])
+    assert [(path, outputs) for path, outputs, _ in results] == [(path, [path + ".jpg"]) for path in paths]
+    assert [len(data) for _, _, data in results] == [10, 20, 30]
+    assert prefetcher.buffered_bytes == 0
+
+
+def test_jobs_with_data_are_passed_on(tmp_path):
+    job = (str(tmp_path / "copied.CR2"), ["out.jpg"], b"already read")
+    assert list(Prefetcher([job])) == [job]
+
+
+def test_byte_cap_holds_until_release(tmp_path):
+    paths = _make_files(tmp_path, [40] * 5)
+    prefetcher = Prefetcher([(path, []) for path in paths], max_files=4, max_bytes=100)
+    jobs = iter(prefetcher)
+
+    held = [next(jobs), next(jobs)] # 80 bytes, not released yet
+    assert prefetcher.buffered_bytes <= 100
+    # A third file would go over the cap, so nothing more is read until something is released
+    assert next(jobs) is None
+    assert prefetcher.buffered_bytes == 80
+
+    prefetcher.release(held[0][0])
+    third = next(jobs)
+    assert third[0] == paths[2]
+    assert prefetcher.buffered_bytes <= 100
+    for path in (held[1][0], third[0]):
+        prefetcher.release(path)
+    rest = []
+    for job in jobs:
+        assert job is not None # Everything else was released
+        rest.append(job[0])
+        prefetcher.release(job[0])
+    assert rest == paths[3:]
+    assert prefetcher.buffered_bytes == 0
+
+
+def test_file_larger_than_cap_is_read_when_nothing_is_held(tmp_path):
+    paths = _make_files(tmp_path, [10, 500, 10])
+    prefetcher = Prefetcher([(path, []) for path in paths], max_files=4, max_bytes=100)
+    jobs = iter(prefetcher)
+    first = next(jobs)
+    assert next(jobs) is None # The large file waits for the small one to be released
+    prefetcher.release(first[0])
+    second = next(jobs)
+    assert len(second[2]) == 500
+    prefetcher.release(second[0])
+    assert next(jobs)[0] == paths[2]
+
+
+def test_unreadable_file_yields_no_data(tmp_path):
+    missing = str(tmp_path / "gone.CR2")
+    assert list(Prefetcher([(missing, [])], size_of=lambda path: 10)) == [(missing, [], None)]
+
+
+def test_does_not_wait_for_more_jobs_when_none_are_ready(tmp_path):
+    paths = _make_files(tmp_path, [10, 10])
+    handed_on = []
+
+    def jobs():
+        yield paths[0], []
+        yield None # e.g. the next file is still being renamed
+        assert handed_on == [paths[0]]
+        yield None
+        yield paths[1], []
+
+    for job in Prefetcher(jobs(), max_files=4):
+        handed_on.append(job and job[0])
+    assert handed_on == [paths[0], None, paths[1]]
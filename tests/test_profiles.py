@@ -0,0 +1,83 @@
+"""Export profiles: loading, validation, output sizes and draft-mode decode sizes."""
+
+import io
+import json
+
+import pytest
+
+from photo_tool.instrument import NULL_RECORDER
+from photo_tool.profiles import (BUILTIN_PROFILES, PROFILES_FILENAME, ExportProfile, check_profiles, draft_size,
+                                 load_profiles, save_jpeg)
+
+PREVIEW_SIZE = (6000, 4000)
+
+
+def _write_profiles(config_dir, data):
+    config_dir.mkdir(exist_ok=True)
+    (config_dir / PROFILES_FILENAME).write_text(json.dumps(data), encoding="utf-8")
+
+
+def test_builtin_profiles_without_profile_file(tmp_path):
+    assert load_profiles(str(tmp_path)) == BUILTIN_PROFILES
+
+
+def test_user_profiles_are_added(tmp_path):
+    _write_profiles(tmp_path, {"print": {"max_edge": 3000, "quality": 92}, "web": {"max_edge": 1600}})
+    profiles = load_profiles(str(tmp_path))
+    assert set(profiles) == set(BUILTIN_PROFILES) | {"print"}
+    assert profiles["print"].settings() == {"max_edge": 3000, "quality": 92, "progressive": False, "optimize": True,
+                                            "subfolder": "print"}
+    assert profiles["web"].max_edge == 1600 # User profiles replace built-in ones of the same name
+
+
+@pytest.mark.parametrize("data", [
+    {"print": {"max_edge": 0}},
+    {"print": {"max_edge": "big"}},
+    {"print": {"quality": 101}},
+    {"print": {"subfolder": "../outside"}},
+    {"print": {"sharpen": True}},
+    {"print": 3000},
+    ["print"],
+], ids=["zero-edge", "text-edge", "quality", "subfolder", "unknown-setting", "not-an-object", "not-named"])
+def test_invalid_profiles_are_rejected(tmp_path, data):
+    _write_profiles(tmp_path, data)
+    with pytest.raises(ValueError):
+        load_profiles(str(tmp_path))
+
+
+def test_unreadable_profile_file_is_rejected(tmp_path):
+    (tmp_path / PROFILES_FILENAME).write_text("{not json", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_profiles(str(tmp_path))
+
+
+def test_check_profiles():
+    check_profiles([BUILTIN_PROFILES["full"], BUILTIN_PROFILES["web"]])
+    with pytest.raises(ValueError):
+        check_profiles([])
+    with pytest.raises(ValueError): # Both write to the export folder itself
+        check_profiles([BUILTIN_PROFILES["full"], BUILTIN_PROFILES["fast"]])
+
+
+def test_target_size_keeps_aspect_and_never_enlarges():
+    assert ExportProfile("web", max_edge=2048).target_size(PREVIEW_SIZE) == (2048, 1365)
+    assert ExportProfile("web", max_edge=2048).target_size((4000, 6000)) == (1365, 2048)
+    assert ExportProfile("web", max_edge=8000).target_size(PREVIEW_SIZE) == PREVIEW_SIZE
+    assert ExportProfile("full").target_size(PREVIEW_SIZE) == PREVIEW_SIZE
+
+
+def test_draft_size_only_when_every_output_is_at_most_half_size():
+    web, proof = BUILTIN_PROFILES["web"], BUILTIN_PROFILES["proof"]
+    assert draft_size(PREVIEW_SIZE, [proof]) == (400, 267)
+    assert draft_size(PREVIEW_SIZE, [web, proof]) == (2048, 1365) # The largest output decides
+    assert draft_size(PREVIEW_SIZE, [BUILTIN_PROFILES["full"], proof]) is None
+    assert draft_size((3000, 2000), [web]) is None # 2048 px is more than half of 3000
+
+
+def test_save_jpeg_resizes_and_encodes(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    output_file = tmp_path / "a.jpg"
+    save_jpeg(Image.new("RGB", (600, 400)), ExportProfile("small", max_edge=300, quality=70), str(output_file),
+              NULL_RECORDER)
+    with Image.open(io.BytesIO(output_file.read_bytes())) as img:
+        assert (img.format, img.size) == ("JPEG", (300, 200))
@@ -0,0 +1,114 @@
+"""Hot-folder watch: the settle-time debouncer and the arrival renaming."""
+
+import os
+
+from photo_tool import watch
+from photo_tool.discovery import FileEntry
+from photo_tool.watch import WatchStats, _Debouncer, _RenameNumbering
+
+
+def _write(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_file_settles_after_quiet_period(tmp_path):
+    path = str(tmp_path / "IMG_1.CR2")
+    _write(path, b"raw data")
+    debouncer = _Debouncer(2.0)
+    debouncer.add(path, 10.0)
+    assert debouncer.settled(10.0) == [] # First look: size and mtime noted
+    assert debouncer.settled(11.9) == []
+    (entry, first_seen), = debouncer.settled(12.0)
+    assert (entry.path, entry.size, first_seen) == (path, 8, 10.0)
+    assert len(debouncer) == 0
+
+
+def test_growing_file_waits_until_it_stops_changing(tmp_path):
+    path = str(tmp_path / "IMG_1.CR2")
+    _write(path, b"part")
+    debouncer = _Debouncer(2.0)
+    debouncer.add(path, 0.0)
+    debouncer.settled(0.0)
+    _write(path, b"part and more") # Still being copied at the deadline
+    assert debouncer.settled(2.0) == []
+    (entry, _), = debouncer.settled(4.0)
+    assert entry.size == 13
+
+
+def test_new_event_restarts_quiet_period(tmp_path):
+    path = str(tmp_path / "IMG_1.CR2")
+    _write(path, b"raw data")
+    debouncer = _Debouncer(2.0)
+    debouncer.add(path, 0.0)
+    debouncer.settled(0.0)
+    debouncer.add(path, 1.5) # e.g. closed after writing
+    assert debouncer.settled(2.0) == []
+    assert [entry.path for entry, _ in debouncer.settled(3.5)] == [path]
+
+
+def test_files_are_only_stated_on_arrival_and_at_their_deadline(tmp_path, monkeypatch):
+    path = str(tmp_path / "IMG_1.CR2")
+    _write(path, b"raw data")
+    stat_calls = []
+    real_stat = os.stat
+
+    def counting_stat(stat_path):
+        stat_calls.append(stat_path)
+        return real_stat(stat_path)
+
+    monkeypatch.setattr(watch.os, "stat", counting_stat)
+    debouncer = _Debouncer(2.0)
+    debouncer.add(path, 0.0)
+    for tick in range(20): # Every 0.1 s, like the watch loop
+        debouncer.settled(tick / 10)
+    assert len(stat_calls) == 1
+    assert len(debouncer.settled(2.0)) == 1
+    assert len(stat_calls) == 2
+
+
+def test_empty_and_vanished_files_are_not_handed_on(tmp_path):
+    empty = str(tmp_path / "empty.CR2")
+    gone = str(tmp_path / "gone.CR2")
+    _write(empty, b"")
+    _write(gone, b"x")
+    debouncer = _Debouncer(1.0)
+    debouncer.add(empty, 0.0)
+    debouncer.add(gone, 0.0)
+    debouncer.settled(0.0)
+    os.remove(gone)
+    assert debouncer.settled(5.0) == []
+    assert list(debouncer.pending) == [empty] # Kept until something is written to it
+
+
+def test_settled_files_come_in_arrival_order(tmp_path):
+    debouncer = _Debouncer(1.0)
+    for name, arrival in (("b.CR2", 0.0), ("a.CR2", 0.5), ("c.CR2", 0.0)):
+        path = str(tmp_path / name)
+        _write(path, b"x")
+        debouncer.add(path, arrival)
+    debouncer.settled(0.5)
+    assert [entry.name for entry, _ in debouncer.settled(10.0)] == ["b.CR2", "c.CR2", "a.CR2"]
+
+
+def test_renaming_continues_numbering_and_keeps_pairs_together(tmp_path):
+    _write(str(tmp_path / "Shoot_0007.CR2"), b"x")
+    numbering = _RenameNumbering(str(tmp_path), "Shoot", recursive=False)
+    renamed = []
+    for name in ("IMG_1.CR2", "IMG_1.JPG", "IMG_2.CR2"):
+        path = str(tmp_path / name)
+        _write(path, b"x")
+        renamed.append(numbering.rename(FileEntry.from_path(path), lambda message, detail=False: None).name)
+    assert renamed == ["Shoot_0008.CR2", "Shoot_0008.JPG", "Shoot_0009.CR2"]
+
+
+def test_latency_percentiles():
+    stats = WatchStats()
+    assert stats.latency_percentile(50) is None
+    stats.latencies.extend(float(i) for i in range(1, 101))
+    assert stats.latency_percentile(50) == 51.0
+    assert stats.latency_percentile(95) == 96.0
+    stats.set_queue_depth(5)
+    stats.set_queue_depth(2)
+    assert (stats.queue_depth, stats.max_queue_depth) == (2, 5)
+    assert "p95 96.0 s" in stats.summary_line()